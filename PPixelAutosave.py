@@ -0,0 +1,480 @@
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from weakref import WeakKeyDictionary
+from PPixelDocument import PPixelDocument
+from PPixelFrames import Timeline
+from PPixelLayers import LayerStack
+from PPixelPNG import read_chunks, write_chunk
+
+# Autosave and crash recovery. The Tk thread only takes a snapshot, which is a clone of
+# every layer document, so it shares the tiles and costs about a dictionary copy. A
+# worker thread writes the snapshot to the recovery file. A tile that was written since
+# the last snapshot is a new array, so comparing the tiles by identity finds the changes,
+# and only those are appended to the file.
+#
+# The recovery file is a signature and chunks like the PNG ones, with a checksum:
+#   SNAP  JSON of the frames, layers and palettes, and 'full' if it starts a new file.
+#   TILE  document id, tile x, tile y and typecode, then the compressed palette indexes.
+#   LINK  document id, tile x, tile y, then the same of a tile that it's a copy of.
+#         Frames share tiles, a shared tile is written once and linked after that.
+#   DROP  document id, tile x, tile y of a tile that doesn't exist anymore.
+#   DONE  the end of a snapshot. A snapshot without it, like after a crash, is ignored.
+
+RECOVERY_SIGNATURE = b'PPPRECOVERY\n'
+
+# Tiles are stored in little endian.
+SWAP_BYTES = sys.byteorder == 'big'
+
+# The default recovery file, in the home directory.
+RECOVERY_PATH = os.path.join(os.path.expanduser('~'), '.ppp-recovery')
+
+
+def tile_bytes(tile):
+    """Return the palette indexes of a tile as little endian bytes.
+
+    Args:
+        tile (array): Palette indexes.
+
+    Returns:
+        bytes: The indexes.
+    """
+    if SWAP_BYTES and tile.itemsize > 1:
+        tile = array(tile.typecode, tile)
+        tile.byteswap()
+    return tile.tobytes()
+
+
+def bytes_tile(typecode, data):
+    """Convert little endian bytes back to the palette indexes of a tile.
+
+    Args:
+        typecode (str): Item type of the tile.
+        data (bytes): The indexes.
+
+    Returns:
+        array: Palette indexes.
+    """
+    tile = array(typecode, data)
+    if SWAP_BYTES and tile.itemsize > 1:
+        tile.byteswap()
+    return tile
+
+
+class Snapshot():
+    """
+    The state of a timeline at a moment, taken in the Tk thread. The documents are
+    clones, so they don't change when the timeline is edited further.
+    """
+    def __init__(self, timeline, ids):
+        """Take a snapshot.
+
+        Args:
+            timeline (Timeline): The frames.
+            ids (function): Returns the id of a document, which stays the same between snapshots.
+        """
+        self.w, self.h = timeline.w, timeline.h
+        self.docs = {}
+        self.structure = {'w': timeline.w, 'h': timeline.h, 'fps': timeline.fps,
+                          'current': timeline.current, 'frames': []}
+        for stack in timeline.frames:
+            layers = []
+            for layer in stack.layers:
+                doc_id = ids(layer.doc)
+                self.docs[doc_id] = layer.doc.clone()
+                layers.append({'doc': doc_id, 'name': layer.name, 'visible': layer.visible,
+                               'opacity': layer.opacity})
+            self.structure['frames'].append({'current': stack.current, 'layers': layers})
+
+    def empty(self):
+        """Returns True if nothing is painted."""
+        return not any(doc.tiles for doc in self.docs.values())
+
+
+class Autosave():
+    """
+    Saves the timeline of a canvas to the recovery file in every interval. The first
+    snapshot is written as a new file, and the later ones only append the changed tiles.
+    When the appended part gets bigger than the full snapshot was, a new file is written.
+    """
+    def __init__(self, canvas, path=RECOVERY_PATH, interval=30):
+        """Create the service, it's started with start.
+
+        Args:
+            canvas (PPixelPaintingCanvas): The canvas, its timeline is saved.
+            path (str, optional): The recovery file.
+            interval (int, optional): Seconds between two snapshots, 0 for not saving.
+        """
+        self.canvas = canvas
+        self.path = path
+        self.interval = interval
+        self.after_id = None
+
+        # Ids of the documents. Removed documents are forgotten.
+        self.ids = WeakKeyDictionary()
+        self.next_id = 1
+
+        # The snapshot that waits for the worker, and True if the file is removed instead.
+        # Only the newest one is kept, if the worker is slow the older one is skipped.
+        self.pending = None
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        # The last error of the worker, like a full disk. Shown by the editor if it wants.
+        self.error = None
+
+    def doc_id(self, doc):
+        """Return the id of a document, giving it one if it's new.
+
+        Args:
+            doc (PPixelDocument): A layer document.
+
+        Returns:
+            int: The id.
+        """
+        if doc not in self.ids:
+            self.ids[doc] = self.next_id
+            self.next_id += 1
+        return self.ids[doc]
+
+    def start(self):
+        """Start the worker thread and the timer."""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='autosave', daemon=True)
+        self.thread.start()
+        self.schedule()
+
+    def stop(self, flush=True):
+        """Stop the timer and the worker thread.
+
+        Args:
+            flush (bool, optional): If True, a last snapshot is taken and written before
+            stopping, like when the window is closed.
+        """
+        if not self.running:
+            return
+        if self.after_id is not None:
+            self.canvas.after_cancel(self.after_id)
+            self.after_id = None
+        if flush:
+            self.save()
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    def set_interval(self, interval):
+        """Change how often the timeline is saved.
+
+        Args:
+            interval (int): Seconds between two snapshots, 0 for not saving.
+        """
+        self.interval = interval
+        if self.after_id is not None:
+            self.canvas.after_cancel(self.after_id)
+            self.after_id = None
+        self.schedule()
+
+    def schedule(self):
+        """Schedule the next snapshot."""
+        if self.running and self.interval:
+            self.after_id = self.canvas.after(int(self.interval*1000), self.tick)
+
+    def tick(self):
+        """Take a snapshot and schedule the next one."""
+        self.after_id = None
+        self.save()
+        self.schedule()
+
+    def save(self, clear=False):
+        """Take a snapshot of the canvas, and give it to the worker. Only cloning is
+        done here, the time is recorded to the stats of the canvas as 'autosave'.
+        A stroke that is being painted is saved as far as it's written.
+
+        Args:
+            clear (bool, optional): If True, the recovery file is removed instead,
+            and the snapshot is only compared with the next one.
+        """
+        start = time.perf_counter()
+        snapshot = Snapshot(self.canvas.timeline, self.doc_id)
+        with self.condition:
+            self.pending = (snapshot, clear)
+            self.condition.notify()
+        self.canvas.stats.record('autosave', time.perf_counter() - start)
+
+    def clear(self):
+        """Remove the recovery file, like after the work was saved. The next change
+        starts a new file.
+        """
+        self.save(clear=True)
+
+    def run(self):
+        """The worker thread. Writes the snapshots until the service is stopped."""
+        previous = None
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                job, self.pending = self.pending, None
+                if job is None:
+                    return
+
+            snapshot, clear = job
+            try:
+                if clear:
+                    # Saved work, the snapshot is kept only for comparing.
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                    previous = (snapshot, None, 0)
+                else:
+                    previous = self.write(snapshot, previous)
+                self.error = None
+            except OSError as error:
+                self.error = error
+                previous = None
+
+    def write(self, snapshot, previous):
+        """Write a snapshot, only what has changed since the previous one.
+        Nothing is written while nothing is painted or nothing has changed.
+
+        Args:
+            snapshot (Snapshot): The new snapshot.
+            previous (tuple): The previous snapshot, the size of its full file and the amount
+            of bytes that were appended after it. The size is None if the file was removed.
+            None if there is no previous snapshot.
+
+        Returns:
+            tuple: The new value of previous.
+        """
+        if previous is None:
+            return (snapshot, None, 0) if snapshot.empty() else self.write_full(snapshot)
+
+        old, full_size, appended = previous
+        if not set(old.docs) & set(snapshot.docs) or (old.w, old.h) != (snapshot.w, snapshot.h):
+            if full_size is None and snapshot.empty():
+                return (snapshot, None, 0)
+            return self.write_full(snapshot)
+
+        # Unchanged tiles are already in the file, and can be linked.
+        changes, where = [], {}
+        for doc_id, doc in snapshot.docs.items():
+            old_tiles = old.docs[doc_id].tiles if doc_id in old.docs else {}
+            for key, tile in doc.tiles.items():
+                if old_tiles.get(key) is not tile:
+                    changes.append((doc_id, key, tile))
+                else:
+                    where[id(tile)] = (doc_id, key)
+            for key in old_tiles.keys() - doc.tiles.keys():
+                changes.append((doc_id, key, None))
+
+        if not changes and self.structure(snapshot) == self.structure(old):
+            return (snapshot, full_size, appended)
+        if full_size is None or appended > full_size or not os.path.exists(self.path):
+            return self.write_full(snapshot)
+
+        with open(self.path, 'ab') as file:
+            size = self.write_snapshot(file, snapshot, changes, where, full=False)
+            file.flush()
+            os.fsync(file.fileno())
+        return (snapshot, full_size, appended + size)
+
+    def write_full(self, snapshot):
+        """Write a snapshot as a new file. The old file is replaced only after the new
+        one is complete.
+
+        Args:
+            snapshot (Snapshot): The snapshot.
+
+        Returns:
+            tuple: The new value of previous, for write.
+        """
+        changes = [(doc_id, key, tile) for doc_id, doc in snapshot.docs.items() for key, tile in doc.tiles.items()]
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as file:
+            file.write(RECOVERY_SIGNATURE)
+            size = self.write_snapshot(file, snapshot, changes, {}, full=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path)
+        return (snapshot, size, 0)
+
+    def structure(self, snapshot):
+        """Return the structure of a snapshot with the palettes, as it's written.
+
+        Args:
+            snapshot (Snapshot): The snapshot.
+
+        Returns:
+            dict: JSON compatible structure.
+        """
+        structure = dict(snapshot.structure)
+        structure['palettes'] = {str(doc_id): doc.palette for doc_id, doc in snapshot.docs.items()}
+        structure['typecodes'] = {str(doc_id): doc.typecode for doc_id, doc in snapshot.docs.items()}
+        return structure
+
+    def write_snapshot(self, file, snapshot, changes, where, full):
+        """Write the chunks of a snapshot.
+
+        Args:
+            file (binary file): Output.
+            snapshot (Snapshot): The snapshot.
+            changes (list): (document id, tile key, tile) tuples, tile is None if it was removed.
+            where (dict): (document id, tile key) of the tiles that are in the file, by
+            id of the tile. Changed in place.
+            full (bool): True if the snapshot starts a new file.
+
+        Returns:
+            int: Amount of bytes written.
+        """
+        start = file.tell()
+        structure = self.structure(snapshot)
+        structure['full'] = full
+        write_chunk(file, b'SNAP', json.dumps(structure).encode())
+
+        for doc_id, (tx, ty), tile in changes:
+            if tile is None:
+                write_chunk(file, b'DROP', struct.pack('>Iii', doc_id, tx, ty))
+                continue
+            if id(tile) in where:
+                source_id, (sx, sy) = where[id(tile)]
+                write_chunk(file, b'LINK', struct.pack('>IiiIii', doc_id, tx, ty, source_id, sx, sy))
+            else:
+                write_chunk(file, b'TILE', struct.pack('>Iiic', doc_id, tx, ty, tile.typecode.encode())
+                            + zlib.compress(tile_bytes(tile), 1))
+            where[id(tile)] = (doc_id, (tx, ty))
+            # Letting the Tk thread run between the tiles.
+            time.sleep(0)
+
+        write_chunk(file, b'DONE', b'')
+        return file.tell() - start
+
+
+def read_recovery(path=RECOVERY_PATH):
+    """Read the last complete snapshot of a recovery file.
+
+    Args:
+        path (str, optional): The recovery file.
+
+    Raises:
+        OSError: If the file can't be read.
+        ValueError: If the file is not a recovery file or has no complete snapshot.
+
+    Returns:
+        Timeline: The frames of the snapshot.
+    """
+    docs = {}
+    structure = None
+    with open(path, 'rb') as file:
+        if file.read(len(RECOVERY_SIGNATURE)) != RECOVERY_SIGNATURE:
+            raise ValueError('Not a recovery file!')
+
+        # Changes of the snapshot that is being read, applied when it's done.
+        current, tiles = None, []
+        try:
+            for kind, data in read_chunks(file):
+                if kind == b'SNAP':
+                    current, tiles = json.loads(data), []
+                elif kind == b'TILE' and current is not None:
+                    doc_id, tx, ty, typecode = struct.unpack('>Iiic', data[:13])
+                    tiles.append((doc_id, (tx, ty), bytes_tile(typecode.decode(), zlib.decompress(data[13:]))))
+                elif kind == b'LINK' and current is not None:
+                    doc_id, tx, ty, source_id, sx, sy = struct.unpack('>IiiIii', data)
+                    tiles.append((doc_id, (tx, ty), (source_id, (sx, sy))))
+                elif kind == b'DROP' and current is not None:
+                    doc_id, tx, ty = struct.unpack('>Iii', data)
+                    tiles.append((doc_id, (tx, ty), None))
+                elif kind == b'DONE' and current is not None:
+                    apply_snapshot(docs, current, tiles)
+                    structure, current = current, None
+        except (ValueError, zlib.error, struct.error):
+            # The end of the file was being written, the last complete snapshot is used.
+            pass
+
+    if structure is None:
+        raise ValueError('The recovery file has no complete snapshot!')
+    return build_timeline(docs, structure)
+
+
+def apply_snapshot(docs, structure, tiles):
+    """Apply a snapshot of a recovery file to the documents.
+
+    Args:
+        docs (dict): PPixelDocument objects by id, changed in place.
+        structure (dict): The SNAP chunk.
+        tiles (list): (document id, tile key, tile) tuples, tile is None if it was removed,
+        or the document id and the tile key of the tile it's linked to.
+    """
+    if structure['full']:
+        docs.clear()
+    w, h = structure['w'], structure['h']
+    for doc_id, palette in structure['palettes'].items():
+        doc = docs.get(int(doc_id))
+        if doc is None or (doc.w, doc.h) != (w, h):
+            doc = docs[int(doc_id)] = PPixelDocument(w, h)
+        doc.palette = list(palette)
+        doc.color_index = {color: index for index, color in enumerate(palette)}
+        doc.typecode = structure['typecodes'][doc_id]
+
+    for doc_id, key, tile in tiles:
+        if tile is None:
+            docs[doc_id].tiles.pop(key, None)
+        elif isinstance(tile, tuple):
+            source_id, source_key = tile
+            docs[doc_id].tiles[key] = docs[source_id].tiles[source_key]
+        else:
+            docs[doc_id].tiles[key] = tile
+
+    # Removed documents, and tiles that are older than a change of the typecode.
+    for doc_id in list(docs):
+        if str(doc_id) not in structure['palettes']:
+            del docs[doc_id]
+            continue
+        doc = docs[doc_id]
+        for key, tile in doc.tiles.items():
+            if tile.typecode != doc.typecode:
+                doc.tiles[key] = array(doc.typecode, tile)
+
+
+def build_timeline(docs, structure):
+    """Make the frames and the layers of a snapshot.
+
+    Args:
+        docs (dict): PPixelDocument objects by id.
+        structure (dict): The SNAP chunk of the snapshot.
+
+    Returns:
+        Timeline: The frames.
+    """
+    # Linked tiles are shared by the documents, so they are copied before writing.
+    counts = {}
+    for doc in docs.values():
+        for tile in doc.tiles.values():
+            counts[id(tile)] = counts.get(id(tile), 0) + 1
+    for doc in docs.values():
+        doc.shared = {key for key, tile in doc.tiles.items() if counts[id(tile)] > 1}
+
+    stacks = []
+    for frame in structure['frames']:
+        layers = frame['layers']
+        stack = LayerStack(docs[layers[0]['doc']])
+        for info in layers[1:]:
+            stack.add_layer(docs[info['doc']])
+        for layer, info in zip(stack.layers, layers):
+            layer.name, layer.visible, layer.opacity = info['name'], info['visible'], info['opacity']
+        stack.current = frame['current']
+        stack.rebuild(notify=False)
+        stacks.append(stack)
+
+    timeline = Timeline(stacks[0], structure['fps'])
+    for stack in stacks[1:]:
+        timeline.insert_frame(len(timeline.frames), stack)
+    timeline.current = structure['current']
+    return timeline
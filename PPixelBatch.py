@@ -0,0 +1,217 @@
+import argparse
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PPixelColor import EMPTY, hex_to_rgba
+from PPixelDocument import ANCHORS, anchor_offset
+from PPixelFill import scanline_fill
+from PPixelPNG import read_png, write_png
+
+# Batch mode, for running operations on many PNG files without a display.
+# Nothing in here imports tkinter. Files are processed in parallel by a process pool.
+#
+# Operations are given as 'name:arguments' and are run in order, for example:
+#   fill:0,0,#ff0000        fill from 0, 0 with red, an optional 4th argument is the tolerance
+#   recolor:#ff0000,#00ff00 change every red painting pixel to green
+#   resize:64x32            change the canvas size, keeping the top left, or
+#   resize:64x32,center     keeping the content at an anchor, like the tkinter anchors
+#   export:out/{stem}.png   save the current state, {name} and {stem} are replaced
+
+
+def parse_color(text):
+    """Parse a color argument, 'empty' or 'none' is the empty color.
+
+    Args:
+        text (str): '#rrggbb', 'rrggbb' or 'empty'.
+
+    Raises:
+        ValueError: If it is not a color.
+
+    Returns:
+        int: Packed color.
+    """
+    if text.lower() in ('empty', 'none'):
+        return EMPTY
+    digits = text.lstrip('#')
+    if len(digits) not in (3, 6) or any(d not in '0123456789abcdefABCDEF' for d in digits):
+        raise ValueError(f'Not a color: {text}')
+    return hex_to_rgba('#' + digits)
+
+
+def parse_op(text):
+    """Parse an operation.
+
+    Args:
+        text (str): 'name:arguments'
+
+    Raises:
+        ValueError: If the operation or its arguments are wrong.
+
+    Returns:
+        tuple: Name and parsed arguments.
+    """
+    name, _, args = text.partition(':')
+    name = name.lower()
+
+    if name == 'fill':
+        parts = args.split(',')
+        if len(parts) not in (3, 4):
+            raise ValueError('fill needs x,y,color[,tolerance]')
+        tolerance = int(parts[3]) if len(parts) == 4 else 0
+        return name, (int(parts[0]), int(parts[1]), parse_color(parts[2]), tolerance)
+
+    if name == 'recolor':
+        parts = args.split(',')
+        if len(parts) != 2:
+            raise ValueError('recolor needs from,to')
+        return name, (parse_color(parts[0]), parse_color(parts[1]))
+
+    if name == 'resize':
+        size, _, anchor = args.lower().partition(',')
+        w, _, h = size.partition('x')
+        w, h = int(w), int(h)
+        if w < 1 or h < 1:
+            raise ValueError('resize needs a positive width and height')
+        anchor = anchor or 'nw'
+        if anchor not in ANCHORS:
+            raise ValueError(f'Unknown anchor: {anchor}')
+        return name, (w, h, anchor)
+
+    if name == 'export':
+        if not args:
+            raise ValueError('export needs a path')
+        # Only {name} and {stem} are replaced, anything else is found here, not in the workers.
+        try:
+            args.format(name='', stem='')
+        except (KeyError, IndexError, AttributeError, ValueError):
+            raise ValueError('export path may only use {name} and {stem}')
+        return name, (args,)
+
+    raise ValueError(f'Unknown operation: {name}')
+
+
+def run_op(doc, op, path):
+    """Run an operation on a document.
+
+    Args:
+        doc (PPixelDocument): The document.
+        op (tuple): Parsed operation.
+        path (str): Name of the file that the document was loaded from.
+
+    Raises:
+        ValueError: If the fill starts outside of the document.
+
+    Returns:
+        PPixelDocument: The document.
+    """
+    name, args = op
+
+    if name == 'fill':
+        x, y, color, tolerance = args
+        # The files can have different sizes, so this is only known here.
+        if not (0 <= x < doc.w and 0 <= y < doc.h):
+            raise ValueError(f'fill starts at {x},{y}, outside of the {doc.w}x{doc.h} image')
+        sample = doc.get if tolerance else doc.get_index
+        spans = scanline_fill(doc.w, doc.h, x, y, sample, tolerance=tolerance)
+        doc.set_spans(spans, color)
+
+    elif name == 'recolor':
+        doc.replace_color(*args)
+
+    elif name == 'resize':
+        w, h, anchor = args
+        doc.resize(w, h, *anchor_offset(doc.w, doc.h, w, h, anchor))
+
+    elif name == 'export':
+        filename = os.path.basename(path)
+        target = args[0].format(name=filename, stem=os.path.splitext(filename)[0])
+        folder = os.path.dirname(target)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        write_png(target, doc)
+
+    return doc
+
+
+def process_file(path, ops):
+    """Load a file and run the operations on it. Runs in a worker process.
+
+    Args:
+        path (str): PNG file.
+        ops (list): Parsed operations.
+
+    Returns:
+        tuple: path, True if succeeded, time in seconds and an error message.
+    """
+    start = time.perf_counter()
+    try:
+        doc = read_png(path)
+        for op in ops:
+            doc = run_op(doc, op, path)
+    except (OSError, ValueError, IndexError, zlib.error) as error:
+        return path, False, time.perf_counter() - start, str(error)
+    except Exception as error:
+        # Anything else fails only this file too, the other files go on.
+        return path, False, time.perf_counter() - start, f'{type(error).__name__}: {error}'
+    return path, True, time.perf_counter() - start, ''
+
+
+def run_batch(paths, ops, jobs=None, report=print):
+    """Process files in parallel, reporting each one as it finishes.
+
+    Args:
+        paths (list): PNG files.
+        ops (list): Parsed operations.
+        jobs (int, optional): Number of worker processes, the number of cores if not given.
+        report (function, optional): Called with a line of text for each file and the summary.
+
+    Returns:
+        list: Results of process_file.
+    """
+    start = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(process_file, path, ops) for path in paths]
+        for future in as_completed(futures):
+            path, ok, seconds, message = result = future.result()
+            results.append(result)
+            status = 'ok' if ok else f'FAILED: {message}'
+            report(f'{seconds*1000:9.1f} ms  {path}  {status}')
+
+    wall = time.perf_counter() - start
+    times = sorted(result[2] for result in results)
+    failed = sum(1 for result in results if not result[1])
+
+    if times:
+        report(f'{len(results)} files, {failed} failed, {wall:.2f} s wall, '
+               f'{sum(times):.2f} s in workers, '
+               f'{times[len(times)//2]*1000:.1f} ms median, {times[-1]*1000:.1f} ms slowest')
+    return results
+
+
+def main(argv):
+    """Command line entry of the batch mode.
+
+    Args:
+        argv (list): Arguments, without the program name.
+
+    Returns:
+        int: Exit status, 1 if any file failed.
+    """
+    parser = argparse.ArgumentParser(prog='main.py batch', description='Run operations on PNG files, without a display.')
+    parser.add_argument('files', nargs='+', help='PNG files')
+    parser.add_argument('-o', '--op', action='append', default=[], dest='ops',
+                        help='operation, can be given many times: fill:x,y,color[,tolerance], '
+                             'recolor:from,to, resize:WxH[,anchor], export:path ({name} and {stem} are replaced)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    try:
+        ops = [parse_op(op) for op in args.ops]
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = run_batch(args.files, ops, args.jobs)
+    return 1 if any(not result[1] for result in results) else 0
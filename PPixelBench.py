@@ -0,0 +1,383 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from PPixelColor import hex_to_rgba
+from PPixelDocument import PPixelDocument
+from PPixelFill import scanline_fill
+from PPixelStats import percentile
+
+# Benchmarks of the canvas tools. Synthetic or recorded input is replayed against a
+# PPixelPaintingCanvas, and for every scenario the latency of each event, the total
+# time, the amount of canvas items and the peak Python memory are measured.
+#
+#   python PPixelBench.py --out new.json                 run everything, needs a display
+#   python PPixelBench.py --headless --out new.json      only the parts without tkinter
+#   python PPixelBench.py --replay stroke.json           replay a recorded stream too
+#   python PPixelBench.py --compare old.json new.json    compare two runs
+#
+# A recorded stream is a JSON list of [kind, x, y] where kind is 'press', 'motion',
+# 'release' or 'click', and x, y are window coordinates of the canvas.
+#
+# tracemalloc slows down allocations a lot, so every scenario is run twice: once for
+# the times, and once more with tracemalloc for the peak memory (unless --no-memory).
+
+
+def summarize(latencies, wall, peak, items=None):
+    """Make the result of a scenario.
+
+    Args:
+        latencies (list): Seconds for every event.
+        wall (float): Total seconds of the scenario.
+        peak (int): Peak memory in bytes.
+        items (int, optional): Number of canvas items at the end.
+
+    Returns:
+        dict: Times are in milliseconds.
+    """
+    result = {
+        'events': len(latencies),
+        'p50_ms': percentile(latencies, 50)*1000,
+        'p90_ms': percentile(latencies, 90)*1000,
+        'p99_ms': percentile(latencies, 99)*1000,
+        'max_ms': max(latencies, default=0.0)*1000,
+        'wall_ms': wall*1000,
+        'peak_kb': peak / 1024,
+    }
+    if items is not None:
+        result['items'] = items
+    return result
+
+
+class SyntheticEvent():
+    """
+    Stands for a tkinter input event. The canvas tools only use x and y.
+    """
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+        self.delta = 0
+        self.num = 1
+
+
+def fill_shape(doc, shape):
+    """Paint a pattern on a document, to fill over it later.
+
+    Args:
+        doc (PPixelDocument): The document.
+        shape (str): 'open', 'stripes', 'checker' or 'maze'.
+    """
+    wall = hex_to_rgba('#202020')
+    w, h = doc.w, doc.h
+
+    if shape == 'stripes':
+        # Vertical walls with a gap at the top or bottom, so the area is one long snake.
+        for x in range(1, w, 2):
+            gap = 0 if (x // 2) % 2 else h - 1
+            doc.set_many([(x, y) for y in range(h) if y != gap], wall)
+    elif shape == 'checker':
+        # Only connected diagonally, mostly stops a 4-connected fill.
+        doc.set_many([(x, y) for y in range(h) for x in range(w) if (x + y) % 2], wall)
+    elif shape == 'maze':
+        random.seed(1)
+        doc.set_many([(x, y) for y in range(h) for x in range(w) if random.random() < 0.3], wall)
+
+
+def peak_memory(setup, run):
+    """Run something again, with tracemalloc, for its peak memory.
+
+    Args:
+        setup (function): Prepares the run, its result is given to run.
+        run (function): The measured part.
+
+    Returns:
+        int: Peak memory in bytes.
+    """
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def headless_suite(sizes, memory=True):
+    """Scenarios that run without tkinter: the fill engine and the document.
+
+    Args:
+        sizes (list): Document sizes.
+        memory (bool, optional): Measure the peak memory too.
+
+    Returns:
+        dict: Results by scenario name.
+    """
+    results = {}
+    color = hex_to_rgba('#ff0000')
+
+    for size in sizes:
+        for shape in ('open', 'stripes', 'checker', 'maze'):
+            def setup():
+                doc = PPixelDocument(size, size)
+                fill_shape(doc, shape)
+                return doc
+
+            def run(doc):
+                spans = scanline_fill(size, size, 0, 0, doc.get_index)
+                doc.set_spans(spans, color)
+
+            doc = setup()
+            start = time.perf_counter()
+            run(doc)
+            wall = time.perf_counter() - start
+            peak = peak_memory(setup, run) if memory else 0
+            results[f'engine_fill_{shape}_{size}'] = summarize([wall], wall, peak)
+
+        def new_document(state):
+            PPixelDocument(size, size)
+
+        start = time.perf_counter()
+        new_document(None)
+        wall = time.perf_counter() - start
+        peak = peak_memory(lambda: None, new_document) if memory else 0
+        results[f'engine_new_{size}'] = summarize([wall], wall, peak)
+
+    return results
+
+
+class CanvasBench():
+    """
+    Replays events against a PPixelPaintingCanvas in a hidden window.
+    """
+    def __init__(self, pp_size=20, memory=True):
+        """Create the window and the canvas.
+
+        Args:
+            pp_size (int, optional): painting pixel size.
+            memory (bool, optional): Measure the peak memory too.
+        """
+        from tkinter import Tk
+        from PPixelCanvas import PPixelPaintingCanvas
+
+        self.root = Tk()
+        self.root.withdraw()
+        self.pp_size = pp_size
+        self.memory = memory
+        self.canvas = PPixelPaintingCanvas(self.root, width=1000, height=1000, background='white')
+        self.canvas.grid()
+        self.root.update()
+
+    def close(self):
+        """Destroy the window."""
+        self.root.destroy()
+
+    def settle(self):
+        """Draw everything that is waiting."""
+        self.canvas.flush_motion()
+        self.canvas.scheduler.flush()
+        self.canvas.update_idletasks()
+
+    def new_canvas(self, size):
+        """Start a new canvas, and wait until it's drawn.
+
+        Args:
+            size (int): width and height
+        """
+        self.canvas.refresh_canvas_data(size, size, self.pp_size)
+        self.settle()
+
+    def play(self, stream):
+        """Replay events, and measure each one until the canvas is idle again.
+
+        Args:
+            stream (list): (kind, x, y) tuples.
+
+        Returns:
+            list: Seconds for every event.
+        """
+        canvas = self.canvas
+        handlers = {'press': canvas.clicktools, 'click': canvas.clicktools,
+                    'motion': canvas.motion_paint, 'release': canvas.end_stroke}
+        latencies = []
+
+        for kind, x, y in stream:
+            event = SyntheticEvent(x, y)
+            t = time.perf_counter()
+            handlers[kind](event)
+            if kind == 'click':
+                canvas.end_stroke(event)
+            canvas.update_idletasks()
+            latencies.append(time.perf_counter() - t)
+        self.settle()
+        return latencies
+
+    def replay(self, stream, setup):
+        """Measure a scenario.
+
+        Args:
+            stream (list): (kind, x, y) tuples.
+            setup (function): Prepares the canvas for the scenario.
+
+        Returns:
+            dict: Result of the scenario.
+        """
+        setup()
+        start = time.perf_counter()
+        latencies = self.play(stream)
+        wall = time.perf_counter() - start
+        items = len(self.canvas.find_all())
+
+        peak = peak_memory(setup, lambda state: self.play(stream)) if self.memory else 0
+        return summarize(latencies, wall, peak, items)
+
+    def suite(self, sizes, replays=()):
+        """Run every canvas scenario.
+
+        Args:
+            sizes (list): Canvas sizes for the new canvas scenario.
+            replays (list, optional): (name, stream) tuples of recorded streams.
+
+        Returns:
+            dict: Results by scenario name.
+        """
+        results = {}
+        canvas = self.canvas
+        random.seed(0)
+        span = 50*self.pp_size
+
+        def blank(mode):
+            def setup():
+                self.new_canvas(50)
+                canvas.change_mode(mode)
+            return setup
+
+        # Single clicks of the painter.
+        clicks = [('click', random.randrange(span), random.randrange(span)) for _ in range(500)]
+        results['clicks'] = self.replay(clicks, blank(0))
+
+        # A long drag, moving fast so samples are far from each other.
+        drag = [('press', 10, 10)]
+        for i in range(1000):
+            drag.append(('motion', (i*37) % span, (i*53) % span))
+        drag.append(('release', 0, 0))
+        results['drag'] = self.replay(drag, blank(0))
+
+        # Erasing the drag.
+        def painted():
+            blank(0)()
+            self.play(drag)
+            canvas.change_mode(1)
+        results['erase_drag'] = self.replay(drag, painted)
+
+        # The same drag with symmetry, which writes every image in the same frame.
+        for mode, folds in (('horizontal', 2), ('both', 4), ('radial', 8)):
+            def symmetric(mode=mode, folds=folds):
+                blank(0)()
+                canvas.set_symmetry(mode, folds)
+            results[f'drag_{mode}{folds}'] = self.replay(drag, symmetric)
+        canvas.set_symmetry(None)
+
+        # Fills over different shapes.
+        for shape in ('open', 'stripes', 'checker', 'maze'):
+            def shaped(shape=shape):
+                blank(3)()
+                fill_shape(canvas.doc, shape)
+                self.settle()
+            results[f'fill_{shape}'] = self.replay([('click', 1, 1)], shaped)
+        canvas.change_mode(0)
+
+        # New canvases of different sizes.
+        for size in sizes:
+            start = time.perf_counter()
+            self.new_canvas(size)
+            wall = time.perf_counter() - start
+            items = len(canvas.find_all())
+            peak = peak_memory(lambda: None, lambda state: self.new_canvas(size)) if self.memory else 0
+            results[f'new_canvas_{size}'] = summarize([wall], wall, peak, items)
+
+        for name, stream in replays:
+            results[f'replay_{name}'] = self.replay(stream, blank(0))
+
+        return results
+
+
+def compare(old, new, report=print):
+    """Print the differences of two runs.
+
+    Args:
+        old (dict): Former results.
+        new (dict): Latter results.
+        report (function, optional): Called with a line of text.
+    """
+    keys = ('p50_ms', 'p99_ms', 'wall_ms', 'peak_kb', 'items')
+    report(f'{"scenario":28} {"metric":8} {"old":>12} {"new":>12} {"change":>8}')
+
+    for name in sorted(set(old['scenarios']) | set(new['scenarios'])):
+        a, b = old['scenarios'].get(name), new['scenarios'].get(name)
+        if a is None or b is None:
+            report(f'{name:28} only in the {"new" if a is None else "old"} run')
+            continue
+        for key in keys:
+            if key not in a or key not in b:
+                continue
+            change = (b[key] - a[key]) / a[key] * 100 if a[key] else 0.0
+            report(f'{name:28} {key:8} {a[key]:12.3f} {b[key]:12.3f} {change:+7.1f}%')
+
+
+def main(argv):
+    """Command line entry of the benchmarks.
+
+    Args:
+        argv (list): Arguments, without the program name.
+
+    Returns:
+        int: Exit status.
+    """
+    parser = argparse.ArgumentParser(prog='PPixelBench.py', description='Benchmark the canvas tools.')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--headless', action='store_true', help='only run the scenarios that need no display')
+    parser.add_argument('--sizes', default='64,256,1024', help='comma separated canvas sizes')
+    parser.add_argument('--replay', action='append', default=[], help='a recorded event stream, can be given many times')
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the peak memory")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    replays = []
+    for path in args.replay:
+        with open(path) as file:
+            replays.append((path, [tuple(event) for event in json.load(file)]))
+
+    scenarios = headless_suite(sizes, not args.no_memory)
+    if not args.headless:
+        bench = CanvasBench(memory=not args.no_memory)
+        try:
+            scenarios.update(bench.suite(sizes, replays))
+        finally:
+            bench.close()
+
+    results = {
+        'meta': {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'headless': args.headless},
+        'scenarios': scenarios,
+    }
+
+    for name, result in scenarios.items():
+        extra = f'  {result["items"]} items' if 'items' in result else ''
+        print(f'{name:28} p50 {result["p50_ms"]:9.3f} ms  p99 {result["p99_ms"]:9.3f} ms  '
+              f'wall {result["wall_ms"]:9.1f} ms  peak {result["peak_kb"]:9.1f} KB{extra}')
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
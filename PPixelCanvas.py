@@ -1,9 +1,44 @@
 
+from array import array
 from tkinter import *
 from tkinter import ttk
+from PPixelColor import EMPTY, HexTable
+from PPixelDocument import TILE_SHIFT, PPixelDocument, anchor_offset
+from PPixelFrames import Timeline, changed_tiles
+from PPixelHistory import PPixelHistory
+from PPixelLayers import LayerStack, blend_row
+from PPixelScheduler import RenderScheduler
+from PPixelSelection import flip_region, rotate_region
+from PPixelStats import EventStats
+from PPixelSymmetry import Symmetry
+from PPixelTools import MODES, TOOLS, Brush, Tool, merge_spans
+
+# Zoom levels as (size, subsample) pairs. A painting pixel is size/subsample real pixels.
+# Below one real pixel, only every subsample'th painting pixel is drawn.
+ZOOM_LEVELS = ((1, 8), (1, 4), (1, 2), (1, 1), (2, 1), (3, 1), (4, 1), (6, 1), (8, 1),
+               (12, 1), (16, 1), (20, 1), (24, 1), (32, 1), (48, 1), (64, 1))
+
+# The grid is hidden when a painting pixel is smaller than this, in real pixels.
+GRID_MIN_SIZE = 4
 
 class PPixelPaintingCanvas(Canvas):
-    """A modified version of tkinter canvas widget.
+    """A modified version of tkinter canvas widget. It is a view of a
+    PPixelDocument, which holds the painting pixels. Tools write to the document
+    and the canvas redraws the parts that the document reports as changed.
+
+    The document is a layer of a LayerStack. The canvas shows the composite of the
+    stack, and self.doc is the document of the current layer. The stack is the current
+    frame of a Timeline, the onion skin of the frame can be shown under it.
+
+    The document is drawn as a single image item. The source image has one
+    real pixel for each painting pixel, and the shown image is a copy of it that is
+    zoomed by pp_pixel_size. So the amount of canvas items never changes.
+    Only the visible part of the scrollregion (and a margin around it) is kept in
+    the images, so the cost of drawing depends on the screen, not the document.
+    When zoomed out, only every subsample'th painting pixel is put to the source.
+
+    Changes are not drawn immediately. They are collected by a RenderScheduler
+    and drawn together once per frame.
 
     Parent:
         Canvas (tkinter canvas): Child of the tkinter canvas class.
@@ -17,25 +52,110 @@ class PPixelPaintingCanvas(Canvas):
         """
         super().__init__(parent, **kwargs)
 
-        # Size of a pixel on canvas, in amount of pixels.
+        # Size of a pixel on canvas, in amount of pixels. When zoomed out below one pixel,
+        # pp_pixel_size is 1 and subsample is the amount of painting pixels per pixel.
+        # base_pp_size is the size that is shown as 100%.
         self.pp_pixel_size = 0
+        self.subsample = 1
+        self.base_pp_size = 0
         
-        # Indicates the current selected tool.
-        # 0 -> painter, 1 -> eraser, 2 -> color picker, 3 -> fill 
-        self.tool_mode = 0
+        # The current selected tool, see PPixelTools. pressed is True from pressing
+        # the button until releasing it. The brush is used by the painter and the eraser.
+        self.tool = TOOLS['paint']
+        self.pressed = False
+        self.brush = Brush()
         
         # Painting color in hex.
         self.color_hex = '#000000'
+
+        # Options of the fill tool. Connectivity is 4 or 8, and tolerance is the biggest
+        # channel difference that is still counted as the same color.
+        self.fill_connectivity = 4
+        self.fill_tolerance = 0
+
+        # Where the color picker and the fill tool look at the painting pixels,
+        # 'layer' for the current layer and 'composite' for every visible layer.
+        self.picker_sample = 'layer'
+        self.fill_sample = 'layer'
+
+        # The painter, the eraser and the fill tool mirror what they write if symmetry
+        # is set. It's made for the document size, from symmetry_mode and symmetry_folds.
+        self.symmetry = None
+        self.symmetry_mode = None
+        self.symmetry_folds = 4
         
+        # Timings of the event handlers, for finding out why a document is slow.
+        self.stats = EventStats()
+
         # Binding left-button and left-button-movement to some functions.
         # clicktools is a function for single click paint, color pick and fill.
-        self.bind('<Button-1>', self.clicktools)
-        self.bind('<B1-Motion>', self.motion_paint)
+        # The handlers are timed, see export_stats.
+        self.bind('<Button-1>', self.stats.timed('click', self.clicktools))
+        self.bind('<B1-Motion>', self.stats.timed('motion', self.motion_paint))
+        self.bind('<ButtonRelease-1>', self.stats.timed('release', self.end_stroke))
+
+        # Motion samples wait in pending_motion, and are given to the tool together when idle.
+        self.pending_motion = []
+        self.motion_after = None
         
-        # Coordinates are stored in a 2-dimensional list, which is x and y axis.
-        # In each index, a tuple of color and id are stored. As an example:
-        # [[('#000000', 1), ('#000000', 2)], [('#111111', 8)]]
-        self.data = [[]]
+        # The painting pixels are stored in the document. The canvas only keeps the
+        # images that show it, and the hex colors for tkinter.
+        self.doc = PPixelDocument(0, 0)
+        self.stack = LayerStack(self.doc)
+        self.timeline = Timeline(self.stack)
+        self.history = PPixelHistory(self.doc)
+
+        # The onion skin is shown if onion_skin is True. playing is the after id of
+        # the next frame while the animation is played, and the onion skin is hidden.
+        self.onion_skin = False
+        self.playing = None
+        self.source = PhotoImage(master=self)
+        self.image = PhotoImage(master=self)
+        self.image_id = 0
+        self.hex_table = HexTable(self.cget('background'))
+
+        # The preview of the shape tools, a single image item over the document.
+        # preview is (spans, color) while it's shown, for redrawing it after zooming.
+        self.overlay = PhotoImage(master=self)
+        self.overlay_id = 0
+        self.preview = None
+
+        # The grid over the painting pixels, shown if show_grid is True. It's a single
+        # image item as big as the view. grid_tile is a painting pixel with its top and
+        # left lines, and it's tiled over grid_image. grid_key is (size, width, height)
+        # of the grid_image, it's only made again when the zoom or the view size changes.
+        self.show_grid = False
+        self.grid_color = '#808080'
+        self.grid_tile = PhotoImage(master=self)
+        self.grid_image = PhotoImage(master=self)
+        self.grid_id = 0
+        self.grid_key = None
+
+        # The selection as (x0, y0, x1, y1), x1 and y1 are exclusive, and the marquee,
+        # a single rectangle item around it. While a selection is being moved, its
+        # painting pixels are lifted out of the document, floating is (x, y, w, h, region),
+        # and they are shown by the floating image item, zoomed from floating_source.
+        self.selection = None
+        self.marquee_id = 0
+        self.floating = None
+        self.floating_source = PhotoImage(master=self)
+        self.floating_image = PhotoImage(master=self)
+        self.floating_id = 0
+
+        # Copied painting pixels, as (w, h, region).
+        self.clipboard = None
+
+        # The preview of Replace Color as (old, new, rect). The old color is drawn as the
+        # new one in rect, without changing the document. rect is None if nothing is replaced.
+        self.recolor_preview = None
+
+        # The part of the document that is in the images, in painting pixels as
+        # (x0, y0, x1, y1). Moves when scrolling, zooming or resizing the window.
+        self.view = (0, 0, 0, 0)
+        self.bind('<Configure>', self.update_viewport)
+
+        # Dirty rectangles are merged and drawn once per frame, frame_ms is the frame budget.
+        self.scheduler = RenderScheduler(self, self.render_region, frame_ms=16, stats=self.stats)
         self.w = self.h = 0
 
         self.realw = self.realh = 0
@@ -48,19 +168,879 @@ class PPixelPaintingCanvas(Canvas):
             h (int): height
             s (int): painting pixel size
         """
+        self.base_pp_size = s
+        self.set_document(PPixelDocument(w, h), s)
+
+    def set_document(self, doc, s=None):
+        """Start viewing a document, as the only layer of the only frame, and draw it.
+
+        Args:
+            doc (PPixelDocument): The document.
+            s (int, optional): painting pixel size, current one if not given.
+        """
+        self.set_timeline(Timeline(LayerStack(doc)), s)
+
+    def set_timeline(self, timeline, s=None):
+        """Start viewing the frames of an animation, and draw the current one.
+
+        Args:
+            timeline (Timeline): The frames.
+            s (int, optional): painting pixel size, current one if not given.
+        """
+        self.end_stroke()
+        self.stop()
+        self.stack.unsubscribe(self.document_changed)
+        self.timeline.unsubscribe(self.document_changed)
+        self.scheduler.clear()
         self.delete('all')
-        
-        x_l = [(0, 0) for _ in range(w)]
-        data_list = [list(x_l) for _ in range(h)]
-        
-        self.data = data_list
+
+        self.timeline = timeline
+        self.stack = timeline.current_frame()
+        self.doc = self.stack.current_layer().doc
+        self.history = PPixelHistory(self.doc)
+        self.w, self.h = timeline.w, timeline.h
+        self.set_symmetry(self.symmetry_mode, self.symmetry_folds)
+
+        if s is not None:
+            self.pp_pixel_size, self.subsample = s, 1
+        self.update_scrollregion()
+
+        self.image_id = self.create_image(0, 0, image=self.image, anchor=NW)
+        self.grid_id = self.create_image(0, 0, image=self.grid_image, anchor=NW, state='hidden')
+        self.overlay_id = self.create_image(0, 0, image=self.overlay, anchor=NW, state='hidden')
+        self.preview = None
+        self.floating_id = self.create_image(0, 0, image=self.floating_image, anchor=NW, state='hidden')
+        self.marquee_id = self.create_rectangle(0, 0, 0, 0, outline='#000000', dash=(4, 4), state='hidden')
+        self.floating = None
+        self.selection = None
+
+        self.stack.subscribe(self.document_changed)
+        self.timeline.subscribe(self.document_changed)
+        self.update_viewport(force=True)
+
+        self.event_generate('<<NewCanvas>>')
+        self.event_generate('<<LayersChanged>>')
+
+    def resize_document(self, w, h, anchor='nw', ox=None, oy=None):
+        """Change the size of the document, keeping the painting pixels.
+        The history is cleared, since the old actions don't fit the new size.
+
+        When the top left stays where it is, the images are only grown or cropped,
+        and only the newly exposed part is drawn. Otherwise the view is redrawn.
+
+        Args:
+            w (int): new width
+            h (int): new height
+            anchor (str, optional): Where the old content stays, like the tkinter anchors.
+            ox (int, optional): x offset of the old content, instead of the anchor. Negative crops.
+            oy (int, optional): y offset of the old content, instead of the anchor. Negative crops.
+        """
+        self.end_stroke()
+        if ox is None or oy is None:
+            ox, oy = anchor_offset(self.w, self.h, w, h, anchor)
+
+        self.timeline.resize(w, h, ox, oy)
+        self.history.clear()
+        self.set_selection(None)
         self.w, self.h = w, h
+        self.set_symmetry(self.symmetry_mode, self.symmetry_folds)
+        self.update_scrollregion()
 
-        self.pp_pixel_size = s
-        self.realw, self.realh = w*s, h*s
+        if ox or oy:
+            self.update_viewport(force=True)
+        else:
+            # The images only keep the part that is still inside the document.
+            size, sub = self.pp_pixel_size, self.subsample
+            vx0, vy0, vx1, vy1 = self.view
+            vx1, vy1 = min(vx1, w), min(vy1, h)
+            self.view = (vx0, vy0, vx1, vy1)
+            sw, sh = max(-(-(vx1 - vx0) // sub), 1), max(-(-(vy1 - vy0) // sub), 1)
+            self.source.configure(width=sw, height=sh)
+            self.image.configure(width=sw*size, height=sh*size)
+            self.update_viewport()
 
         self.event_generate('<<NewCanvas>>')
 
+    def document_changed(self, x0, y0, x1, y1):
+        """Called by the layer stack after a change of the composite, or by the
+        timeline after a change of the onion skin. Schedules the changed rectangle
+        to be redrawn in the next frame.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        self.scheduler.invalidate(x0, y0, x1, y1)
+
+    def set_frame_budget(self, frame_ms):
+        """Change how often the changes are drawn.
+
+        Args:
+            frame_ms (int): Milliseconds between two redraws.
+        """
+        self.scheduler.set_frame_budget(frame_ms)
+
+    def update_scrollregion(self):
+        """Calculate the real size of the document, for the current zoom,
+        and set the scrollregion with it.
+        """
+        size, sub = self.pp_pixel_size, self.subsample
+        self.realw = -(-self.w*size // sub)
+        self.realh = -(-self.h*size // sub)
+        self['scrollregion'] = (0, 0, self.realw, self.realh)
+
+    def xview(self, *args):
+        """Scroll horizontally like the Canvas, then update the viewport."""
+        result = super().xview(*args)
+        if args:
+            self.update_viewport()
+        return result
+
+    def yview(self, *args):
+        """Scroll vertically like the Canvas, then update the viewport."""
+        result = super().yview(*args)
+        if args:
+            self.update_viewport()
+        return result
+
+    def update_viewport(self, event=0, force=False):
+        """Move the images to the visible part of the document, if it's needed.
+        Nothing happens if the visible part is still inside the images, since
+        the images have a margin of half a screen around the visible part.
+        If the images still start at the same place, like after growing the
+        document, they are resized in place and only the new part is drawn.
+
+        Args:
+            event (tkinter bind event): Not used.
+            force (bool, optional): Redraw even if the visible part is inside the images.
+        """
+        if not self.w or not self.h or not self.pp_pixel_size:
+            return
+
+        size, sub = self.pp_pixel_size, self.subsample
+
+        # The visible part, in painting pixels.
+        left, top = self.canvasx(0), self.canvasy(0)
+        right, bottom = left + self.winfo_width(), top + self.winfo_height()
+        x0, y0 = max(int(left*sub // size), 0), max(int(top*sub // size), 0)
+        x1, y1 = min(int(right*sub // size) + 1, self.w), min(int(bottom*sub // size) + 1, self.h)
+
+        vx0, vy0, vx1, vy1 = self.view
+        if not force and vx0 <= x0 and vy0 <= y0 and x1 <= vx1 and y1 <= vy1:
+            return
+
+        # Adding the margin. The left and top are aligned to subsample, so that the
+        # same painting pixels are taken wherever the view is.
+        mx, my = (x1 - x0) // 2, (y1 - y0) // 2
+        x0, y0 = max(x0 - mx, 0) // sub * sub, max(y0 - my, 0) // sub * sub
+        x1, y1 = min(x1 + mx, self.w), min(y1 + my, self.h)
+        self.view = (x0, y0, x1, y1)
+
+        sw, sh = -(-(x1 - x0) // sub), -(-(y1 - y0) // sub)
+        if not force and (x0, y0) == (vx0, vy0):
+            # Resizing a photo image keeps what fits of its content.
+            self.source.configure(width=sw, height=sh)
+            self.image.configure(width=sw*size, height=sh*size)
+            self.render_region(min(vx1, x1), y0, x1, y1)
+            self.render_region(x0, min(vy1, y1), min(vx1, x1), y1)
+            self.update_grid()
+            return
+
+        self.source.blank()
+        self.source.configure(width=sw, height=sh)
+        self.image.blank()
+        self.image.configure(width=sw*size, height=sh*size)
+        self.coords(self.image_id, x0*size // sub, y0*size // sub)
+
+        # Every dirty rectangle is inside the document, the whole view is redrawn anyway.
+        self.scheduler.clear()
+        self.render_region(x0, y0, x1, y1)
+        self.update_grid()
+
+    def set_grid(self, show):
+        """Show or hide the grid over the painting pixels.
+
+        Args:
+            show (bool): True for showing it.
+        """
+        self.show_grid = show
+        self.update_grid()
+
+    def update_grid(self):
+        """Move the grid to the view. The grid image is only made again if the zoom or
+        the size of the view has changed, with a single copy that tiles grid_tile over it.
+        The grid is hidden if it's off, or the painting pixels are too small for it.
+        """
+        size, sub = self.pp_pixel_size, self.subsample
+        x0, y0, x1, y1 = self.view
+        if not self.show_grid or sub != 1 or size < GRID_MIN_SIZE or x0 >= x1 or y0 >= y1:
+            self.itemconfigure(self.grid_id, state='hidden')
+            return
+
+        w, h = (x1 - x0)*size, (y1 - y0)*size
+        if self.grid_key != (size, w, h):
+            if self.grid_key is None or self.grid_key[0] != size:
+                self.grid_tile.blank()
+                self.grid_tile.configure(width=size, height=size)
+                self.grid_tile.put(self.grid_color, to=(0, 0, size, 1))
+                self.grid_tile.put(self.grid_color, to=(0, 0, 1, size))
+            self.grid_image.blank()
+            self.grid_image.configure(width=w, height=h)
+            self.tk.call(self.grid_image, 'copy', self.grid_tile, '-to', 0, 0, w, h)
+            self.grid_key = (size, w, h)
+
+        self.coords(self.grid_id, x0*size, y0*size)
+        self.itemconfigure(self.grid_id, state='normal')
+
+    def render_region(self, x0, y0, x1, y1):
+        """Redraw a rectangle of the document with two bulk image operations.
+        The rows are put to the source image at once, then the rectangle is copied
+        to the shown image, zoomed by the painting pixel size. Parts outside of
+        the view are skipped.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        vx0, vy0, vx1, vy1 = self.view
+        size, sub = self.pp_pixel_size, self.subsample
+
+        # Clipping to the view, and aligning to subsample.
+        x0, y0 = max(x0, vx0), max(y0, vy0)
+        x1, y1 = min(x1, vx1), min(y1, vy1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        x0 -= (x0 - vx0) % sub
+        y0 -= (y0 - vy0) % sub
+
+        doc, hexes = self.stack, self.hex_table
+        onion = self.timeline.onion() if self.onion_skin and self.playing is None else None
+        preview = self.recolor_preview if self.recolor_preview and self.recolor_preview[2] else None
+        rows = []
+        for y in range(y0, y1, sub):
+            row = None
+            if preview is not None:
+                # Replace Color changes only the current layer, so the preview recolors
+                # its row, and composites it with the other layers.
+                old, new, (px0, py0, px1, py1) = preview
+                if py0 <= y < py1:
+                    own = self.doc.get_row(y, x0, x1, sub)
+                    if old in own:
+                        own = array('I', [new if c == old and px0 <= x0 + i*sub < px1 else c
+                                          for i, c in enumerate(own)])
+                        row = doc.composite_row(y, x0, x1, own, sub)
+            if row is None:
+                row = doc.get_row(y, x0, x1, sub)
+            if onion is not None:
+                row = blend_row(onion.get_row(y, x0, x1, sub), row)
+            rows.append('{' + ' '.join(map(hexes.__getitem__, row)) + '}')
+
+        sx, sy = (x0 - vx0) // sub, (y0 - vy0) // sub
+        sw, sh = -(-(x1 - x0) // sub), len(rows)
+
+        self.source.put(' '.join(rows), to=(sx, sy))
+        self.tk.call(self.image, 'copy', self.source, '-from', sx, sy, sx + sw, sy + sh,
+                     '-to', sx*size, sy*size, '-zoom', size)
+
+    def show_preview(self, spans, color):
+        """Show spans over the document without writing them, for the shape tools.
+        The preview is a single image item, which is updated in place, and only
+        the part that is in the view is drawn.
+
+        Args:
+            spans (list): (y, x_start, x_end) tuples.
+            color (int): Packed color.
+        """
+        self.preview = (spans, color)
+        vx0, vy0, vx1, vy1 = self.view
+        spans = [(y, max(x0, vx0), min(x1, vx1)) for y, x0, x1 in spans
+                 if vy0 <= y < vy1 and max(x0, vx0) < min(x1, vx1)]
+        if not spans:
+            self.itemconfigure(self.overlay_id, state='hidden')
+            return
+
+        size, sub = self.pp_pixel_size, self.subsample
+        bx0, by0 = min(span[1] for span in spans), min(span[0] for span in spans)
+        bx1, by1 = max(span[2] for span in spans), max(span[0] for span in spans) + 1
+        ox, oy = bx0*size // sub, by0*size // sub
+
+        self.overlay.blank()
+        self.overlay.configure(width=max(bx1*size // sub - ox, 1), height=max(by1*size // sub - oy, 1))
+        fill = self.hex_table[color]
+        for y, x0, x1 in spans:
+            px0, py0 = x0*size // sub - ox, y*size // sub - oy
+            self.overlay.put(fill, to=(px0, py0, max(x1*size // sub - ox, px0 + 1), max((y + 1)*size // sub - oy, py0 + 1)))
+
+        self.coords(self.overlay_id, ox, oy)
+        self.itemconfigure(self.overlay_id, state='normal')
+        self.tag_raise(self.overlay_id)
+
+    def clear_preview(self):
+        """Hide the preview of the shape tools."""
+        self.preview = None
+        self.itemconfigure(self.overlay_id, state='hidden')
+        self.overlay.blank()
+
+    def set_selection(self, rect):
+        """Select a rectangle, or nothing.
+
+        Args:
+            rect (tuple): x0, y0, x1, y1 respectively, x1 and y1 are exclusive. Clipped
+            to the document. None for selecting nothing.
+        """
+        if rect is not None:
+            rect = self.doc.clip(*rect)
+            if rect[0] >= rect[2] or rect[1] >= rect[3]:
+                rect = None
+        self.selection = rect
+        self.update_marquee()
+
+    def update_marquee(self):
+        """Move the marquee to the selection, for the current zoom."""
+        if self.selection is None:
+            self.itemconfigure(self.marquee_id, state='hidden')
+            return
+        size, sub = self.pp_pixel_size, self.subsample
+        x0, y0, x1, y1 = self.selection
+        self.coords(self.marquee_id, x0*size // sub, y0*size // sub, x1*size // sub, y1*size // sub)
+        self.itemconfigure(self.marquee_id, state='normal')
+        self.tag_raise(self.marquee_id)
+
+    def select_all(self, event=0):
+        """Select the whole document.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        self.set_selection((0, 0, self.w, self.h))
+
+    def deselect(self, event=0):
+        """Select nothing.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        self.set_selection(None)
+
+    def lift_selection(self):
+        """Take the selected painting pixels out of the document, for moving them.
+        They float over the document until drop_floating.
+        """
+        x0, y0, x1, y1 = self.selection
+        region = self.doc.get_region(x0, y0, x1, y1)
+        self.doc.fill_rect(x0, y0, x1, y1, EMPTY)
+        self.floating = (x0, y0, x1 - x0, y1 - y0, region)
+        self.show_floating()
+
+    def show_floating(self):
+        """Draw the floating painting pixels to the floating image item. Empty ones
+        are left transparent, so only the painted runs of each row are put.
+        """
+        x, y, w, h, region = self.floating
+        size, sub = self.pp_pixel_size, self.subsample
+        hexes = self.hex_table
+
+        self.floating_source.blank()
+        self.floating_source.configure(width=w, height=h)
+        for ry in range(h):
+            row = region[ry*w:(ry + 1)*w]
+            start = None
+            for rx in range(w + 1):
+                painted = rx < w and row[rx] != EMPTY
+                if painted and start is None:
+                    start = rx
+                elif not painted and start is not None:
+                    self.floating_source.put('{' + ' '.join(map(hexes.__getitem__, row[start:rx])) + '}', to=(start, ry))
+                    start = None
+
+        self.floating_image.blank()
+        if sub == 1:
+            self.tk.call(self.floating_image, 'copy', self.floating_source, '-zoom', size)
+        else:
+            self.tk.call(self.floating_image, 'copy', self.floating_source, '-subsample', sub)
+        self.coords(self.floating_id, x*size // sub, y*size // sub)
+        self.itemconfigure(self.floating_id, state='normal')
+        self.tag_raise(self.floating_id)
+        self.tag_raise(self.marquee_id)
+
+    def move_floating(self, x, y):
+        """Move the floating painting pixels and the selection. Only the image item
+        and the marquee are moved, nothing is redrawn.
+
+        Args:
+            x (int): new left, in painting pixels
+            y (int): new top, in painting pixels
+        """
+        _, _, w, h, region = self.floating
+        self.floating = (x, y, w, h, region)
+        self.selection = (x, y, x + w, y + h)
+
+        size, sub = self.pp_pixel_size, self.subsample
+        self.coords(self.floating_id, x*size // sub, y*size // sub)
+        self.update_marquee()
+
+    def drop_floating(self):
+        """Write the floating painting pixels to the document where they are.
+        Empty ones don't overwrite. The selection is clipped to the document.
+        """
+        if self.floating is None:
+            return
+        x, y, w, h, region = self.floating
+        self.floating = None
+        self.itemconfigure(self.floating_id, state='hidden')
+        self.floating_image.blank()
+
+        self.doc.blit(x, y, w, h, region, skip_empty=True)
+        self.set_selection((x, y, x + w, y + h))
+
+    def copy(self, event=0):
+        """Copy the selected painting pixels to the clipboard.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        if self.selection is None:
+            return
+        x0, y0, x1, y1 = self.selection
+        self.clipboard = (x1 - x0, y1 - y0, self.doc.get_region(x0, y0, x1, y1))
+
+    def cut(self, event=0):
+        """Copy the selected painting pixels to the clipboard, and empty them.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.copy()
+        self.delete_selected()
+
+    def delete_selected(self, event=0):
+        """Empty the selected painting pixels.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        if self.selection is None:
+            return
+        self.history.begin()
+        self.doc.fill_rect(*self.selection, EMPTY)
+        self.history.commit()
+
+    def paste(self, event=0):
+        """Paste the clipboard to the top left of the selection, or of the visible
+        part, and select it. It can be moved with the select tool.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        if self.clipboard is None:
+            return
+        w, h, region = self.clipboard
+        x, y = self.selection[:2] if self.selection is not None else self.to_cell(int(self.canvasx(0)), int(self.canvasy(0)))
+        x, y = max(x, 0), max(y, 0)
+
+        self.history.begin()
+        self.doc.blit(x, y, w, h, region, skip_empty=True)
+        self.history.commit()
+        self.set_selection((x, y, x + w, y + h))
+
+    def transform_selected(self, transform):
+        """Replace the selected painting pixels with a transformed copy of them,
+        keeping the top left. As a single action.
+
+        Args:
+            transform (function): Called with region, w, h and returns the new
+            region, w and h.
+        """
+        self.end_stroke()
+        if self.selection is None:
+            return
+        x0, y0, x1, y1 = self.selection
+        region, w, h = transform(self.doc.get_region(x0, y0, x1, y1), x1 - x0, y1 - y0)
+
+        self.history.begin()
+        self.doc.fill_rect(x0, y0, x1, y1, EMPTY)
+        self.doc.blit(x0, y0, w, h, region)
+        self.history.commit()
+        self.set_selection((x0, y0, x0 + w, y0 + h))
+
+    def flip_selected(self, horizontal=True):
+        """Mirror the selected painting pixels.
+
+        Args:
+            horizontal (bool, optional): True for left-right, False for top-bottom.
+        """
+        self.transform_selected(lambda region, w, h: (flip_region(region, w, h, horizontal), w, h))
+
+    def rotate_selected(self, clockwise=True):
+        """Rotate the selected painting pixels by 90 degrees, around the top left.
+
+        Args:
+            clockwise (bool, optional): Direction of the rotation.
+        """
+        self.transform_selected(lambda region, w, h: rotate_region(region, w, h, clockwise))
+
+    def preview_replace(self, old, new, selection_only=False):
+        """Show how Replace Color would look, without changing the document.
+        Only the tiles that have the old color are redrawn.
+
+        Args:
+            old (int): Packed color to replace.
+            new (int): Packed color to replace with.
+            selection_only (bool, optional): If True, only in the selection.
+        """
+        self.clear_replace_preview()
+        rect = self.selection if selection_only else None
+        self.recolor_preview = (old, new, self.doc.color_bounds(old, rect))
+        if self.recolor_preview[2] is not None:
+            self.scheduler.invalidate(*self.recolor_preview[2])
+
+    def clear_replace_preview(self):
+        """Hide the preview of Replace Color."""
+        if self.recolor_preview is None:
+            return
+        rect = self.recolor_preview[2]
+        self.recolor_preview = None
+        if rect is not None:
+            self.scheduler.invalidate(*rect)
+
+    def replace_color(self, old, new, selection_only=False):
+        """Change every painting pixel of a color to another one, on the current layer,
+        as a single action. If the new color is not used by the layer and the whole layer
+        is replaced, only the palette entry is swapped, without touching the painting pixels.
+
+        Args:
+            old (int): Packed color to replace.
+            new (int): Packed color to replace with.
+            selection_only (bool, optional): If True, only in the selection.
+
+        Returns:
+            bool: True if anything has changed.
+        """
+        self.end_stroke()
+        self.clear_replace_preview()
+        self.history.begin()
+        changed = self.doc.replace_color(old, new, self.selection if selection_only else None)
+        self.history.commit()
+        return changed
+
+    def to_cell(self, rawx, rawy):
+        """Convert coordinates relative to canvas to painting pixel coordinates,
+        for the current zoom.
+
+        Args:
+            rawx (int): x coordinate
+            rawy (int): y coordinate
+
+        Returns:
+            tuple: independent coordinates, might be outside of the document.
+        """
+        size, sub = self.pp_pixel_size, self.subsample
+        return rawx*sub // size, rawy*sub // size
+
+    def set_zoom(self, size, subsample=1, x=None, y=None):
+        """Zoom the canvas, keeping the painting pixel at x, y in its place.
+
+        Args:
+            size (int): painting pixel size
+            subsample (int, optional): painting pixels per real pixel, when zoomed out.
+            x (int, optional): x coordinate in the window, center if not given.
+            y (int, optional): y coordinate in the window, center if not given.
+        """
+        if x is None:
+            x = self.winfo_width() // 2
+        if y is None:
+            y = self.winfo_height() // 2
+
+        # The painting pixel under x, y as a fraction, before zooming.
+        old_size, old_sub = self.pp_pixel_size, self.subsample
+        cellx = self.canvasx(x)*old_sub / old_size
+        celly = self.canvasy(y)*old_sub / old_size
+
+        self.pp_pixel_size, self.subsample = size, subsample
+        self.update_scrollregion()
+
+        # Scrolling so that the same painting pixel is under x, y.
+        if self.realw:
+            super().xview_moveto(max(cellx*size/subsample - x, 0) / self.realw)
+        if self.realh:
+            super().yview_moveto(max(celly*size/subsample - y, 0) / self.realh)
+
+        self.update_viewport(force=True)
+        if self.preview is not None:
+            self.show_preview(*self.preview)
+        if self.floating is not None:
+            self.show_floating()
+        self.update_marquee()
+        self.event_generate('<<ZoomChanged>>')
+
+    def zoom_step(self, step, x=None, y=None):
+        """Zoom in or out by some levels of ZOOM_LEVELS.
+
+        Args:
+            step (int): Positive for zooming in, negative for zooming out.
+            x (int, optional): x coordinate in the window, center if not given.
+            y (int, optional): y coordinate in the window, center if not given.
+        """
+        scale = self.pp_pixel_size / self.subsample
+        current = min(range(len(ZOOM_LEVELS)), key=lambda i: abs(ZOOM_LEVELS[i][0]/ZOOM_LEVELS[i][1] - scale))
+        level = min(max(current + step, 0), len(ZOOM_LEVELS) - 1)
+        if level != current:
+            self.set_zoom(*ZOOM_LEVELS[level], x=x, y=y)
+
+    def zoom_in(self, event=None):
+        """Zoom in by a level, keeping the painting pixel under the mouse in its place.
+
+        Args:
+            event (tkinter input event, optional): Used for getting coordinates.
+        """
+        if event is None:
+            self.zoom_step(1)
+        else:
+            self.zoom_step(1, event.x, event.y)
+
+    def zoom_out(self, event=None):
+        """Zoom out by a level, keeping the painting pixel under the mouse in its place.
+
+        Args:
+            event (tkinter input event, optional): Used for getting coordinates.
+        """
+        if event is None:
+            self.zoom_step(-1)
+        else:
+            self.zoom_step(-1, event.x, event.y)
+
+    def get_zoom_percent(self):
+        """Returns a string of the zoom, 100% is the starting painting pixel size.
+
+        Returns:
+            str: Zoom as percent.
+        """
+        if not self.base_pp_size:
+            return '100%'
+        return f'{round(self.pp_pixel_size / self.subsample / self.base_pp_size * 100)}%'
+
+    def get_counters(self):
+        """Return the performance counters of the canvas. The event timings are in self.stats.
+
+        Returns:
+            dict: Pending redraw regions, canvas items and memory of the document
+            and the history in bytes.
+        """
+        return {
+            'pending_regions': self.scheduler.pending(),
+            'items': len(self.find_all()),
+            'doc_bytes': self.timeline.nbytes(),
+            'layers': len(self.stack.layers),
+            'frames': len(self.timeline.frames),
+            'history_bytes': self.history.nbytes(),
+            'size': [self.w, self.h],
+            'zoom': self.get_zoom_percent(),
+        }
+
+    def sample_document(self, source):
+        """Return the document that a tool should look at.
+
+        Args:
+            source (str): 'layer' for the current layer, 'composite' for every visible layer.
+
+        Returns:
+            PPixelDocument: The document, it shouldn't be changed if it's the composite.
+        """
+        if source == 'composite':
+            return self.stack.flattened()
+        return self.doc
+
+    def layers_changed(self):
+        """Follow the current layer of the stack, after the layers have changed."""
+        self.doc = self.stack.current_layer().doc
+        self.history.set_document(self.doc)
+        self.event_generate('<<LayersChanged>>')
+
+    def add_layer(self, event=0):
+        """Add an empty layer over the current one, and make it current.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        self.stack.add_layer()
+        self.layers_changed()
+
+    def remove_layer(self, event=0):
+        """Remove the current layer, its actions are removed from the history.
+        The last layer can't be removed.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        layer = self.stack.remove_layer()
+        if layer is not None:
+            self.history.forget(layer.doc)
+            self.layers_changed()
+
+    def move_layer(self, step):
+        """Move the current layer up or down in the stack.
+
+        Args:
+            step (int): Positive for moving up, towards the top.
+        """
+        self.end_stroke()
+        self.stack.move_layer(self.stack.current, self.stack.current + step)
+        self.layers_changed()
+
+    def set_layer(self, index):
+        """Make a layer current, the tools write to it.
+
+        Args:
+            index (int): Index of the layer, from the bottom.
+        """
+        self.end_stroke()
+        self.stack.set_current(index)
+        self.layers_changed()
+
+    def set_layer_visible(self, visible, index=None):
+        """Show or hide a layer.
+
+        Args:
+            visible (bool): False for hiding.
+            index (int, optional): Index of the layer, the current one if not given.
+        """
+        self.end_stroke()
+        self.stack.set_visible(self.stack.current if index is None else index, visible)
+        self.event_generate('<<LayersChanged>>')
+
+    def set_layer_opacity(self, opacity, index=None):
+        """Change the opacity of a layer.
+
+        Args:
+            opacity (int): 0-255, 255 is opaque.
+            index (int, optional): Index of the layer, the current one if not given.
+        """
+        self.end_stroke()
+        self.stack.set_opacity(self.stack.current if index is None else index, opacity)
+        self.event_generate('<<LayersChanged>>')
+
+    def show_frame(self, index):
+        """Show another frame of the timeline. Only the tiles where the two frames
+        differ are redrawn, other tiles are shared by the frames.
+
+        Args:
+            index (int): Index of the frame, it wraps around.
+        """
+        old = self.stack
+        self.timeline.set_current(index)
+        self.stack = self.timeline.current_frame()
+        if self.stack is old:
+            return
+        old.unsubscribe(self.document_changed)
+        self.stack.subscribe(self.document_changed)
+        self.layers_changed()
+
+        # The onion skin is different for every frame.
+        keys = None if self.onion_skin and self.playing is None else changed_tiles(old, self.stack)
+        if keys is None:
+            self.scheduler.invalidate(0, 0, self.w, self.h)
+        else:
+            for tx, ty in keys:
+                self.scheduler.invalidate(tx << TILE_SHIFT, ty << TILE_SHIFT,
+                                          (tx + 1) << TILE_SHIFT, (ty + 1) << TILE_SHIFT)
+        self.event_generate('<<FrameChanged>>')
+
+    def set_frame(self, index):
+        """Make a frame current, the tools write to it.
+
+        Args:
+            index (int): Index of the frame, it wraps around.
+        """
+        self.end_stroke()
+        self.show_frame(index)
+
+    def step_frame(self, step):
+        """Go to a frame before or after the current one.
+
+        Args:
+            step (int): Positive for going forward.
+        """
+        self.set_frame(self.timeline.current + step)
+
+    def add_frame(self, copy=True):
+        """Add a frame after the current one, and show it.
+
+        Args:
+            copy (bool, optional): If True, the new frame is a copy of the current one.
+        """
+        self.end_stroke()
+        self.timeline.add_frame(copy)
+        self.show_frame(self.timeline.current)
+
+    def remove_frame(self):
+        """Remove the current frame, its actions are removed from the history.
+        The last frame can't be removed.
+        """
+        self.end_stroke()
+        stack = self.timeline.remove_frame()
+        if stack is None:
+            return
+        for layer in stack.layers:
+            self.history.forget(layer.doc)
+        self.show_frame(self.timeline.current)
+
+    def set_onion_skin(self, show):
+        """Show or hide the onion skin of the current frame.
+
+        Args:
+            show (bool): False for hiding.
+        """
+        self.onion_skin = show
+        self.scheduler.invalidate(0, 0, self.w, self.h)
+
+    def play(self, fps=None):
+        """Play the animation in a loop, until stop is called. Frames are shown with
+        show_frame, so only what differs between two frames is redrawn.
+
+        Args:
+            fps (int, optional): Frames per second, the one of the timeline if not given.
+        """
+        self.end_stroke()
+        self.stop()
+        if fps:
+            self.timeline.fps = fps
+        self.playing = self.after(max(1000 // self.timeline.fps, 1), self.play_step)
+        if self.onion_skin:
+            self.scheduler.invalidate(0, 0, self.w, self.h)
+
+    def play_step(self):
+        """Show the next frame, and schedule the one after it."""
+        self.playing = self.after(max(1000 // self.timeline.fps, 1), self.play_step)
+        self.show_frame(self.timeline.current + 1)
+
+    def stop(self):
+        """Stop playing the animation, the frame that is shown stays current."""
+        if self.playing is None:
+            return
+        self.after_cancel(self.playing)
+        self.playing = None
+        if self.onion_skin:
+            self.scheduler.invalidate(0, 0, self.w, self.h)
+
+    def export_stats(self, path):
+        """Write the event timings and the counters to a JSON file.
+
+        Args:
+            path (str): File name.
+        """
+        self.stats.export(path, self.get_counters())
+
     def get_dimensions(self):
         """Returns a string, containing dimensions of canvas, in painting pixels.
 
@@ -89,13 +1069,13 @@ class PPixelPaintingCanvas(Canvas):
             tuple: coordinates that form up a square.
             topx, topy, bottomx, bottom respectively.
         """
-        size = self.pp_pixel_size
+        size, sub = self.pp_pixel_size, self.subsample
         
-        px = x // size
-        py = y // size
+        px, py = self.to_cell(x, y)
         
-        topx, topy = px*size, py*size
-        bottomx, bottomy = (px+1)*size, (py+1)*size
+        # When zoomed out, the square is the single pixel that holds the painting pixel.
+        topx, topy = px*size // sub, py*size // sub
+        bottomx, bottomy = max((px+1)*size // sub, topx+1), max((py+1)*size // sub, topy+1)
         
         return (topx, topy, bottomx, bottomy)
     
@@ -111,9 +1091,9 @@ class PPixelPaintingCanvas(Canvas):
         """
         tx, ty, bx, by = square_coords[0], square_coords[1], square_coords[2], square_coords[3]
         
-        size = self.pp_pixel_size
-        x = ((tx + bx) // 2) // size
-        y = ((ty + by) // 2) // size
+        size, sub = self.pp_pixel_size, self.subsample
+        x = ((tx + bx) // 2)*sub // size
+        y = ((ty + by) // 2)*sub // size
         
         return (x, y)
     
@@ -127,7 +1107,7 @@ class PPixelPaintingCanvas(Canvas):
         Returns:
             bool: True if yes and False if no.
         """
-        if self.data[y][x] == (0, 0): 
+        if self.doc.get(x, y) == EMPTY:
             return False
         return True
 
@@ -141,17 +1121,12 @@ class PPixelPaintingCanvas(Canvas):
         Returns:
             bool: True if yes and False if no.
         """
-        if (x < 0) or (y < 0):
-            return False
-        try:
-            self.data[y][x]
-        except IndexError:
-            return False
-        return True
+        return self.doc.inside(x, y)
 
     def clicktools(self, event):
-        """Tools when clicked on canvas. Controlled using the self.tool_mode.
-        Tool modes are 0, 1, 2, 3 or paint, erase, color pick, fill.
+        """Tools when clicked on canvas. The press hook of the current tool is
+        called, and what it returns is written. Everything until the button is
+        released is a single action in the history.
 
         Args:
             event (tkinter input event): Used for getting coordinates.
@@ -168,163 +1143,166 @@ class PPixelPaintingCanvas(Canvas):
         # Testing x and y.
         if not self.iscoord_inside(x, y): return
 
-        # If painting...
-        if self.tool_mode == 0:
-            
-            # The procedure is simple: If the coordinate is not occupied, just create a new square there.
-            # But if it does, with different color, delete the old one and create a new with right color.
-            # Just skip if colors are also same.
-            if self.iscoord(x, y) == True:
-                p_color, p_id = self.data[y][x]
-
-                if p_color != self.color_hex:
-                    self.delete(p_id)
-                    new_id = self.create_rectangle(sqrc, fill=self.color_hex, outline='')
-                    self.data[y][x] = (self.color_hex, new_id)
-            
-            else:
-                new_id = self.create_rectangle(sqrc, fill=self.color_hex, outline='')
-                self.data[y][x] = (self.color_hex, new_id)
-        
-        # Erase tool.
-        elif self.tool_mode == 1:
-            
-            # Like the former, but deletes instead of painting.
-            if self.iscoord(x, y) == True:
-                p_color, p_id = self.data[y][x]
-                
-                self.delete(p_id)
-                self.data[y][x] = (0, 0)
-        
-        # Color picker.
-        elif self.tool_mode == 2:
-            
-            if self.iscoord(x, y) == True:
-                p_color, p_id = self.data[y][x]
-                
-                self.color_hex = p_color
-                self.event_generate('<<PickedColorChangeIndicator>>')
-                # Event is for informing the program for updating the indicator of paint tool.
-        
-        # The fill tool.
-        # Iterative algorithm actually works similar to the recursive one.
-        # So briefly, starting from the clicked position, iterates trough a list that contains "coordinates to fill."
-        # It starts with only one, the starting position. After painting this location, looks to the border coordinates
-        # and checks if they are suitable for painting. If so, then appends these coordinates to the list, too.
-        # The algo uses a for loop, so it does the same process repeatedly on all appended coordinates, like recursion.
-        # If the coord already exists in the list, skips. And the code ends, when it iterates over all the coordinates.
-        elif self.tool_mode == 3:
-            
-            # The list.
-            fill_list = [(rawx, rawy)]
-
-            # The color, that will be filled.
-            fill_area_color = self.data[y][x][0]
-
-            for rawx, rawy in fill_list:
-
-                sqrc = self.to_square_coords(rawx, rawy)
-                x, y = self.independent_coords(sqrc)
-
-                if self.iscoord(x, y) == True:
-                    p_color, p_id = self.data[y][x]
-
-                    if p_color != self.color_hex:
-                        self.delete(p_id)
-                        new_id = self.create_rectangle(sqrc, fill=self.color_hex, outline='')
-                        self.data[y][x] = (self.color_hex, new_id)
-                
-                else:
-                    new_id = self.create_rectangle(sqrc, fill=self.color_hex, outline='')
-                    self.data[y][x] = (self.color_hex, new_id)
-
-                # Checking if the coordinate is suitable or not. 
-                # 'try/expect' is to check if the index is out of range.
-                # 'not in list' part is, of course, only allows appending if doesn't exist.
-                # Lastly, 'x/y > 0' part is to prevent negative indexing.
-                s = self.pp_pixel_size
-                try:
-                    if self.data[y][x+1][0] == fill_area_color:
-                        if (rawx+s, rawy) not in fill_list:
-                            fill_list.append((rawx+s, rawy))
-                except IndexError:
-                    pass
-                try:
-                    if self.data[y][x-1][0] == fill_area_color and x > 0:
-                        if (rawx-s, rawy) not in fill_list:
-                            fill_list.append((rawx-s, rawy))
-                except IndexError:
-                    pass                            
-                try:
-                    if self.data[y+1][x][0] == fill_area_color:
-                        if (rawx, rawy+s) not in fill_list:
-                            fill_list.append((rawx, rawy+s))
-                except IndexError:
-                    pass                            
-                try:
-                    if self.data[y-1][x][0] == fill_area_color and y > 0:
-                            if (rawx, rawy-s) not in fill_list:
-                                fill_list.append((rawx, rawy-s))
-                except IndexError:
-                    pass                            
-                                                             
+        self.press(x, y)
+
+    def press(self, x, y):
+        """Start an action of the current tool, finishing the former one.
+
+        Args:
+            x (int): painting pixel coordinate
+            y (int): painting pixel coordinate
+        """
+        self.end_stroke()
+        self.pressed = True
+        self.history.begin()
+        self.write(self.tool.press(self, x, y))
+
+    def write(self, writes):
+        """Do the writes that a tool returned. Writes of the same color are
+        joined, so each color is a single bulk write.
+
+        Args:
+            writes (list): (spans, color) tuples, or None.
+        """
+        if not writes:
+            return
+        if len(writes) == 1 and self.symmetry is None:
+            self.doc.set_spans(*writes[0])
+            return
+
+        by_color = {}
+        for spans, color in writes:
+            by_color.setdefault(color, []).extend(spans)
+        for color, spans in by_color.items():
+            if len(writes) > 1:
+                spans = merge_spans(spans)
+            if self.symmetry is None:
+                self.doc.set_spans(spans, color)
+                continue
+            # The images are far from each other, so each part is informed as its own
+            # rectangle, instead of one that covers all of them.
+            for part in self.symmetry.split(spans):
+                self.doc.set_spans(part, color)
+
+    def set_symmetry(self, mode, folds=4):
+        """Make the painter, the eraser and the fill tool symmetric, or not.
+
+        Args:
+            mode (str): One of the PPixelSymmetry modes, or None for no symmetry.
+            folds (int, optional): Amount of images of the radial symmetry.
+        """
+        self.end_stroke()
+        self.symmetry_mode, self.symmetry_folds = mode, folds
+        self.symmetry = Symmetry(self.w, self.h, mode, folds) if mode is not None and self.w and self.h else None
+
     def motion_paint(self, event):
-        """Tools when clicking while moving the mouse. Painter and eraser
+        """Tools when clicking while moving the mouse, like the painter and the eraser.
+        The sample is only queued here. Queued samples are given to the tool and
+        written as one change, when tkinter is idle.
 
         Args:
             event (tkinter input event): Used for getting coordinates.
         """
-        rawx, rawy = int(self.canvasx(event.x)), int(self.canvasy(event.y))
-        sqrc = self.to_square_coords(rawx, rawy)
-        x, y = self.independent_coords(sqrc)
+        if not self.tool.drags:
+            return
 
-        # Testing x and y.
-        if not self.iscoord_inside(x, y): return
-        
-        if self.tool_mode == 0:
-            
-            if self.iscoord(x, y) == True:
-                p_color, p_id = self.data[y][x]
-
-                if p_color != self.color_hex:
-                    self.delete(p_id)
-                    new_id = self.create_rectangle(sqrc, fill=self.color_hex, outline='')
-                    self.data[y][x] = (self.color_hex, new_id)
-            
-            else:
-                new_id = self.create_rectangle(sqrc, fill=self.color_hex, outline='')
-                self.data[y][x] = (self.color_hex, new_id)     
-
-        elif self.tool_mode == 1:
-            
-            if self.iscoord(x, y) == True:
-                p_color, p_id = self.data[y][x]
-                
-                self.delete(p_id)
-                self.data[y][x] = (0, 0)   
+        self.pending_motion.append((int(self.canvasx(event.x)), int(self.canvasy(event.y))))
+        if self.motion_after is None:
+            self.motion_after = self.after_idle(self.stats.timed('stroke', self.flush_motion))
+
+    def flush_motion(self):
+        """Give the queued motion samples to the tool, and write them as one change."""
+        if self.motion_after is not None:
+            self.after_cancel(self.motion_after)
+            self.motion_after = None
+
+        samples, self.pending_motion = self.pending_motion, []
+        if not samples:
+            return
+
+        # A drag that started outside of the canvas starts the action now.
+        if not self.pressed:
+            self.pressed = True
+            self.history.begin()
+
+        # Mouse coordinates to painting pixels, these might be outside of the canvas.
+        writes = []
+        for rawx, rawy in samples:
+            writes.extend(self.tool.drag(self, *self.to_cell(rawx, rawy)) or ())
+        self.write(writes)
+
+    def end_stroke(self, event=0):
+        """Finish the current action, writing what is left in the queue.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.flush_motion()
+        if self.pressed:
+            self.write(self.tool.release(self))
+            self.history.commit()
+        self.pressed = False
+
+    def undo(self, event=0):
+        """Revert the last action. Only the changed rectangle is redrawn.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        self.history.undo()
+
+    def redo(self, event=0):
+        """Apply the last undone action again.
+
+        Args:
+            event (tkinter bind event): Not used.
+        """
+        self.end_stroke()
+        self.history.redo()
     
     def change_mode(self, mode):
-        """Change tool mode.
+        """Change the current tool.
 
         Args:
-            mode (int): Might be 0, 1, 2, 3
+            mode (int, str or Tool): A tool, the name of a tool in TOOLS, or one of
+            the old tool modes 0, 1, 2, 3, which are paint, erase, color pick, fill.
 
         Raises:
             ValueError: If mode is unknown.
         """
-        if mode not in (0, 1, 2, 3):
+        if isinstance(mode, int) and 0 <= mode < len(MODES):
+            mode = MODES[mode]
+        if isinstance(mode, str):
+            if mode not in TOOLS:
+                raise ValueError('Unknown mode!')
+            mode = TOOLS[mode]
+        if not isinstance(mode, Tool):
             raise ValueError('Unknown mode!')
-        self.tool_mode = mode
+
+        self.end_stroke()
+        self.tool = mode
 
         self.event_generate('<<ToolChanged>>')
         
     def get_mode(self):
-        """Returns the current tool mode.
+        """Returns the current tool.
 
         Returns:
-            int: Tool mode, so one of the following: 0, 1, 2, 3
+            Tool: The tool, its name and label are in tool.name and tool.label.
+        """
+        return self.tool
+
+    def set_brush(self, size=None, shape=None, mask=None):
+        """Change the brush of the painter and the eraser.
+
+        Args:
+            size (int, optional): width and height, the current one if not given.
+            shape (str, optional): 'square', 'circle' or 'custom', the current one if not given.
+            mask (list, optional): Rows of a custom brush.
         """
-        return self.tool_mode
+        self.end_stroke()
+        self.brush = Brush(size or self.brush.size, shape or self.brush.shape, mask)
         
     def getcolor(self):
         """Returns the hex of current painting color.
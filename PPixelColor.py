@@ -0,0 +1,85 @@
+# Colors are handled in two forms in the editor. Tk wants hex strings like '#1a2b3c',
+# while the engines work on packed integers in 0xRRGGBBAA form, so that comparing two
+# colors is a single integer compare. An empty (unpainted) painting pixel is EMPTY.
+
+EMPTY = 0
+
+
+def hex_to_rgba(color):
+    """Convert a tkinter hex color to a packed 0xRRGGBBAA integer.
+
+    Args:
+        color (str): Color as '#rrggbb' or '#rgb'. Also accepts 0 as empty.
+
+    Returns:
+        int: Packed color, always opaque unless the color is empty.
+    """
+    if not color:
+        return EMPTY
+
+    digits = color.lstrip('#')
+    if len(digits) == 3:
+        digits = ''.join(d*2 for d in digits)
+
+    return (int(digits[:6], 16) << 8) | 0xFF
+
+
+def rgba_to_hex(rgba):
+    """Convert a packed 0xRRGGBBAA integer back to a tkinter hex color.
+
+    Args:
+        rgba (int): Packed color.
+
+    Returns:
+        str: '#rrggbb', alpha is dropped. Empty returns 0, like the canvas does.
+    """
+    if rgba == EMPTY:
+        return 0
+    return '#%06x' % (rgba >> 8)
+
+
+def channels(rgba):
+    """Split a packed color into its channels.
+
+    Args:
+        rgba (int): Packed color.
+
+    Returns:
+        tuple: red, green, blue and alpha respectively.
+    """
+    return (rgba >> 24) & 0xFF, (rgba >> 16) & 0xFF, (rgba >> 8) & 0xFF, rgba & 0xFF
+
+
+def color_distance(a, b):
+    """The biggest difference between the channels of two colors.
+
+    Args:
+        a (int): Packed color.
+        b (int): Packed color.
+
+    Returns:
+        int: Between 0 and 255, 0 if colors are the same.
+    """
+    if a == b:
+        return 0
+    return max(abs(ca - cb) for ca, cb in zip(channels(a), channels(b)))
+
+
+class HexTable(dict):
+    """
+    A dictionary from packed colors to tkinter hex colors, which fills itself
+    on the first lookup of a color. Empty is shown as the given background color.
+    """
+    def __init__(self, empty):
+        """Create an empty table.
+
+        Args:
+            empty (str): Color that is used for empty painting pixels.
+        """
+        super().__init__()
+        self.empty = empty
+
+    def __missing__(self, rgba):
+        color = self.empty if rgba == EMPTY else rgba_to_hex(rgba)
+        self[rgba] = color
+        return color
@@ -0,0 +1,716 @@
+from array import array
+from PPixelColor import EMPTY
+
+# pixel -> pixel as we know
+# ppixel -> PIEpixel or PAINTING pixel
+
+# The document is split to square tiles of TILE x TILE painting pixels.
+TILE_SHIFT = 6
+TILE = 1 << TILE_SHIFT
+TILE_MASK = TILE - 1
+
+# Tiles store palette indexes. The item type of the tiles grows with the palette,
+# from one byte up to 256 colors, to two bytes up to 65536 colors, and four bytes after.
+INDEX_TYPES = (('B', 1 << 8), ('H', 1 << 16), ('I', 1 << 32))
+
+# Where the content stays when resizing, like the tkinter anchors, row by row.
+ANCHORS = ('nw', 'n', 'ne', 'w', 'center', 'e', 'sw', 's', 'se')
+
+
+def anchor_offset(old_w, old_h, w, h, anchor='nw'):
+    """Return where the old content goes when resizing, for an anchor.
+
+    Args:
+        old_w (int): width before resizing
+        old_h (int): height before resizing
+        w (int): new width
+        h (int): new height
+        anchor (str, optional): One of ANCHORS.
+
+    Raises:
+        ValueError: If the anchor is unknown.
+
+    Returns:
+        tuple: x and y offset of the old content in the resized document.
+    """
+    if anchor not in ANCHORS:
+        raise ValueError(f'Unknown anchor: {anchor}')
+    ox = 0 if 'w' in anchor else w - old_w if 'e' in anchor else (w - old_w) // 2
+    oy = 0 if 'n' in anchor else h - old_h if 's' in anchor else (h - old_h) // 2
+    return ox, oy
+
+
+class PPixelDocument():
+    """
+    The image that is being edited, without any tkinter parts. Painting pixels are
+    packed 0xRRGGBBAA colors, stored in 64x64 tiles. Each tile is a contiguous
+    array, row by row. A tile is only allocated when something is painted on it,
+    so the memory depends on the painted area, and a huge blank document is free.
+    Listeners are informed about every change with the rectangle that has changed,
+    so a view can redraw only that part.
+
+    The tiles don't store the colors, but indexes to the palette of the document,
+    so a painting pixel is a single byte until the document has more than 256 colors.
+    Every color is in the palette only once, so equal indexes mean equal colors.
+
+    A copy made with clone shares the tiles with the document. A shared tile is copied
+    only when one of the documents writes to it, so copies that differ a little, like
+    the frames of an animation, cost little more than a single document.
+    """
+    def __init__(self, w, h):
+        """Create an empty document.
+
+        Args:
+            w (int): width, in painting pixels
+            h (int): height, in painting pixels
+        """
+        self.w, self.h = w, h
+
+        # Tiles by (tile x, tile y). A missing tile is all empty.
+        # Keys of the tiles that might be shared with a clone, copied before writing.
+        self.tiles = {}
+        self.shared = set()
+
+        # Colors that are used, or were used, by the document. Index 0 is always EMPTY.
+        # color_index finds the index of a color, typecode is the item type of the tiles.
+        self.palette = [EMPTY]
+        self.color_index = {EMPTY: 0}
+        self.typecode = INDEX_TYPES[0][0]
+
+        # Functions that will be called as f(x0, y0, x1, y1) after a change.
+        self.listeners = []
+
+        # If it's not None, every change is reported to the recorder, as
+        # recorder.record(x, y, old, new) for a single painting pixel and as
+        # recorder.record_row(y, x, old_row, new_row) for a part of a row and as
+        # recorder.record_recolor(old, new) for a change of the palette.
+        # Used for the undo history.
+        self.recorder = None
+
+    def subscribe(self, listener):
+        """Start informing a function about the changes.
+
+        Args:
+            listener (function): Called with the changed rectangle, x1 and y1 are exclusive.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Stop informing a function about the changes.
+
+        Args:
+            listener (function): A function that was subscribed before.
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, x0, y0, x1, y1):
+        """Inform the listeners that a rectangle has changed.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        for listener in list(self.listeners):
+            listener(x0, y0, x1, y1)
+
+    def inside(self, x, y):
+        """Tests if x, y is inside the document boundaries.
+
+        Args:
+            x (int): coordinate
+            y (int): coordinate
+
+        Returns:
+            bool: True if yes and False if no.
+        """
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def intern(self, color):
+        """Return the palette index of a color, adding it to the palette if it's new.
+        If the palette doesn't fit to the item type of the tiles anymore, every
+        tile is converted to a bigger item type.
+
+        Args:
+            color (int): Packed color.
+
+        Returns:
+            int: Palette index.
+        """
+        index = self.color_index.get(color)
+        if index is not None:
+            return index
+
+        index = len(self.palette)
+        self.palette.append(color)
+        self.color_index[color] = index
+
+        for typecode, limit in INDEX_TYPES:
+            if index < limit:
+                break
+        if typecode != self.typecode:
+            self.typecode = typecode
+            for key, tile in self.tiles.items():
+                self.tiles[key] = array(typecode, tile)
+            self.shared.clear()
+        return index
+
+    def index_row(self, row):
+        """Convert packed colors to palette indexes, adding the new colors to the palette.
+
+        Args:
+            row (iterable): Packed colors.
+
+        Returns:
+            array: Palette indexes, with the item type of the tiles.
+        """
+        color_index = self.color_index
+        indexes = [color_index[color] if color in color_index else self.intern(color) for color in row]
+        # Interning might have changed the item type.
+        return array(self.typecode, indexes)
+
+    def clone(self):
+        """Copy the document, sharing the tiles. Listeners and the recorder are not copied.
+
+        Returns:
+            PPixelDocument: The copy.
+        """
+        doc = PPixelDocument(self.w, self.h)
+        doc.tiles = dict(self.tiles)
+        doc.palette = list(self.palette)
+        doc.color_index = dict(self.color_index)
+        doc.typecode = self.typecode
+
+        # Both documents copy a shared tile before writing to it.
+        self.shared = set(self.tiles)
+        doc.shared = set(self.tiles)
+        return doc
+
+    def own_tile(self, key):
+        """Copy a shared tile, so that it can be written.
+
+        Args:
+            key (tuple): tile coordinates
+
+        Returns:
+            array: The copy, which is only in this document.
+        """
+        tile = array(self.typecode, self.tiles[key])
+        self.tiles[key] = tile
+        self.shared.discard(key)
+        return tile
+
+    def tile_for_write(self, tx, ty):
+        """Return a tile that can be written, allocating it if it doesn't exist.
+
+        Args:
+            tx (int): tile coordinate
+            ty (int): tile coordinate
+
+        Returns:
+            array: Palette indexes of the tile, row by row.
+        """
+        tile = self.tiles.get((tx, ty))
+        if tile is None:
+            tile = array(self.typecode, bytes(TILE*TILE*array(self.typecode).itemsize))
+            self.tiles[(tx, ty)] = tile
+        elif (tx, ty) in self.shared:
+            tile = self.own_tile((tx, ty))
+        return tile
+
+    def get(self, x, y):
+        """Return the color of a painting pixel.
+
+        Args:
+            x (int): coordinate
+            y (int): coordinate
+
+        Returns:
+            int: Packed color, EMPTY if not painted.
+        """
+        tile = self.tiles.get((x >> TILE_SHIFT, y >> TILE_SHIFT))
+        if tile is None:
+            return EMPTY
+        return self.palette[tile[(y & TILE_MASK) << TILE_SHIFT | (x & TILE_MASK)]]
+
+    def get_index(self, x, y):
+        """Return the palette index of a painting pixel. Two painting pixels have
+        the same color if and only if their indexes are the same.
+
+        Args:
+            x (int): coordinate
+            y (int): coordinate
+
+        Returns:
+            int: Palette index, 0 if not painted.
+        """
+        tile = self.tiles.get((x >> TILE_SHIFT, y >> TILE_SHIFT))
+        if tile is None:
+            return 0
+        return tile[(y & TILE_MASK) << TILE_SHIFT | (x & TILE_MASK)]
+
+    def set(self, x, y, color):
+        """Set the color of a painting pixel.
+
+        Args:
+            x (int): coordinate
+            y (int): coordinate
+            color (int): Packed color, EMPTY for erasing.
+
+        Returns:
+            bool: True if the painting pixel has changed.
+        """
+        old = self.get(x, y)
+        if old == color:
+            return False
+        if self.recorder is not None:
+            self.recorder.record(x, y, old, color)
+        index = self.intern(color)
+        tile = self.tile_for_write(x >> TILE_SHIFT, y >> TILE_SHIFT)
+        tile[(y & TILE_MASK) << TILE_SHIFT | (x & TILE_MASK)] = index
+        self.notify(x, y, x+1, y+1)
+        return True
+
+    def set_many(self, cells, color):
+        """Set many painting pixels to the same color, as one change.
+
+        Args:
+            cells (iterable): (x, y) tuples.
+            color (int): Packed color, EMPTY for erasing.
+
+        Returns:
+            int: Number of the painting pixels that have changed.
+        """
+        index = self.intern(color)
+        tiles, recorder, palette, shared = self.tiles, self.recorder, self.palette, self.shared
+        changed = 0
+        x0 = y0 = None
+        key = tile = None
+
+        for x, y in cells:
+            # Consecutive cells are mostly on the same tile.
+            cell_key = (x >> TILE_SHIFT, y >> TILE_SHIFT)
+            if cell_key != key:
+                key = cell_key
+                tile = tiles.get(key)
+            i = (y & TILE_MASK) << TILE_SHIFT | (x & TILE_MASK)
+
+            if tile is None:
+                if color == EMPTY:
+                    continue
+                tile = self.tile_for_write(*key)
+            elif tile[i] == index:
+                continue
+            elif key in shared:
+                tile = self.own_tile(key)
+            if recorder is not None:
+                recorder.record(x, y, palette[tile[i]], color)
+            tile[i] = index
+            changed += 1
+
+            # Growing the changed rectangle.
+            if x0 is None:
+                x0, y0, x1, y1 = x, y, x+1, y+1
+            else:
+                x0, y0 = min(x0, x), min(y0, y)
+                x1, y1 = max(x1, x+1), max(y1, y+1)
+
+        if changed:
+            self.notify(x0, y0, x1, y1)
+        return changed
+
+    def set_spans(self, spans, color):
+        """Set horizontal spans to one color, as one change. Each span is written
+        as a single row slice, which is much cheaper than painting pixel by pixel.
+
+        Args:
+            spans (list): (y, x_start, x_end) tuples, x_end is exclusive. Like scanline_fill returns.
+            color (int): Packed color, EMPTY for erasing.
+        """
+        if not spans:
+            return
+
+        # Runs are written as palette indexes, only the recorder needs the colors.
+        index = self.intern(color)
+        put = self.put_row if self.recorder is not None else self.put_index_row
+        value = color if self.recorder is not None else index
+        typecode = 'I' if self.recorder is not None else self.typecode
+
+        runs = {}
+        for y, start, end in spans:
+            if end - start not in runs:
+                runs[end - start] = array(typecode, [value]) * (end - start)
+            put(y, start, runs[end - start])
+
+        self.notify(min(span[1] for span in spans), min(span[0] for span in spans),
+                    max(span[2] for span in spans), max(span[0] for span in spans) + 1)
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        """Set a rectangle to one color, row by row.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+            color (int): Packed color.
+        """
+        x0, y0, x1, y1 = self.clip(x0, y0, x1, y1)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        run = array('I', [color]) * (x1 - x0)
+        for y in range(y0, y1):
+            self.put_row(y, x0, run)
+
+        self.notify(x0, y0, x1, y1)
+
+    def clip(self, x0, y0, x1, y1):
+        """Clip a rectangle to the document boundaries.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+
+        Returns:
+            tuple: x0, y0, x1, y1 respectively.
+        """
+        return max(x0, 0), max(y0, 0), min(x1, self.w), min(y1, self.h)
+
+    def get_region(self, x0, y0, x1, y1):
+        """Copy a rectangle out of the document.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+
+        Returns:
+            array: Packed colors of the rectangle, row by row.
+        """
+        region = array('I')
+        for y in range(y0, y1):
+            region.extend(self.get_row(y, x0, x1))
+        return region
+
+    def blit(self, x, y, w, h, region, skip_empty=False):
+        """Copy a rectangle of packed colors into the document.
+        Parts that fall outside of the document are dropped.
+
+        Args:
+            x (int): left of the destination
+            y (int): top of the destination
+            w (int): width of the region
+            h (int): height of the region
+            region (array): Packed colors, row by row, like get_region returns.
+            skip_empty (bool, optional): If True, empty colors of the region don't overwrite.
+        """
+        x0, y0, x1, y1 = self.clip(x, y, x + w, y + h)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        for ry in range(y0, y1):
+            src = (ry - y)*w + (x0 - x)
+            row = region[src:src + x1 - x0]
+            if skip_empty:
+                old = self.get_row(ry, x0, x1)
+                for i, color in enumerate(row):
+                    if color == EMPTY:
+                        row[i] = old[i]
+            self.put_row(ry, x0, row)
+
+        self.notify(x0, y0, x1, y1)
+
+    def get_row(self, y, x0, x1, step=1):
+        """Copy a part of a row out of the document.
+
+        Args:
+            y (int): row
+            x0 (int): left
+            x1 (int): right, exclusive
+            step (int, optional): Only every step'th painting pixel is taken.
+
+        Returns:
+            array: Packed colors.
+        """
+        return array('I', map(self.palette.__getitem__, self.get_index_row(y, x0, x1, step)))
+
+    def get_index_row(self, y, x0, x1, step=1):
+        """Copy the palette indexes of a part of a row out of the document.
+
+        Args:
+            y (int): row
+            x0 (int): left
+            x1 (int): right, exclusive
+            step (int, optional): Only every step'th painting pixel is taken.
+
+        Returns:
+            array: Palette indexes, with the item type of the tiles.
+        """
+        row = array(self.typecode)
+        ty, start = y >> TILE_SHIFT, (y & TILE_MASK) << TILE_SHIFT
+
+        # Going over the tiles that the row crosses.
+        x = x0
+        while x < x1:
+            end = min((x | TILE_MASK) + 1, x1)
+            tile = self.tiles.get((x >> TILE_SHIFT, ty))
+            if tile is None:
+                row.extend(array(self.typecode, [0]) * (end - x))
+            else:
+                row.extend(tile[start + (x & TILE_MASK):start + ((end - 1) & TILE_MASK) + 1])
+            x = end
+
+        if step != 1:
+            return row[::step]
+        return row
+
+    def put_row(self, y, x0, row):
+        """Write a part of a row, without informing the listeners.
+        Doesn't allocate tiles for parts that are empty and stay empty.
+
+        Args:
+            y (int): row
+            x0 (int): left
+            row (array): Packed colors.
+        """
+        if self.recorder is not None:
+            self.recorder.record_row(y, x0, self.get_row(y, x0, x0 + len(row)), array('I', row))
+        self.put_index_row(y, x0, self.index_row(row))
+
+    def put_index_row(self, y, x0, row):
+        """Write palette indexes to a part of a row, without recording or informing the listeners.
+
+        Args:
+            y (int): row
+            x0 (int): left
+            row (array): Palette indexes, with the item type of the tiles.
+        """
+        ty, start = y >> TILE_SHIFT, (y & TILE_MASK) << TILE_SHIFT
+        empty = None
+
+        x, x1 = x0, x0 + len(row)
+        while x < x1:
+            end = min((x | TILE_MASK) + 1, x1)
+            part = row[x - x0:end - x0]
+            tile = self.tiles.get((x >> TILE_SHIFT, ty))
+            if tile is None:
+                if empty is None or len(empty) != len(part):
+                    empty = array(self.typecode, [0]) * len(part)
+                if part == empty:
+                    x = end
+                    continue
+                tile = self.tile_for_write(x >> TILE_SHIFT, ty)
+            elif (x >> TILE_SHIFT, ty) in self.shared:
+                # A shared tile is only copied if the row really changes it.
+                if tile[start + (x & TILE_MASK):start + ((end - 1) & TILE_MASK) + 1] == part:
+                    x = end
+                    continue
+                tile = self.own_tile((x >> TILE_SHIFT, ty))
+            tile[start + (x & TILE_MASK):start + ((end - 1) & TILE_MASK) + 1] = part
+            x = end
+
+    def color_bounds(self, color, rect=None):
+        """Find the tiles that have a color, for redrawing only that part.
+
+        Args:
+            color (int): Packed color.
+            rect (tuple, optional): x0, y0, x1, y1 respectively, only tiles in it are looked at.
+
+        Returns:
+            tuple: x0, y0, x1, y1 of the tiles, clipped to the document and the rectangle,
+            or None if no tile has the color. Empty is in every missing tile, so it's the
+            whole rectangle.
+        """
+        x0, y0, x1, y1 = self.clip(*(rect or (0, 0, self.w, self.h)))
+        index = self.color_index.get(color)
+        if index is None or x0 >= x1 or y0 >= y1:
+            return None
+        if color == EMPTY:
+            return x0, y0, x1, y1
+
+        keys = [key for key, tile in self.tiles.items()
+                if x0 >> TILE_SHIFT <= key[0] <= (x1 - 1) >> TILE_SHIFT
+                and y0 >> TILE_SHIFT <= key[1] <= (y1 - 1) >> TILE_SHIFT and index in tile]
+        if not keys:
+            return None
+        return (max(min(key[0] for key in keys) << TILE_SHIFT, x0), max(min(key[1] for key in keys) << TILE_SHIFT, y0),
+                min((max(key[0] for key in keys) + 1) << TILE_SHIFT, x1), min((max(key[1] for key in keys) + 1) << TILE_SHIFT, y1))
+
+    def replace_color(self, old, new, rect=None):
+        """Change every painting pixel of a color to another color, in the whole
+        document or in a rectangle. Only the tiles with the old color are touched,
+        and only their part is reported to the listeners.
+
+        If the new color is not in the palette and there is no rectangle, this only
+        changes the palette entry, without touching the painting pixels. Otherwise the
+        painting pixels of the old color are changed to the index of the new one, tile
+        by tile. The recorder gets the palette change as recorder.record_recolor(old, new),
+        or the rows as usual if the painting pixels were changed.
+
+        Args:
+            old (int): Packed color to replace.
+            new (int): Packed color to replace with.
+            rect (tuple, optional): x0, y0, x1, y1 respectively, x1 and y1 are exclusive.
+
+        Returns:
+            bool: True if anything has changed.
+        """
+        if rect is not None and self.clip(*rect) == (0, 0, self.w, self.h):
+            rect = None
+        bounds = self.color_bounds(old, rect)
+        if old == new or bounds is None:
+            return False
+
+        # Empty is also every painting pixel of the missing tiles, so it's replaced row by row.
+        if old == EMPTY:
+            x0, y0, x1, y1 = bounds
+            changed = False
+            for y in range(y0, y1):
+                row = self.get_row(y, x0, x1)
+                if old in row:
+                    self.put_row(y, x0, array('I', [new if color == old else color for color in row]))
+                    changed = True
+            if changed:
+                self.notify(*bounds)
+            return changed
+
+        index = self.color_index[old]
+        if rect is None and new not in self.color_index:
+            self.palette[index] = new
+            del self.color_index[old]
+            self.color_index[new] = index
+            if self.recorder is not None:
+                self.recorder.record_recolor(old, new)
+            self.notify(*bounds)
+            return True
+
+        target = self.intern(new)
+        x0, y0, x1, y1 = bounds
+        changed = False
+        if self.typecode == 'B':
+            table = bytes(range(256)).replace(bytes([index]), bytes([target]))
+
+        for (tx, ty), tile in list(self.tiles.items()):
+            left, top = tx << TILE_SHIFT, ty << TILE_SHIFT
+            if not (x0 < left + TILE and left < x1 and y0 < top + TILE and top < y1) or index not in tile:
+                continue
+
+            # The part of the tile that is replaced.
+            rx0, rx1 = max(x0, left) - left, min(x1, left + TILE) - left
+            ry0, ry1 = max(y0, top) - top, min(y1, top + TILE) - top
+            if self.recorder is not None:
+                # Recording the changed rows, so that undo can tell the two colors apart.
+                for ry in range(ry0, ry1):
+                    row = self.get_row(top + ry, left + rx0, left + rx1)
+                    if old in row:
+                        self.recorder.record_row(top + ry, left + rx0, array('I', row),
+                                                 array('I', [new if c == old else c for c in row]))
+
+            if (rx0, ry0, rx1, ry1) == (0, 0, TILE, TILE):
+                changed = True
+                self.shared.discard((tx, ty))
+                if self.typecode == 'B':
+                    self.tiles[(tx, ty)] = array('B', tile.tobytes().translate(table))
+                else:
+                    self.tiles[(tx, ty)] = array(self.typecode, [target if i == index else i for i in tile])
+                continue
+
+            for ry in range(ry0, ry1):
+                start = ry << TILE_SHIFT
+                part = tile[start + rx0:start + rx1]
+                if index in part:
+                    # Shared tiles are copied before the first write.
+                    tile = self.tile_for_write(tx, ty)
+                    changed = True
+                    tile[start + rx0:start + rx1] = array(self.typecode, [target if i == index else i for i in part])
+
+        if changed:
+            self.notify(*bounds)
+        return changed
+
+    def resize(self, w, h, ox=0, oy=0):
+        """Change the size of the document, keeping the painting pixels. The old
+        content is moved by ox, oy, the parts that fall outside are dropped and the
+        new parts are empty. Listeners are not informed, since the size has changed.
+
+        If the offset is a multiple of the tile size, like when the top left is kept,
+        the tiles are kept too, and only the tiles on the new edges are touched.
+        Otherwise the rows are copied as palette indexes.
+
+        Args:
+            w (int): new width, in painting pixels
+            h (int): new height, in painting pixels
+            ox (int, optional): x offset of the old content, negative crops from the left.
+            oy (int, optional): y offset of the old content, negative crops from the top.
+        """
+        old_w, old_h = self.w, self.h
+        tiles = self.tiles
+
+        if not ox & TILE_MASK and not oy & TILE_MASK:
+            tx_shift, ty_shift = ox >> TILE_SHIFT, oy >> TILE_SHIFT
+            self.tiles = {}
+            for (tx, ty), tile in tiles.items():
+                tx, ty = tx + tx_shift, ty + ty_shift
+                if 0 <= tx << TILE_SHIFT < w and 0 <= ty << TILE_SHIFT < h:
+                    self.tiles[(tx, ty)] = tile
+            self.w, self.h = w, h
+
+            # Tiles on the edges might have painting pixels outside of the document now,
+            # outside of the new size or the old one. Those are cleared, so that they
+            # don't show up after growing again.
+            x1, y1 = min(w, old_w + ox), min(h, old_h + oy)
+            zeros = array(self.typecode, [0]) * TILE
+            self.shared = {(tx + tx_shift, ty + ty_shift) for tx, ty in self.shared}
+            for (tx, ty), tile in list(self.tiles.items()):
+                left, top = tx << TILE_SHIFT, ty << TILE_SHIFT
+                x0, y0 = max(ox, left), max(oy, top)
+                if x0 == left and y0 == top and left + TILE <= x1 and top + TILE <= y1:
+                    continue
+                if (tx, ty) in self.shared:
+                    tile = self.own_tile((tx, ty))
+                for ry in range(TILE):
+                    start = ry << TILE_SHIFT
+                    if y0 <= top + ry < y1:
+                        tile[start:start + max(x0 - left, 0)] = zeros[:max(x0 - left, 0)]
+                        cut = min(max(x1 - left, 0), TILE)
+                        tile[start + cut:start + TILE] = zeros[:TILE - cut]
+                    else:
+                        tile[start:start + TILE] = zeros
+            return
+
+        # A document over the old tiles, for reading them.
+        source = PPixelDocument(old_w, old_h)
+        source.tiles, source.typecode = tiles, self.typecode
+
+        self.tiles = {}
+        self.shared = set()
+        self.w, self.h = w, h
+        x0, x1 = max(0, -ox), min(old_w, w - ox)
+        if x0 >= x1:
+            return
+        for y in range(max(0, -oy), min(old_h, h - oy)):
+            self.put_index_row(y + oy, x0 + ox, source.get_index_row(y, x0, x1))
+
+    def rows(self):
+        """Iterate over the rows of the document.
+
+        Yields:
+            array: Packed colors of a row.
+        """
+        for y in range(self.h):
+            yield self.get_row(y, 0, self.w)
+
+    def nbytes(self):
+        """Memory used by the painting pixels.
+
+        Returns:
+            int: Size in bytes, with the palette.
+        """
+        return (sum(tile.itemsize * len(tile) for tile in self.tiles.values())
+                + 4*len(self.palette))
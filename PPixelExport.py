@@ -0,0 +1,262 @@
+import json
+import math
+import os
+from array import array
+from PPixelColor import EMPTY
+from PPixelPNG import PNGWriter, document_palette
+
+# Exporting documents bigger than they are, and packing many documents into a sprite
+# sheet. Every painting pixel becomes a square of scale x scale pixels. The images are
+# made row by row and written to the file at once, so a big export never has the whole
+# image in memory, only a row of it. A row that is the same as the one above is written
+# with PNG filter 2, which makes it all zeros.
+
+
+def upscale_row(row, scale):
+    """Repeat every item of a row.
+
+    Args:
+        row (array or bytearray): Packed colors or palette indexes.
+        scale (int): Times every item is repeated.
+
+    Returns:
+        array or bytearray: The row, scale times longer.
+    """
+    if scale == 1:
+        return row
+    wide = row*scale
+    for i in range(scale):
+        wide[i::scale] = row
+    return wide
+
+
+def export_palette(docs, mode='auto'):
+    """Find the palette of a PNG file that has some documents.
+
+    Args:
+        docs (list): PPixelDocuments.
+        mode (str, optional): 'rgba', 'palette' or 'auto', like in write_png.
+
+    Raises:
+        ValueError: If the mode is unknown, or palette is asked with too many colors.
+
+    Returns:
+        list: Packed colors, or None for an RGBA file.
+    """
+    if mode not in ('rgba', 'palette', 'auto'):
+        raise ValueError('Unknown mode!')
+    if mode == 'rgba':
+        return None
+
+    colors = {EMPTY}
+    for doc in docs:
+        palette = document_palette(doc)
+        if palette is not None:
+            colors.update(palette)
+        if palette is None or len(colors) > 256:
+            if mode == 'palette':
+                raise ValueError('The documents have more than 256 colors!')
+            return None
+    return sorted(colors)
+
+
+def write_scaled_png(path, doc, scale, mode='auto'):
+    """Save a document as a PNG file, every painting pixel as scale x scale pixels.
+
+    Args:
+        path (str): File name.
+        doc (PPixelDocument): The document.
+        scale (int): Size of a painting pixel in the file, in pixels.
+        mode (str, optional): 'rgba', 'palette' or 'auto', like in write_png.
+
+    Raises:
+        ValueError: If the mode is unknown, or palette is asked with too many colors.
+    """
+    palette = export_palette([doc], mode)
+    with open(path, 'wb') as file:
+        writer = PNGWriter(file, doc.w*scale, doc.h*scale, palette=palette)
+        index = writer.index.__getitem__ if palette is not None else None
+        for row in doc.rows():
+            if index is not None:
+                row = bytearray(map(index, row))
+            writer.write_row(upscale_row(row, scale))
+            for _ in range(scale - 1):
+                writer.repeat_row()
+        writer.close()
+
+
+class MaxRects():
+    """
+    Packs rectangles into a bin with the MaxRects algorithm. The free space is kept
+    as the list of the biggest free rectangles, which can overlap. A rectangle goes
+    to the lowest place where it fits, then to the leftmost one.
+    """
+    def __init__(self, w, h):
+        """Create an empty bin.
+
+        Args:
+            w (int): width
+            h (int): height
+        """
+        self.w, self.h = w, h
+        self.free = [(0, 0, w, h)]
+
+    def insert(self, w, h):
+        """Place a rectangle.
+
+        Args:
+            w (int): width
+            h (int): height
+
+        Returns:
+            tuple: x and y of the rectangle, or None if it doesn't fit.
+        """
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw and h <= fh and (best is None or (fy, fx) < (best[1], best[0])):
+                best = fx, fy
+        if best is not None:
+            self.place(*best, w, h)
+        return best
+
+    def place(self, x, y, w, h):
+        """Take a rectangle out of the free space.
+
+        Args:
+            x (int): left
+            y (int): top
+            w (int): width
+            h (int): height
+        """
+        x1, y1 = x + w, y + h
+        free = []
+        for rect in self.free:
+            fx, fy, fw, fh = rect
+            fx1, fy1 = fx + fw, fy + fh
+            if x >= fx1 or x1 <= fx or y >= fy1 or y1 <= fy:
+                free.append(rect)
+                continue
+
+            # The parts of the free rectangle around the placed one.
+            if x > fx:
+                free.append((fx, fy, x - fx, fh))
+            if x1 < fx1:
+                free.append((x1, fy, fx1 - x1, fh))
+            if y > fy:
+                free.append((fx, fy, fw, y - fy))
+            if y1 < fy1:
+                free.append((fx, y1, fw, fy1 - y1))
+
+        # A free rectangle inside another one is not needed.
+        free.sort(key=lambda rect: rect[2]*rect[3], reverse=True)
+        self.free = []
+        for rect in free:
+            fx, fy, fw, fh = rect
+            if not any(fx >= ox and fy >= oy and fx + fw <= ox + ow and fy + fh <= oy + oh
+                       for ox, oy, ow, oh in self.free):
+                self.free.append(rect)
+
+
+def pack_rects(sizes, padding=0, tries=8):
+    """Pack rectangles into a sheet that is as small as possible. Some widths are
+    tried, starting from a square, and the sheet with the smallest area is kept.
+
+    Args:
+        sizes (list): (width, height) of every rectangle.
+        padding (int, optional): Space between the rectangles.
+        tries (int, optional): Amount of widths that are tried.
+
+    Returns:
+        tuple: width and height of the sheet, and (x, y) of every rectangle.
+    """
+    if not sizes:
+        return 0, 0, []
+
+    # Taller rectangles first, they are the hardest to place.
+    order = sorted(range(len(sizes)), key=lambda i: (sizes[i][1], sizes[i][0]), reverse=True)
+    area = sum((w + padding)*(h + padding) for w, h in sizes)
+    widest = max(w for w, _ in sizes) + padding
+    side = max(widest, math.isqrt(area))
+    tallest = sum(h + padding for _, h in sizes)
+
+    best = None
+    for i in range(tries):
+        width = max(widest, side + side*i // tries)
+        packer = MaxRects(width, tallest)
+        places = [None]*len(sizes)
+        for j in order:
+            w, h = sizes[j]
+            places[j] = packer.insert(w + padding, h + padding)
+
+        sheet_w = max(x + w for (x, _), (w, _) in zip(places, sizes))
+        sheet_h = max(y + h for (_, y), (_, h) in zip(places, sizes))
+        if best is None or sheet_w*sheet_h < best[0]*best[1]:
+            best = sheet_w, sheet_h, places
+    return best
+
+
+def write_sprite_sheet(path, docs, names, scale=1, padding=1, mode='auto', meta=None):
+    """Pack documents into a PNG file, and describe their places in a JSON atlas
+    next to it, with the same name and the .json extension.
+
+    Args:
+        path (str): File name of the sheet.
+        docs (list): PPixelDocuments.
+        names (list): Name of every document in the atlas.
+        scale (int, optional): Size of a painting pixel in the file, in pixels.
+        padding (int, optional): Empty pixels between the documents.
+        mode (str, optional): 'rgba', 'palette' or 'auto', like in write_png.
+        meta (dict, optional): More information to put in the atlas, like the frame rate.
+
+    Raises:
+        ValueError: If the mode is unknown, or palette is asked with too many colors.
+
+    Returns:
+        dict: The atlas.
+    """
+    sizes = [(doc.w*scale, doc.h*scale) for doc in docs]
+    w, h, places = pack_rects(sizes, padding)
+    palette = export_palette(docs, mode)
+
+    # The documents by their top row, they are written while the rows pass over them.
+    starts = sorted(range(len(docs)), key=lambda i: places[i][1])
+    active = []
+    last = None
+
+    # The scaled row of every document that is being written, by document.
+    scaled = {}
+
+    with open(path, 'wb') as file:
+        writer = PNGWriter(file, max(w, 1), max(h, 1), palette=palette)
+        empty = array('I', [EMPTY])*max(w, 1)
+        for y in range(max(h, 1)):
+            while starts and places[starts[0]][1] == y:
+                active.append(starts.pop(0))
+            for i in active:
+                if y >= places[i][1] + sizes[i][1]:
+                    del scaled[i]
+            active = [i for i in active if y < places[i][1] + sizes[i][1]]
+
+            row = array('I', empty)
+            for i in active:
+                x, top = places[i]
+                source = (y - top) // scale
+                if i not in scaled or scaled[i][0] != source:
+                    scaled[i] = source, upscale_row(docs[i].get_row(source, 0, docs[i].w), scale)
+                row[x:x + sizes[i][0]] = scaled[i][1]
+
+            if row == last:
+                writer.repeat_row()
+            else:
+                writer.write_colors(row)
+                last = row
+        writer.close()
+
+    atlas = {
+        'frames': [{'filename': name, 'frame': {'x': x, 'y': y, 'w': sw, 'h': sh}}
+                   for name, (x, y), (sw, sh) in zip(names, places, sizes)],
+        'meta': {'image': os.path.basename(path), 'size': {'w': w, 'h': h}, 'scale': scale, **(meta or {})},
+    }
+    with open(os.path.splitext(path)[0] + '.json', 'w') as file:
+        json.dump(atlas, file, indent=1)
+    return atlas
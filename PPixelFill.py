@@ -0,0 +1,101 @@
+from PPixelColor import color_distance
+
+# A flood fill engine that works on painting pixel indices, not on mouse coordinates.
+# It doesn't know about tkinter, the pixels are read using a sample function, so it can
+# run on anything that has colors at x, y. Nothing is written by the engine, it only
+# returns the horizontal spans that should be filled, and the caller writes them at once.
+
+
+def scanline_fill(w, h, x, y, sample, connectivity=4, tolerance=0):
+    """Find the area to fill, starting from x, y.
+
+    The algorithm is a span (scanline) fill. A seed is expanded to the left and right
+    as far as the color matches, which gives a span. Then the rows above and below
+    the span are scanned, and a new seed is pushed for every matching run found there.
+    A visited bitmap makes sure that every painting pixel is checked only once, so the
+    cost is linear in the size of the area.
+
+    Args:
+        w (int): width
+        h (int): height
+        x (int): starting coordinate
+        y (int): starting coordinate
+        sample (function): sample(x, y) returns the color at x, y as a packed int.
+        connectivity (int, optional): 4 or 8. With 8, diagonal neighbours are also filled.
+        tolerance (int, optional): Biggest channel difference that still counts as the
+        same color. 0 means only the exact color.
+
+    Raises:
+        ValueError: If connectivity is unknown.
+
+    Returns:
+        list: Spans as (y, x_start, x_end) tuples, x_end is exclusive.
+    """
+    if connectivity not in (4, 8):
+        raise ValueError('Connectivity should be 4 or 8!')
+
+    if not (0 <= x < w and 0 <= y < h):
+        return []
+
+    target = sample(x, y)
+
+    if tolerance:
+        def matches(px, py):
+            return color_distance(sample(px, py), target) <= tolerance
+    else:
+        def matches(px, py):
+            return sample(px, py) == target
+
+    # Diagonal neighbours of a span are one pixel outside of it.
+    reach = 1 if connectivity == 8 else 0
+
+    visited = bytearray(w*h)
+    spans = []
+    seeds = [(x, y)]
+
+    while seeds:
+        sx, sy = seeds.pop()
+        row = sy*w
+        if visited[row + sx]:
+            continue
+
+        # Expanding the seed to a span.
+        left = sx
+        while left > 0 and not visited[row + left - 1] and matches(left - 1, sy):
+            left -= 1
+        right = sx + 1
+        while right < w and not visited[row + right] and matches(right, sy):
+            right += 1
+
+        visited[row + left:row + right] = b'\x01' * (right - left)
+        spans.append((sy, left, right))
+
+        # Looking for runs in the rows above and below.
+        start = max(left - reach, 0)
+        end = min(right + reach, w)
+        for ny in (sy - 1, sy + 1):
+            if not 0 <= ny < h:
+                continue
+            nrow = ny*w
+            inside_run = False
+            for nx in range(start, end):
+                if not visited[nrow + nx] and matches(nx, ny):
+                    if not inside_run:
+                        seeds.append((nx, ny))
+                        inside_run = True
+                else:
+                    inside_run = False
+
+    return spans
+
+
+def span_cells(spans):
+    """Expand spans to single painting pixel coordinates.
+
+    Args:
+        spans (list): Spans as (y, x_start, x_end) tuples.
+
+    Returns:
+        list: (x, y) tuples.
+    """
+    return [(x, y) for y, start, end in spans for x in range(start, end)]
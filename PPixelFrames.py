@@ -0,0 +1,278 @@
+from array import array
+from PPixelColor import EMPTY
+from PPixelDocument import PPixelDocument
+from PPixelLayers import LayerStack, blend_row
+
+# Animation frames. Every frame is a LayerStack, and a new frame is a clone of another
+# one, so the frames share every tile that they don't change. Frames that share a tile
+# look the same there, which is also how playback finds the part that has to be redrawn.
+
+
+def changed_tiles(a, b):
+    """Find the tiles where two frames might look different.
+
+    Args:
+        a (LayerStack): A frame.
+        b (LayerStack): Another frame, with the same size.
+
+    Returns:
+        set: (tile x, tile y) keys, or None if the frames differ everywhere,
+        like when their layers are different.
+    """
+    if len(a.layers) != len(b.layers) or a.current != b.current:
+        return None
+
+    keys = set()
+    for la, lb in zip(a.layers, b.layers):
+        if (la.visible, la.opacity) != (lb.visible, lb.opacity):
+            return None
+        if not la.visible:
+            continue
+
+        # The same tile has the same indexes, which are the same colors only if the palettes agree.
+        pa, pb = la.doc.palette, lb.doc.palette
+        n = min(len(pa), len(pb))
+        if pa[:n] != pb[:n]:
+            return None
+
+        ta, tb = la.doc.tiles, lb.doc.tiles
+        for key in ta.keys() | tb.keys():
+            if ta.get(key) is not tb.get(key):
+                keys.add(key)
+    return keys
+
+
+class Timeline():
+    """
+    The frames of an animation, the current frame and the playback speed. The onion
+    skin of a frame, the frames around it faded, is composited once and cached until
+    one of those frames changes.
+    """
+    def __init__(self, stack, fps=12):
+        """Create a timeline with a single frame.
+
+        Args:
+            stack (LayerStack): The first frame.
+            fps (int, optional): Frames per second of the playback.
+        """
+        self.w, self.h = stack.w, stack.h
+        self.frames = []
+        self.current = 0
+        self.fps = fps
+
+        # The onion skin shows this many frames before and after the current one, with this opacity.
+        self.onion_before = self.onion_after = 1
+        self.onion_opacity = 96
+
+        # Cached onion skins by frame index, None if a frame has no neighbours.
+        self.onions = {}
+
+        # The functions that the frames inform, by frame.
+        self.watchers = {}
+
+        # Functions that will be called as f(x0, y0, x1, y1) after the onion skin
+        # of the current frame has changed.
+        self.listeners = []
+
+        self.insert_frame(0, stack)
+
+    def subscribe(self, listener):
+        """Start informing a function about the changes of the current onion skin.
+
+        Args:
+            listener (function): Called with the changed rectangle, x1 and y1 are exclusive.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Stop informing a function about the changes.
+
+        Args:
+            listener (function): A function that was subscribed before.
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def current_frame(self):
+        """Return the current frame.
+
+        Returns:
+            LayerStack: The layers of the frame.
+        """
+        return self.frames[self.current]
+
+    def insert_frame(self, index, stack):
+        """Put a frame to the timeline.
+
+        Args:
+            index (int): Index of the new frame.
+            stack (LayerStack): The frame.
+        """
+        watcher = lambda x0, y0, x1, y1: self.frame_changed(stack)
+        self.watchers[stack] = watcher
+        stack.subscribe(watcher)
+        self.frames.insert(index, stack)
+        self.onions.clear()
+
+    def add_frame(self, copy=True):
+        """Add a frame after the current one, and make it current.
+
+        Args:
+            copy (bool, optional): If True, the new frame is a copy of the current one,
+            sharing its tiles. Otherwise it's a single empty layer.
+
+        Returns:
+            LayerStack: The new frame.
+        """
+        if copy:
+            stack = self.frames[self.current].clone()
+        else:
+            stack = LayerStack(PPixelDocument(self.w, self.h))
+        self.current += 1
+        self.insert_frame(self.current, stack)
+        return stack
+
+    def remove_frame(self, index=None):
+        """Remove a frame. The last frame can't be removed.
+
+        Args:
+            index (int, optional): Index of the frame, the current one if not given.
+
+        Returns:
+            LayerStack: The removed frame, or None if it's the last one.
+        """
+        if len(self.frames) == 1:
+            return None
+        if index is None:
+            index = self.current
+        stack = self.frames.pop(index)
+        stack.unsubscribe(self.watchers.pop(stack))
+        if self.current >= index:
+            self.current = max(self.current - 1, 0)
+        self.onions.clear()
+        return stack
+
+    def move_frame(self, index, to):
+        """Move a frame to another place. The current frame stays current.
+
+        Args:
+            index (int): Index of the frame.
+            to (int): New index of the frame.
+        """
+        to = min(max(to, 0), len(self.frames) - 1)
+        if index == to:
+            return
+        current = self.frames[self.current]
+        self.frames.insert(to, self.frames.pop(index))
+        self.current = self.frames.index(current)
+        self.onions.clear()
+
+    def set_current(self, index):
+        """Change the current frame.
+
+        Args:
+            index (int): Index of the frame, it wraps around.
+        """
+        self.current = index % len(self.frames)
+
+    def neighbours(self, index):
+        """Return the frames of the onion skin of a frame.
+
+        Args:
+            index (int): Index of the frame.
+
+        Returns:
+            list: Frame indexes, from the first to the last.
+        """
+        before = range(max(index - self.onion_before, 0), index)
+        after = range(index + 1, min(index + self.onion_after + 1, len(self.frames)))
+        return list(before) + list(after)
+
+    def onion(self, index=None):
+        """Return the onion skin of a frame, composited if it's not cached.
+
+        Args:
+            index (int, optional): Index of the frame, the current one if not given.
+
+        Returns:
+            PPixelDocument: The faded frames around the frame, or None if there are none.
+        """
+        if index is None:
+            index = self.current
+        if index in self.onions:
+            return self.onions[index]
+
+        frames = [self.frames[i] for i in self.neighbours(index)]
+        doc = None
+        if frames:
+            doc = PPixelDocument(self.w, self.h)
+            empty = array('I', [EMPTY]) * self.w
+            for y in range(self.h):
+                row = empty
+                for frame in frames:
+                    row = blend_row(row, frame.get_row(y, 0, self.w), self.onion_opacity)
+                doc.put_row(y, 0, row)
+        self.onions[index] = doc
+        return doc
+
+    def set_onion(self, before=None, after=None, opacity=None):
+        """Change the onion skin. The cached ones are dropped.
+
+        Args:
+            before (int, optional): Amount of frames before the current one.
+            after (int, optional): Amount of frames after the current one.
+            opacity (int, optional): Opacity of the frames, 0-255.
+        """
+        if before is not None:
+            self.onion_before = before
+        if after is not None:
+            self.onion_after = after
+        if opacity is not None:
+            self.onion_opacity = opacity
+        self.onions.clear()
+
+    def frame_changed(self, stack):
+        """Called by a frame after a change. The onion skins that show the frame are dropped.
+
+        Args:
+            stack (LayerStack): The frame that has changed.
+        """
+        index = self.frames.index(stack)
+        for i in list(self.onions):
+            if index in self.neighbours(i):
+                del self.onions[i]
+                if i == self.current:
+                    for listener in list(self.listeners):
+                        listener(0, 0, self.w, self.h)
+
+    def resize(self, w, h, ox=0, oy=0):
+        """Change the size of every frame, keeping the painting pixels.
+
+        Args:
+            w (int): new width, in painting pixels
+            h (int): new height, in painting pixels
+            ox (int, optional): x offset of the old content, negative crops from the left.
+            oy (int, optional): y offset of the old content, negative crops from the top.
+        """
+        for stack in self.frames:
+            stack.resize(w, h, ox, oy)
+        self.w, self.h = w, h
+        self.onions.clear()
+
+    def nbytes(self):
+        """Memory used by the frames. Tiles that are shared by frames are counted once.
+
+        Returns:
+            int: Size in bytes.
+        """
+        tiles = {}
+        size = 0
+        for stack in self.frames:
+            for doc in stack.documents():
+                size += 4*len(doc.palette)
+                for tile in doc.tiles.values():
+                    tiles[id(tile)] = tile.itemsize * len(tile)
+        for doc in self.onions.values():
+            if doc is not None:
+                size += doc.nbytes()
+        return size + sum(tiles.values())
@@ -0,0 +1,322 @@
+from array import array
+
+# Undo and redo. Every tool action is stored as a delta, not as a snapshot: only the
+# painting pixels that have changed, with their old and new colors. The changes are
+# run-length encoded along the rows, so a fill of a big area is only a few runs.
+# A change of a palette color is stored as the two colors only.
+
+
+class Delta():
+    """
+    Changes of a single action, as runs. A run is a horizontal line of painting
+    pixels that had the same old color and got the same new color. Or palette
+    changes, as (old, new) color pairs.
+    """
+    # Each run is five numbers: y, x, length, old color, new color.
+    RUN_SIZE = 5
+
+    def __init__(self, lines, recolors=(), doc=None):
+        """Encode the changes of an action.
+
+        Args:
+            lines (list): (y, x, old_row, new_row) tuples, sorted and not overlapping.
+            recolors (list, optional): (old, new) tuples of palette changes, in order.
+            doc (PPixelDocument, optional): The document that has changed, like a layer.
+        """
+        self.recolors = list(recolors)
+        self.doc = doc
+
+        runs = array('I')
+        last = None
+
+        # Going over the lines, and splitting them to runs.
+        # A run is extended over the end of a line when the next line continues it.
+        for y, x0, old, new in lines:
+            i, n = 0, len(old)
+            while i < n:
+                o, nw = old[i], new[i]
+                if o == nw:
+                    i += 1
+                    continue
+                j = i + 1
+                while j < n and old[j] == o and new[j] == nw:
+                    j += 1
+
+                if (last is not None and runs[last] == y and runs[last + 1] + runs[last + 2] == x0 + i
+                        and runs[last + 3] == o and runs[last + 4] == nw):
+                    runs[last + 2] += j - i
+                else:
+                    last = len(runs)
+                    runs.extend((y, x0 + i, j - i, o, nw))
+                i = j
+
+        self.runs = runs
+
+        # The rectangle that has changed.
+        if runs:
+            ys = runs[0::self.RUN_SIZE]
+            xs = runs[1::self.RUN_SIZE]
+            ends = [x + length for x, length in zip(xs, runs[2::self.RUN_SIZE])]
+            self.rect = (min(xs), min(ys), max(ends), max(ys) + 1)
+        else:
+            self.rect = None
+
+    def __bool__(self):
+        return bool(self.runs) or bool(self.recolors)
+
+    def nbytes(self):
+        """Memory used by the delta.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return self.runs.itemsize * len(self.runs) + 8*len(self.recolors)
+
+    def apply(self, doc, new=True):
+        """Write the delta to a document, run by run.
+
+        Args:
+            doc (PPixelDocument): The document.
+            new (bool, optional): True for writing the new colors (redo), False for the old ones (undo).
+        """
+        # Palette changes are undone in the reverse order, from the new color to the old one.
+        if self.recolors:
+            if new:
+                for before, after in self.recolors:
+                    doc.replace_color(before, after)
+            else:
+                for before, after in reversed(self.recolors):
+                    doc.replace_color(after, before)
+            return
+
+        runs, step = self.runs, self.RUN_SIZE
+        color_at = 4 if new else 3
+
+        for i in range(0, len(runs), step):
+            y, x, length = runs[i], runs[i + 1], runs[i + 2]
+            doc.put_row(y, x, array('I', [runs[i + color_at]]) * length)
+
+        doc.notify(*self.rect)
+
+
+class PPixelHistory():
+    """
+    Undo and redo stacks of a document. An action is recorded between begin
+    and commit. The history has a memory budget, when it's exceeded the oldest
+    actions are forgotten.
+
+    The recorded document can be changed, like when another layer is chosen.
+    Every action is applied to the document that it was recorded from.
+    """
+    def __init__(self, doc, budget=4*1024*1024):
+        """Create an empty history.
+
+        Args:
+            doc (PPixelDocument): The document.
+            budget (int, optional): Biggest memory that the history can use, in bytes.
+        """
+        self.doc = doc
+        self.budget = budget
+
+        self.undo_stack = []
+        self.redo_stack = []
+
+        # Changes of the action that is being recorded, in order, by row.
+        # {y: [(x, old_row, new_row), ...]}
+        # And the palette changes, as (old, new) tuples.
+        self.changes = None
+        self.recolors = []
+
+    def record(self, x, y, old, new):
+        """Called by the document for a changed painting pixel.
+
+        Args:
+            x (int): coordinate
+            y (int): coordinate
+            old (int): Packed color before the change.
+            new (int): Packed color after the change.
+        """
+        if self.recolors:
+            self.begin()
+        self.changes.setdefault(y, []).append((x, (old,), (new,)))
+
+    def record_row(self, y, x, old, new):
+        """Called by the document for a changed part of a row.
+
+        Args:
+            y (int): row
+            x (int): left
+            old (array): Packed colors before the change.
+            new (array): Packed colors after the change.
+        """
+        if self.recolors:
+            self.begin()
+        self.changes.setdefault(y, []).append((x, old, new))
+
+    def record_recolor(self, old, new):
+        """Called by the document for a changed palette color. Palette changes
+        and painting pixel changes are not mixed in a delta, if an action has both,
+        it's stored as more than one action.
+
+        Args:
+            old (int): Packed color before the change.
+            new (int): Packed color after the change.
+        """
+        if self.changes:
+            self.begin()
+        self.recolors.append((old, new))
+
+    def lines(self):
+        """Merge the recorded changes to lines, for the delta. If a row has more than
+        one change, the first old color and the last new color of every painting
+        pixel are taken.
+
+        Returns:
+            list: (y, x, old_row, new_row) tuples, sorted and not overlapping.
+        """
+        lines = []
+        for y in sorted(self.changes):
+            changes = self.changes[y]
+            if len(changes) == 1:
+                x, old, new = changes[0]
+                lines.append((y, x, old, new))
+                continue
+
+            # Changes that don't overlap, like the tiles of a row, are lines as they are.
+            ordered = sorted(changes, key=lambda change: change[0])
+            if all(a[0] + len(a[1]) <= b[0] for a, b in zip(ordered, ordered[1:])):
+                lines.extend((y, x, old, new) for x, old, new in ordered)
+                continue
+
+            merged = {}
+            for x, old, new in changes:
+                for i in range(len(old)):
+                    if x + i in merged:
+                        merged[x + i][1] = new[i]
+                    else:
+                        merged[x + i] = [old[i], new[i]]
+
+            # Making lines of consecutive painting pixels.
+            xs = sorted(merged)
+            start = 0
+            for k in range(1, len(xs) + 1):
+                if k == len(xs) or xs[k] != xs[k - 1] + 1:
+                    part = xs[start:k]
+                    lines.append((y, part[0], [merged[x][0] for x in part], [merged[x][1] for x in part]))
+                    start = k
+        return lines
+
+    def begin(self):
+        """Start recording an action. An action that is being recorded is committed first."""
+        self.commit()
+        self.changes = {}
+        self.doc.recorder = self
+
+    def commit(self):
+        """Stop recording, and store the action if anything has changed.
+
+        Returns:
+            bool: True if an action was stored.
+        """
+        if self.changes is None:
+            return False
+
+        self.doc.recorder = None
+        delta = Delta(self.lines(), self.recolors, self.doc)
+        self.changes = None
+        self.recolors = []
+        if not delta:
+            return False
+
+        self.undo_stack.append(delta)
+        self.redo_stack = []
+        self.trim()
+        return True
+
+    def set_document(self, doc):
+        """Record the actions of another document from now on, like another layer.
+        The action that is being recorded is committed first.
+
+        Args:
+            doc (PPixelDocument): The document.
+        """
+        self.commit()
+        self.doc = doc
+
+    def forget(self, doc):
+        """Forget the actions of a document, like a layer that was removed.
+
+        Args:
+            doc (PPixelDocument): The document.
+        """
+        self.commit()
+        self.undo_stack = [delta for delta in self.undo_stack if delta.doc is not doc]
+        self.redo_stack = [delta for delta in self.redo_stack if delta.doc is not doc]
+
+    def trim(self):
+        """Forget the oldest actions until the history fits in the budget.
+        The newest action is always kept.
+        """
+        while len(self.undo_stack) > 1 and self.nbytes() > self.budget:
+            self.undo_stack.pop(0)
+
+    def set_budget(self, budget):
+        """Change the memory budget.
+
+        Args:
+            budget (int): Biggest memory that the history can use, in bytes.
+        """
+        self.budget = budget
+        self.trim()
+
+    def nbytes(self):
+        """Memory used by the history.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return sum(delta.nbytes() for delta in self.undo_stack + self.redo_stack)
+
+    def can_undo(self):
+        """Returns True if there is an action to undo."""
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        """Returns True if there is an action to redo."""
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """Revert the last action.
+
+        Returns:
+            bool: False if there is nothing to undo.
+        """
+        self.commit()
+        if not self.undo_stack:
+            return False
+
+        delta = self.undo_stack.pop()
+        delta.apply(delta.doc, new=False)
+        self.redo_stack.append(delta)
+        return True
+
+    def redo(self):
+        """Apply the last undone action again.
+
+        Returns:
+            bool: False if there is nothing to redo.
+        """
+        self.commit()
+        if not self.redo_stack:
+            return False
+
+        delta = self.redo_stack.pop()
+        delta.apply(delta.doc, new=True)
+        self.undo_stack.append(delta)
+        return True
+
+    def clear(self):
+        """Forget every action."""
+        self.commit()
+        self.undo_stack = []
+        self.redo_stack = []
@@ -0,0 +1,426 @@
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from operator import add
+from PPixelColor import EMPTY, channels
+from PPixelDocument import PPixelDocument
+from PPixelPNG import PNG_CHANNELS, read_palette, read_png_header, rgba_bytes, row_converter, unfilter
+
+# Importing any PNG file as painting pixels. The image is shrunk to the size of the
+# document, every painting pixel is the average of a box of image pixels, then the
+# colors are reduced with median cut, and optionally improved with k-means.
+#
+# The work runs in a process pool, in steps that the editor polls from the Tk thread:
+#   scan      reads the file, decompresses it and cuts the rows into bands.
+#   bands     every band is unfiltered and summed into the boxes that it covers.
+#             PNG rows are filtered against the row above, so a band can only start
+#             on its own if its first row doesn't use the row above (filter 0 or 1).
+#             The other bands wait for the last row of the band before them.
+#   quantize  the box sums become colors, the colors are reduced and the document is made.
+
+# Rows of a band, at least. Smaller bands report the progress more often.
+BAND_ROWS = 32
+
+# The most k-means rounds, it stops earlier if the palette doesn't change.
+KMEANS_ROUNDS = 8
+
+# The methods of reducing the colors.
+METHODS = ('median', 'kmeans')
+
+
+def box_edges(size, target):
+    """Split a length into boxes, one for each target pixel. When the target is
+    bigger than the length, boxes share the same pixel.
+
+    Args:
+        size (int): Length, in image pixels.
+        target (int): Amount of boxes.
+
+    Returns:
+        list: (start, end) of each box, end is exclusive.
+    """
+    edges = []
+    for i in range(target):
+        start = i*size // target
+        edges.append((start, max((i + 1)*size // target, start + 1)))
+    return edges
+
+
+def scan_png(path, band_rows=BAND_ROWS):
+    """Read a PNG file and cut its rows into bands. Runs in a worker process.
+
+    Args:
+        path (str): File name.
+        band_rows (int, optional): Rows of a band, at least.
+
+    Raises:
+        ValueError: If the file is not a PNG file, or isn't supported.
+
+    Returns:
+        tuple: The header as (width, height, bit depth, color type, palette,
+        transparent color), and the bands as (first row, True if it doesn't need
+        the row above, filtered rows).
+    """
+    with open(path, 'rb') as file:
+        w, h, depth, color_type, chunks = read_png_header(file)
+        palette, key = [], None
+        data = []
+        for kind, chunk in chunks:
+            if kind in (b'PLTE', b'tRNS'):
+                palette, key = read_palette(kind, chunk, color_type, palette, key)
+            elif kind == b'IDAT':
+                data.append(chunk)
+
+    try:
+        raw = zlib.decompress(b''.join(data))
+    except zlib.error as error:
+        raise ValueError(f'The PNG file is damaged: {error}')
+
+    size = (w*PNG_CHANNELS[color_type]*depth + 7) // 8 + 1
+    if len(raw) < size*h:
+        raise ValueError('The PNG file has missing rows!')
+
+    # A band ends before a row that starts on its own, or if it gets too long.
+    bands = []
+    start = 0
+    for y in range(1, h + 1):
+        rows = y - start
+        if y == h or rows >= band_rows and (raw[y*size] < 2 or rows >= 2*band_rows):
+            bands.append((start, start == 0 or raw[start*size] < 2, raw[start*size:y*size]))
+            start = y
+    return (w, h, depth, color_type, palette, key), bands
+
+
+def shrink_band(header, y0, data, prior, tw, th):
+    """Unfilter a band and sum its pixels into the boxes of the target. Runs in a worker process.
+
+    Args:
+        header (tuple): The header from scan_png.
+        y0 (int): First row of the band.
+        data (bytes): Filtered rows, each with its filter type.
+        prior (bytes): The unfiltered row above the band, or None if it's not needed.
+        tw (int): Target width.
+        th (int): Target height.
+
+    Raises:
+        ValueError: If a row has an unknown filter.
+
+    Returns:
+        tuple: Sums by target row, and the last unfiltered row. A row of sums has red,
+        green, blue, alpha and the amount of non-empty pixels, for each box.
+    """
+    w, h, depth, color_type, palette, key = header
+    bits = PNG_CHANNELS[color_type]*depth
+    bpp = max(bits // 8, 1)
+    stride = (w*bits + 7) // 8
+    rows = len(data) // (stride + 1)
+    convert = row_converter(w, depth, color_type, palette, key)
+
+    # The boxes as byte offsets in an RGBA row, and the target rows of every row of the band.
+    columns = [(4*x0, 4*x1) for x0, x1 in box_edges(w, tw)]
+    targets = {}
+    for ty, (sy0, sy1) in enumerate(box_edges(h, th)):
+        for y in range(max(sy0, y0), min(sy1, y0 + rows)):
+            targets.setdefault(y, []).append(ty)
+
+    prior = bytearray(prior or stride)
+    sums = {}
+    for i in range(rows):
+        offset = i*(stride + 1)
+        line = bytearray(data[offset + 1:offset + stride + 1])
+        unfilter(data[offset], line, prior, bpp)
+        prior = line
+
+        # Empty pixels are zero, so they add nothing to the channels. RGBA rows
+        # without transparent pixels are used as they are.
+        if color_type == 6 and depth == 8 and not line[3::4].count(0):
+            rgba = line
+        else:
+            rgba = rgba_bytes(convert(line))
+        row = []
+        for x0, x1 in columns:
+            alpha = rgba[x0 + 3:x1:4]
+            row += (sum(rgba[x0:x1:4]), sum(rgba[x0 + 1:x1:4]), sum(rgba[x0 + 2:x1:4]),
+                    sum(alpha), len(alpha) - alpha.count(0))
+
+        for ty in targets.get(y0 + i, ()):
+            sums[ty] = list(map(add, sums[ty], row)) if ty in sums else row
+    return sums, bytes(prior)
+
+
+def average_rows(sums, w, h, tw, th):
+    """Convert the box sums to colors. A box that is mostly empty is empty.
+
+    Args:
+        sums (dict): Sums by target row, from shrink_band.
+        w (int): Image width.
+        h (int): Image height.
+        tw (int): Target width.
+        th (int): Target height.
+
+    Returns:
+        list: Rows of packed colors.
+    """
+    columns = box_edges(w, tw)
+    rows = []
+    for ty, (y0, y1) in enumerate(box_edges(h, th)):
+        line = sums[ty]
+        row = []
+        for tx, (x0, x1) in enumerate(columns):
+            r, g, b, a, n = line[5*tx:5*tx + 5]
+            if 2*n < (x1 - x0)*(y1 - y0):
+                row.append(EMPTY)
+                continue
+            half = n // 2
+            row.append((r + half) // n << 24 | (g + half) // n << 16 | (b + half) // n << 8 | (a + half) // n)
+        rows.append(row)
+    return rows
+
+
+def median_cut(histogram, n):
+    """Reduce colors with median cut. The box of colors with the widest channel is
+    split in two at the median of its pixels, until there are n boxes.
+
+    Args:
+        histogram (dict): Amount of pixels by packed color, without EMPTY.
+        n (int): Amount of colors, at least 1.
+
+    Returns:
+        list: Packed colors, the pixel weighted average of each box.
+    """
+    boxes = [[(channels(color), count) for color, count in histogram.items()]]
+    while len(boxes) < n:
+        widest, spread, channel = None, 0, 0
+        for i, box in enumerate(boxes):
+            for c in range(4):
+                values = [color[c] for color, _ in box]
+                if max(values) - min(values) > spread:
+                    widest, spread, channel = i, max(values) - min(values), c
+        if widest is None:
+            break
+
+        box = sorted(boxes.pop(widest), key=lambda item: item[0][channel])
+        half = sum(count for _, count in box) / 2
+        total = 0
+        for cut, (_, count) in enumerate(box[:-1], 1):
+            total += count
+            if total >= half:
+                break
+        boxes += [box[:cut], box[cut:]]
+
+    palette = []
+    for box in boxes:
+        pixels = sum(count for _, count in box)
+        mean = [round(sum(color[c]*count for color, count in box) / pixels) for c in range(4)]
+        palette.append(mean[0] << 24 | mean[1] << 16 | mean[2] << 8 | max(mean[3], 1))
+    return palette
+
+
+def nearest(color, centers):
+    """Find the closest of some colors.
+
+    Args:
+        color (tuple): Channels of a color.
+        centers (list): Channels of the colors.
+
+    Returns:
+        int: Index of the closest color.
+    """
+    r, g, b, a = color
+    best, distance = 0, 1 << 20
+    for i, (cr, cg, cb, ca) in enumerate(centers):
+        d = (r - cr)*(r - cr) + (g - cg)*(g - cg) + (b - cb)*(b - cb) + (a - ca)*(a - ca)
+        if d < distance:
+            best, distance = i, d
+    return best
+
+
+def kmeans(histogram, palette, rounds=KMEANS_ROUNDS):
+    """Improve a palette with k-means. Every color moves to the average of the
+    pixels that are closest to it.
+
+    Args:
+        histogram (dict): Amount of pixels by packed color, without EMPTY.
+        palette (list): Packed colors to start with, like the median cut ones.
+        rounds (int, optional): The most rounds.
+
+    Returns:
+        list: Packed colors.
+    """
+    colors = [(channels(color), count) for color, count in histogram.items()]
+    centers = [channels(color) for color in palette]
+    for _ in range(rounds):
+        totals = [[0, 0, 0, 0, 0] for _ in centers]
+        for color, count in colors:
+            total = totals[nearest(color, centers)]
+            for c in range(4):
+                total[c] += color[c]*count
+            total[4] += count
+
+        # A color that is closest to no pixel stays where it is.
+        moved = [tuple(round(total[c] / total[4]) for c in range(4)) if total[4] else center
+                 for total, center in zip(totals, centers)]
+        if moved == centers:
+            break
+        centers = moved
+    return [r << 24 | g << 16 | b << 8 | max(a, 1) for r, g, b, a in centers]
+
+
+def quantize(sums, header, tw, th, colors, method='median'):
+    """Make the document from the box sums, with at most the given amount of colors.
+    Runs in a worker process.
+
+    Args:
+        sums (dict): Sums by target row, from shrink_band.
+        header (tuple): The header from scan_png.
+        tw (int): Target width.
+        th (int): Target height.
+        colors (int): Amount of colors, at least 1.
+        method (str, optional): 'median' for median cut, 'kmeans' for median cut
+        improved with k-means.
+
+    Returns:
+        PPixelDocument: The document.
+    """
+    rows = average_rows(sums, header[0], header[1], tw, th)
+    histogram = Counter()
+    for row in rows:
+        histogram.update(row)
+    histogram.pop(EMPTY, None)
+
+    # The colors are used as they are, if there are few enough.
+    doc = PPixelDocument(tw, th)
+    if len(histogram) > colors:
+        palette = median_cut(histogram, colors)
+        if method == 'kmeans':
+            palette = kmeans(histogram, palette)
+        centers = [channels(color) for color in palette]
+        mapping = {color: palette[nearest(channels(color), centers)] for color in histogram}
+        mapping[EMPTY] = EMPTY
+        rows = [[mapping[color] for color in row] for row in rows]
+    else:
+        palette = sorted(histogram)
+
+    for color in palette:
+        doc.intern(color)
+    for y, row in enumerate(rows):
+        doc.put_row(y, 0, row)
+    return doc
+
+
+class ImportJob():
+    """
+    Importing a PNG file in a process pool. Nothing waits for the workers, the
+    editor calls poll from time to time, which starts the next steps.
+    """
+    def __init__(self, path, w, h, colors=16, method='median', jobs=None):
+        """Prepare the import.
+
+        Args:
+            path (str): PNG file.
+            w (int): width of the document, in painting pixels
+            h (int): height of the document, in painting pixels
+            colors (int, optional): Amount of colors, at least 1.
+            method (str, optional): One of METHODS.
+            jobs (int, optional): Number of worker processes, the number of cores if not given.
+        """
+        self.path = path
+        self.w, self.h = w, h
+        self.colors = max(colors, 1)
+        self.method = method
+        self.jobs = jobs or os.cpu_count()
+
+        # Between 0 and 1. The document is set when it's finished, and the error if it failed.
+        self.progress = 0
+        self.document = None
+        self.error = None
+        self.finished = False
+
+        self.pool = None
+        self.step = None
+        self.header = None
+
+        # Bands that are not started yet by index, the rows of every band, the running
+        # ones, the last row of every finished band, and the sums of the finished bands.
+        self.bands = {}
+        self.band_rows = []
+        self.running = {}
+        self.last_rows = {}
+        self.sums = {}
+        self.rows_done = 0
+
+    def start(self):
+        """Start reading the file."""
+        # Spawned workers don't inherit the Tk connection of the editor.
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=get_context('spawn'))
+        self.step = self.pool.submit(scan_png, self.path)
+
+    def poll(self):
+        """Check the workers, and start the steps that can be started.
+
+        Returns:
+            bool: True if the import has finished, failed or was cancelled.
+        """
+        if self.finished:
+            return True
+
+        try:
+            if self.header is None:
+                if self.step.done():
+                    self.header, bands = self.step.result()
+                    self.bands = dict(enumerate(bands))
+                    starts = [band[0] for band in bands] + [self.header[1]]
+                    self.band_rows = [end - start for start, end in zip(starts, starts[1:])]
+                    self.progress = 0.05
+                    self.start_bands()
+
+            elif self.bands or self.running:
+                for i, future in list(self.running.items()):
+                    if future.done():
+                        del self.running[i]
+                        sums, self.last_rows[i] = future.result()
+                        for ty, row in sums.items():
+                            self.sums[ty] = list(map(add, self.sums[ty], row)) if ty in self.sums else row
+                        self.rows_done += self.band_rows[i]
+                self.progress = 0.05 + 0.85*self.rows_done / self.header[1]
+
+                if self.bands or self.running:
+                    self.start_bands()
+                else:
+                    self.step = self.pool.submit(quantize, self.sums, self.header, self.w, self.h,
+                                                 self.colors, self.method)
+                    self.sums = {}
+
+            elif self.step.done():
+                self.document = self.step.result()
+                self.progress = 1
+                self.finish()
+
+        except (OSError, ValueError, BrokenProcessPool) as error:
+            self.error = str(error) or 'A worker process stopped.'
+            self.finish()
+        return self.finished
+
+    def start_bands(self):
+        """Start the bands that don't wait for another band."""
+        for i, (y0, alone, data) in list(self.bands.items()):
+            if alone or i - 1 in self.last_rows:
+                prior = None if alone else self.last_rows[i - 1]
+                self.running[i] = self.pool.submit(shrink_band, self.header, y0, data, prior, self.w, self.h)
+                del self.bands[i]
+
+    def cancel(self):
+        """Stop the import. The workers finish the band that they are working on."""
+        if not self.finished:
+            self.finish()
+
+    def finish(self):
+        """Shut the pool down, without waiting for the workers."""
+        self.finished = True
+        self.bands = {}
+        self.running = {}
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,448 @@
+from array import array
+from itertools import repeat
+from PPixelColor import EMPTY
+from PPixelDocument import PPixelDocument
+
+# Layers are documents of the same size, from the bottom to the top. What is shown is
+# the composite: every visible layer put over the ones below it, with its opacity.
+# The composite is cached, and after a change only the changed rectangle is composited
+# again. The layers below and above the current layer are cached flattened too, so a
+# change of the current layer is composited from three rows, whatever the amount of layers.
+
+
+def over(bottom, top, opacity=255):
+    """Put a color over another one, like painting with a transparent color.
+
+    Args:
+        bottom (int): Packed color.
+        top (int): Packed color.
+        opacity (int, optional): Opacity of the top color, 0-255.
+
+    Returns:
+        int: Packed color.
+    """
+    ta = (top & 0xFF)*opacity // 0xFF
+    if ta == 0xFF:
+        return top
+    if ta == 0:
+        return bottom
+    ba = bottom & 0xFF
+    if ba == 0:
+        return (top & 0xFFFFFF00) | ta
+
+    # How much of the bottom color shows through the top one.
+    rest = ba*(0xFF - ta) // 0xFF
+    alpha = ta + rest
+    color = alpha
+    for shift in (24, 16, 8):
+        channel = (((top >> shift) & 0xFF)*ta + ((bottom >> shift) & 0xFF)*rest) // alpha
+        color |= channel << shift
+    return color
+
+
+def blend_row(bottom, top, opacity=255):
+    """Put a row of colors over another row.
+
+    Args:
+        bottom (array): Packed colors.
+        top (array): Packed colors, with the same length.
+        opacity (int, optional): Opacity of the top row, 0-255.
+
+    Returns:
+        array: Packed colors. Might be one of the given rows, it shouldn't be changed.
+    """
+    if opacity == 0 or not any(top):
+        return bottom
+    if opacity == 0xFF:
+        if not any(bottom):
+            return top
+        # Opaque colors cover the bottom, empty ones show it.
+        return array('I', [t if t & 0xFF == 0xFF else b if t == EMPTY else over(b, t)
+                           for b, t in zip(bottom, top)])
+    return array('I', map(over, bottom, top, repeat(opacity)))
+
+
+class Layer():
+    """
+    A layer of a LayerStack, a document with a name, visibility and opacity.
+    """
+    def __init__(self, doc, name, visible=True, opacity=255):
+        """Create a layer.
+
+        Args:
+            doc (PPixelDocument): The painting pixels of the layer.
+            name (str): Name that is shown to the user.
+            visible (bool, optional): Hidden layers are not in the composite.
+            opacity (int, optional): 0-255, 255 is opaque.
+        """
+        self.doc = doc
+        self.name = name
+        self.visible = visible
+        self.opacity = opacity
+
+        # The function that the layer document informs, set by the stack.
+        self.listener = None
+
+
+class LayerStack():
+    """
+    Layers of an image and their composite. Tools write to the document of the
+    current layer, and a view reads the composite with get_row, like from a document.
+    Listeners are informed about the changed rectangles of the composite.
+
+    When only one layer is visible and it's opaque, the composite is that layer,
+    and nothing is cached.
+    """
+    def __init__(self, doc):
+        """Create a stack with a single layer.
+
+        Args:
+            doc (PPixelDocument): The document of the first layer.
+        """
+        self.w, self.h = doc.w, doc.h
+
+        # Layers from the bottom to the top, and the index of the current one.
+        self.layers = []
+        self.current = 0
+        self.count = 0
+
+        # Functions that will be called as f(x0, y0, x1, y1) after the composite has changed.
+        self.listeners = []
+
+        # The layer that is the composite, or the cached documents: the visible layers below
+        # the current one flattened, the ones above it flattened, and the composite.
+        # below and above are None when there are no such layers.
+        self.single = None
+        self.below = self.above = self.composite = None
+
+        self.add_layer(doc)
+
+    def subscribe(self, listener):
+        """Start informing a function about the changes of the composite.
+
+        Args:
+            listener (function): Called with the changed rectangle, x1 and y1 are exclusive.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Stop informing a function about the changes.
+
+        Args:
+            listener (function): A function that was subscribed before.
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, x0, y0, x1, y1):
+        """Inform the listeners that a rectangle of the composite has changed.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        for listener in list(self.listeners):
+            listener(x0, y0, x1, y1)
+
+    def current_layer(self):
+        """Return the current layer.
+
+        Returns:
+            Layer: The layer that the tools write to.
+        """
+        return self.layers[self.current]
+
+    def add_layer(self, doc=None, name=None):
+        """Add a layer over the current one, and make it the current layer.
+
+        Args:
+            doc (PPixelDocument, optional): The document of the layer, an empty one if not given.
+            name (str, optional): Name of the layer, numbered if not given.
+
+        Returns:
+            Layer: The new layer.
+        """
+        self.count += 1
+        layer = Layer(doc or PPixelDocument(self.w, self.h), name or f'Layer {self.count}')
+        self.watch(layer)
+
+        self.current = len(self.layers) and self.current + 1
+        self.layers.insert(self.current, layer)
+        self.rebuild()
+        return layer
+
+    def watch(self, layer):
+        """Start compositing the changes of a layer.
+
+        Args:
+            layer (Layer): A layer of the stack.
+        """
+        layer.listener = lambda x0, y0, x1, y1: self.layer_changed(layer, x0, y0, x1, y1)
+        layer.doc.subscribe(layer.listener)
+
+    def clone(self):
+        """Copy the stack, like for a new animation frame. The documents and the
+        caches are cloned, so they share their tiles with this stack until written.
+
+        Returns:
+            LayerStack: The copy, without listeners.
+        """
+        stack = LayerStack.__new__(LayerStack)
+        stack.w, stack.h = self.w, self.h
+        stack.current, stack.count = self.current, self.count
+        stack.listeners = []
+
+        stack.layers = []
+        stack.single = None
+        for layer in self.layers:
+            copy = Layer(layer.doc.clone(), layer.name, layer.visible, layer.opacity)
+            stack.watch(copy)
+            stack.layers.append(copy)
+            if layer is self.single:
+                stack.single = copy
+
+        stack.below, stack.above, stack.composite = (None if doc is None else doc.clone()
+                                                     for doc in (self.below, self.above, self.composite))
+        return stack
+
+    def remove_layer(self, index=None):
+        """Remove a layer. The last layer can't be removed.
+
+        Args:
+            index (int, optional): Index of the layer, the current one if not given.
+
+        Returns:
+            Layer: The removed layer, or None if it's the last one.
+        """
+        if len(self.layers) == 1:
+            return None
+        if index is None:
+            index = self.current
+        layer = self.layers.pop(index)
+        layer.doc.unsubscribe(layer.listener)
+        if self.current >= index:
+            self.current = max(self.current - 1, 0)
+        self.rebuild()
+        return layer
+
+    def move_layer(self, index, to):
+        """Move a layer to another place in the stack. The current layer stays current.
+
+        Args:
+            index (int): Index of the layer.
+            to (int): New index of the layer.
+        """
+        to = min(max(to, 0), len(self.layers) - 1)
+        if index == to:
+            return
+        current = self.layers[self.current]
+        self.layers.insert(to, self.layers.pop(index))
+        self.current = self.layers.index(current)
+        self.rebuild()
+
+    def set_current(self, index):
+        """Change the layer that the tools write to. The composite doesn't change.
+
+        Args:
+            index (int): Index of the layer.
+        """
+        if index != self.current:
+            self.current = index
+            self.rebuild(notify=False)
+
+    def set_visible(self, index, visible):
+        """Show or hide a layer.
+
+        Args:
+            index (int): Index of the layer.
+            visible (bool): False for hiding.
+        """
+        self.layers[index].visible = visible
+        self.rebuild()
+
+    def set_opacity(self, index, opacity):
+        """Change the opacity of a layer.
+
+        Args:
+            index (int): Index of the layer.
+            opacity (int): 0-255, 255 is opaque.
+        """
+        self.layers[index].opacity = min(max(opacity, 0), 255)
+        self.rebuild()
+
+    def rebuild(self, notify=True):
+        """Composite the whole image again, after the layers have changed.
+        The caches depend on the current layer too.
+
+        Args:
+            notify (bool, optional): If False, the listeners are not informed.
+        """
+        visible = [layer for layer in self.layers if layer.visible]
+        if len(visible) == 1 and visible[0].opacity == 0xFF:
+            self.single = visible[0]
+            self.below = self.above = self.composite = None
+        else:
+            self.single = None
+            self.below = self.flatten(self.layers[:self.current])
+            self.above = self.flatten(self.layers[self.current + 1:])
+            self.composite = PPixelDocument(self.w, self.h)
+            self.composite_rect(0, 0, self.w, self.h)
+
+        if notify:
+            self.notify(0, 0, self.w, self.h)
+
+    def flatten(self, layers, doc=None, rect=None):
+        """Put layers over each other, to a document.
+
+        Args:
+            layers (list): Layers from the bottom to the top, the hidden ones are skipped.
+            doc (PPixelDocument, optional): Destination, a new document if not given.
+            rect (tuple, optional): x0, y0, x1, y1 respectively, the whole image if not given.
+
+        Returns:
+            PPixelDocument: The document, or None if no layer is visible and doc isn't given.
+        """
+        layers = [layer for layer in layers if layer.visible]
+        if doc is None:
+            if not layers:
+                return None
+            doc = PPixelDocument(self.w, self.h)
+        x0, y0, x1, y1 = rect or (0, 0, self.w, self.h)
+
+        empty = array('I', [EMPTY]) * (x1 - x0)
+        for y in range(y0, y1):
+            row = empty
+            for layer in layers:
+                row = blend_row(row, layer.doc.get_row(y, x0, x1), layer.opacity)
+            doc.put_row(y, x0, row)
+        return doc
+
+    def composite_rect(self, x0, y0, x1, y1):
+        """Composite a rectangle again, from the caches and the current layer.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        layer = self.layers[self.current]
+        below, above = self.below, self.above
+        empty = array('I', [EMPTY]) * (x1 - x0)
+
+        for y in range(y0, y1):
+            row = below.get_row(y, x0, x1) if below is not None else empty
+            if layer.visible:
+                row = blend_row(row, layer.doc.get_row(y, x0, x1), layer.opacity)
+            if above is not None:
+                row = blend_row(row, above.get_row(y, x0, x1))
+            self.composite.put_row(y, x0, row)
+
+    def layer_changed(self, layer, x0, y0, x1, y1):
+        """Called by the document of a layer after a change. Only the changed
+        rectangle is composited again.
+
+        Args:
+            layer (Layer): The layer that has changed.
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        if not layer.visible:
+            return
+        if self.single is None:
+            x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, self.w), min(y1, self.h)
+            index = self.layers.index(layer)
+            # Other layers change by undo and redo, their cache is flattened again in the rectangle.
+            if index < self.current:
+                self.flatten(self.layers[:self.current], self.below, (x0, y0, x1, y1))
+            elif index > self.current:
+                self.flatten(self.layers[self.current + 1:], self.above, (x0, y0, x1, y1))
+            self.composite_rect(x0, y0, x1, y1)
+        self.notify(x0, y0, x1, y1)
+
+    def flattened(self):
+        """Return the document that holds the composite, for sampling or saving it.
+        It shouldn't be changed.
+
+        Returns:
+            PPixelDocument: The composite.
+        """
+        if self.single is not None:
+            return self.single.doc
+        return self.composite
+
+    def get_row(self, y, x0, x1, step=1):
+        """Copy a part of a row out of the composite.
+
+        Args:
+            y (int): row
+            x0 (int): left
+            x1 (int): right, exclusive
+            step (int, optional): Only every step'th painting pixel is taken.
+
+        Returns:
+            array: Packed colors.
+        """
+        return self.flattened().get_row(y, x0, x1, step)
+
+    def composite_row(self, y, x0, x1, row, step=1):
+        """Composite a part of a row with another row in place of the current layer,
+        for previewing a change of the current layer without making it.
+
+        Args:
+            y (int): row
+            x0 (int): left
+            x1 (int): right, exclusive
+            row (array): Packed colors of the current layer, with the same step.
+            step (int, optional): Only every step'th painting pixel is taken.
+
+        Returns:
+            array: Packed colors.
+        """
+        layer = self.layers[self.current]
+        if self.single is not None:
+            return row if self.single is layer else self.get_row(y, x0, x1, step)
+
+        below, above = self.below, self.above
+        result = below.get_row(y, x0, x1, step) if below is not None else array('I', [EMPTY]) * len(row)
+        if layer.visible:
+            result = blend_row(result, row, layer.opacity)
+        if above is not None:
+            result = blend_row(result, above.get_row(y, x0, x1, step))
+        return result
+
+    def resize(self, w, h, ox=0, oy=0):
+        """Change the size of every layer, keeping the painting pixels.
+        Listeners are not informed, since the size has changed.
+
+        Args:
+            w (int): new width, in painting pixels
+            h (int): new height, in painting pixels
+            ox (int, optional): x offset of the old content, negative crops from the left.
+            oy (int, optional): y offset of the old content, negative crops from the top.
+        """
+        for layer in self.layers:
+            layer.doc.resize(w, h, ox, oy)
+        self.w, self.h = w, h
+        self.rebuild(notify=False)
+
+    def documents(self):
+        """Return the documents of the layers and the caches.
+
+        Returns:
+            list: PPixelDocument objects.
+        """
+        docs = [layer.doc for layer in self.layers] + [self.below, self.above, self.composite]
+        return [doc for doc in docs if doc is not None]
+
+    def nbytes(self):
+        """Memory used by the layers and the caches.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return sum(doc.nbytes() for doc in self.documents())
@@ -0,0 +1,492 @@
+import struct
+import sys
+import zlib
+from array import array
+from PPixelColor import EMPTY
+from PPixelDocument import PPixelDocument
+
+# Reading and writing PNG files with only zlib and struct. Images are handled row by row,
+# so a file is never held in memory as a whole, and the time depends only on its size.
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Compressed data is written as an IDAT chunk when it gets this big.
+IDAT_SIZE = 1 << 16
+
+# array('I') is in native byte order, but PNG wants RRGGBBAA in big endian.
+SWAP_BYTES = sys.byteorder == 'little'
+
+
+def rgba_bytes(row):
+    """Convert packed colors to RGBA bytes.
+
+    Args:
+        row (array): Packed colors.
+
+    Returns:
+        bytes: Four bytes for each color.
+    """
+    row = array('I', row)
+    if SWAP_BYTES:
+        row.byteswap()
+    return row.tobytes()
+
+
+def bytes_rgba(data):
+    """Convert RGBA bytes to packed colors. Fully transparent colors become EMPTY.
+
+    Args:
+        data (bytes): Four bytes for each color.
+
+    Returns:
+        array: Packed colors.
+    """
+    row = array('I', data)
+    if SWAP_BYTES:
+        row.byteswap()
+    for i, color in enumerate(row):
+        if color and not color & 0xFF:
+            row[i] = EMPTY
+    return row
+
+
+def write_chunk(file, kind, data):
+    """Write a PNG chunk.
+
+    Args:
+        file (binary file): Output.
+        kind (bytes): Chunk type, like b'IHDR'.
+        data (bytes): Chunk data.
+    """
+    file.write(struct.pack('>I', len(data)))
+    file.write(kind)
+    file.write(data)
+    file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+
+class PNGWriter():
+    """
+    Writes a PNG file row by row. Rows are filtered, compressed and written as
+    they come, so only a single row is in memory at a time.
+    """
+    def __init__(self, file, w, h, palette=None, level=6):
+        """Start a PNG file, and write the header.
+
+        Args:
+            file (binary file): Output.
+            w (int): width, in pixels
+            h (int): height, in pixels
+            palette (list, optional): Packed colors. If given, the image is palette
+            indexed with 8 bits per pixel, otherwise it's RGBA.
+            level (int, optional): zlib compression level.
+        """
+        self.file = file
+        self.w, self.h = w, h
+        self.palette = palette
+        self.rows_written = 0
+
+        file.write(PNG_SIGNATURE)
+        if palette is None:
+            write_chunk(file, b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0))
+        else:
+            write_chunk(file, b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 3, 0, 0, 0))
+            rgb = bytearray()
+            alpha = bytearray()
+            for color in palette:
+                rgb += struct.pack('>I', color)[:3]
+                alpha.append(color & 0xFF)
+            write_chunk(file, b'PLTE', bytes(rgb))
+            if any(a != 0xFF for a in alpha):
+                write_chunk(file, b'tRNS', bytes(alpha))
+
+            self.index = {color: i for i, color in enumerate(palette)}
+
+        self.compressor = zlib.compressobj(level)
+        self.pending = bytearray()
+
+        # A row that repeats the one above, made on the first use.
+        self.repeated = None
+
+    def write_row(self, row):
+        """Write a row.
+
+        Args:
+            row (array): Packed colors if the image is RGBA, palette indexes otherwise.
+        """
+        # Every row starts with the filter type, 0 is none.
+        self.pending += self.compressor.compress(b'\x00' + bytes(row) if self.palette is not None
+                                                 else b'\x00' + rgba_bytes(row))
+        self.rows_written += 1
+        self.flush()
+
+    def repeat_row(self):
+        """Write the last row again. The row is filtered with the row above, filter 2,
+        so it's all zeros, which costs almost nothing to compress.
+        """
+        if self.repeated is None:
+            self.repeated = b'\x02' + bytes(self.w if self.palette is not None else 4*self.w)
+        self.pending += self.compressor.compress(self.repeated)
+        self.rows_written += 1
+        self.flush()
+
+    def write_colors(self, row):
+        """Write a row of packed colors, converting them to palette indexes if needed.
+
+        Args:
+            row (array): Packed colors.
+        """
+        if self.palette is None:
+            self.write_row(row)
+        else:
+            self.write_row(bytes(map(self.index.__getitem__, row)))
+
+    def flush(self, final=False):
+        """Write the compressed data as IDAT chunks.
+
+        Args:
+            final (bool, optional): Write everything, even if it's smaller than IDAT_SIZE.
+        """
+        while len(self.pending) >= IDAT_SIZE:
+            write_chunk(self.file, b'IDAT', bytes(self.pending[:IDAT_SIZE]))
+            del self.pending[:IDAT_SIZE]
+        if final and self.pending:
+            write_chunk(self.file, b'IDAT', bytes(self.pending))
+            self.pending = bytearray()
+
+    def close(self):
+        """Finish the file.
+
+        Raises:
+            ValueError: If less rows than the height were written.
+        """
+        if self.rows_written != self.h:
+            raise ValueError(f'{self.rows_written} rows were written, instead of {self.h}!')
+        self.pending += self.compressor.flush()
+        self.flush(final=True)
+        write_chunk(self.file, b'IEND', b'')
+
+
+def document_palette(doc, limit=256):
+    """Collect the colors of a document.
+
+    Args:
+        doc (PPixelDocument): The document.
+        limit (int, optional): Stop if there are more colors than this.
+
+    Returns:
+        list: Packed colors, or None if there are more than limit.
+    """
+    colors = set()
+    for row in doc.rows():
+        colors.update(row)
+        if len(colors) > limit:
+            return None
+    return sorted(colors)
+
+
+def write_png(path, doc, mode='auto'):
+    """Save a document as a PNG file. Empty painting pixels are transparent.
+
+    Args:
+        path (str): File name.
+        doc (PPixelDocument): The document.
+        mode (str, optional): 'rgba', 'palette' or 'auto'. Auto uses a palette if the
+        document has at most 256 colors.
+
+    Raises:
+        ValueError: If the mode is unknown, or palette is asked with too many colors.
+    """
+    if mode not in ('rgba', 'palette', 'auto'):
+        raise ValueError('Unknown mode!')
+
+    palette = None
+    if mode != 'rgba':
+        palette = document_palette(doc)
+        if palette is None and mode == 'palette':
+            raise ValueError('The document has more than 256 colors!')
+
+    with open(path, 'wb') as file:
+        writer = PNGWriter(file, doc.w, doc.h, palette=palette)
+        for row in doc.rows():
+            writer.write_colors(row)
+        writer.close()
+
+
+def unfilter(kind, line, prior, bpp):
+    """Reverse the filter of a row, in place.
+
+    Args:
+        kind (int): Filter type, between 0-4.
+        line (bytearray): Filtered row, without the filter type byte.
+        prior (bytearray): The row above, unfiltered. All zeros for the first row.
+        bpp (int): Bytes per pixel, at least 1.
+
+    Raises:
+        ValueError: If the filter type is unknown.
+    """
+    if kind == 0:
+        return
+    n = len(line)
+
+    if kind == 1:
+        for i in range(bpp, n):
+            line[i] = (line[i] + line[i - bpp]) & 0xFF
+    elif kind == 2:
+        for i in range(n):
+            line[i] = (line[i] + prior[i]) & 0xFF
+    elif kind == 3:
+        for i in range(n):
+            left = line[i - bpp] if i >= bpp else 0
+            line[i] = (line[i] + ((left + prior[i]) >> 1)) & 0xFF
+    elif kind == 4:
+        for i in range(n):
+            a = line[i - bpp] if i >= bpp else 0
+            b = prior[i]
+            c = prior[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            if pa <= pb and pa <= pc:
+                predictor = a
+            elif pb <= pc:
+                predictor = b
+            else:
+                predictor = c
+            line[i] = (line[i] + predictor) & 0xFF
+    else:
+        raise ValueError(f'Unknown PNG filter {kind}!')
+
+
+def read_chunks(file):
+    """Iterate over the chunks of a PNG file.
+
+    Args:
+        file (binary file): Input, after the signature.
+
+    Raises:
+        ValueError: If the file ends in the middle of a chunk or a checksum is wrong.
+
+    Yields:
+        tuple: Chunk type and data.
+    """
+    while True:
+        header = file.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise ValueError('The PNG file is truncated!')
+        length, kind = struct.unpack('>I4s', header)
+        data = file.read(length)
+        crc = file.read(4)
+        if len(data) < length or len(crc) < 4:
+            raise ValueError('The PNG file is truncated!')
+        if struct.unpack('>I', crc)[0] != zlib.crc32(data, zlib.crc32(kind)):
+            raise ValueError(f'Wrong checksum in the {kind.decode("latin-1")} chunk!')
+        yield kind, data
+        if kind == b'IEND':
+            return
+
+
+# Channels of each PNG color type.
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def read_png_header(file):
+    """Read the signature and the header of a PNG file.
+
+    Args:
+        file (binary file): Input, at the start of the file.
+
+    Raises:
+        ValueError: If the file is not a PNG file, or isn't supported.
+
+    Returns:
+        tuple: width, height, bit depth, color type and an iterator of the other chunks.
+    """
+    if file.read(8) != PNG_SIGNATURE:
+        raise ValueError('Not a PNG file!')
+
+    chunks = read_chunks(file)
+    kind, data = next(chunks, (None, None))
+    if kind != b'IHDR':
+        raise ValueError('The PNG file has no header!')
+
+    w, h, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+    if interlace:
+        raise ValueError('Interlaced PNG files are not supported!')
+    if color_type not in PNG_CHANNELS or depth not in (1, 2, 4, 8, 16):
+        raise ValueError('Unknown PNG color type!')
+    return w, h, depth, color_type, chunks
+
+
+def read_palette(kind, data, color_type, palette, key):
+    """Read a PLTE or a tRNS chunk.
+
+    Args:
+        kind (bytes): Chunk type.
+        data (bytes): Chunk data.
+        color_type (int): PNG color type.
+        palette (list): Packed colors of the palette so far.
+        key (tuple): The transparent color so far, or None.
+
+    Returns:
+        tuple: The palette and the transparent color, as samples.
+    """
+    if kind == b'PLTE':
+        palette = [(r << 24 | g << 16 | b << 8 | 0xFF) for r, g, b in struct.iter_unpack('>BBB', data)]
+    elif kind == b'tRNS':
+        if color_type == 3:
+            for i, alpha in enumerate(data[:len(palette)]):
+                palette[i] = palette[i] & 0xFFFFFF00 | alpha
+        else:
+            key = struct.unpack(f'>{len(data) // 2}H', data)
+    return palette, key
+
+
+def row_converter(w, depth, color_type, palette=(), key=None):
+    """Make a function that converts unfiltered rows to packed colors.
+
+    Args:
+        w (int): width, in pixels
+        depth (int): Bit depth.
+        color_type (int): PNG color type.
+        palette (list, optional): Packed colors, for palette indexed files.
+        key (tuple, optional): Samples of the transparent color, from the tRNS chunk.
+
+    Returns:
+        function: Called with a row as bytes, returns an array of packed colors.
+    """
+    channels = PNG_CHANNELS[color_type]
+
+    def samples(line):
+        # Samples of a row as integers, for the bit depths that are not 8.
+        if depth == 8:
+            return line
+        if depth == 16:
+            return struct.unpack(f'>{len(line) // 2}H', line)
+        mask = (1 << depth) - 1
+        values = []
+        for byte in line:
+            for shift in range(8 - depth, -1, -depth):
+                values.append((byte >> shift) & mask)
+        return values[:w*channels]
+
+    def convert(line):
+        # A row of any color type to packed colors.
+        if color_type == 6 and depth == 8:
+            return bytes_rgba(bytes(line))
+
+        values = samples(line)
+        scale = {1: 255, 2: 85, 4: 17, 8: 1}.get(depth)
+        row = array('I')
+        for i in range(w):
+            if color_type == 3:
+                row.append(palette[values[i]] if values[i] < len(palette) else EMPTY)
+                continue
+            pixel = values[i*channels:(i+1)*channels]
+            if key is not None and tuple(pixel[:len(key)]) == key:
+                row.append(EMPTY)
+                continue
+            if depth == 16:
+                pixel = [v >> 8 for v in pixel]
+            elif scale != 1:
+                pixel = [v*scale for v in pixel]
+            if color_type == 0:
+                r = g = b = pixel[0]
+                a = 0xFF
+            elif color_type == 4:
+                r = g = b = pixel[0]
+                a = pixel[1]
+            elif color_type == 2:
+                r, g, b = pixel
+                a = 0xFF
+            else:
+                r, g, b, a = pixel
+            row.append(EMPTY if a == 0 else r << 24 | g << 16 | b << 8 | a)
+        return row
+
+    return convert
+
+
+def read_png_rows(path):
+    """Read a PNG file row by row. Supports every color type and bit depth,
+    but not interlaced files.
+
+    Args:
+        path (str): File name.
+
+    Raises:
+        ValueError: If the file is not a PNG file, or isn't supported.
+
+    Returns:
+        tuple: width, height and a generator of rows as packed colors.
+    """
+    file = open(path, 'rb')
+    try:
+        w, h, depth, color_type, chunks = read_png_header(file)
+    except ValueError:
+        file.close()
+        raise
+
+    bits = PNG_CHANNELS[color_type]*depth
+    bpp = max(bits // 8, 1)
+    stride = (w*bits + 7) // 8
+
+    def rows():
+        palette = []
+        key = None
+        convert = None
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        prior = bytearray(stride)
+        done = 0
+
+        try:
+            for kind, data in chunks:
+                if kind in (b'PLTE', b'tRNS'):
+                    palette, key = read_palette(kind, data, color_type, palette, key)
+                elif kind == b'IDAT':
+                    # The palette comes before the image data.
+                    if convert is None:
+                        convert = row_converter(w, depth, color_type, palette, key)
+                    try:
+                        buffer += decompressor.decompress(data)
+                    except zlib.error as error:
+                        raise ValueError(f'The PNG file is damaged: {error}')
+                    while len(buffer) > stride and done < h:
+                        line = buffer[1:stride + 1]
+                        unfilter(buffer[0], line, prior, bpp)
+                        del buffer[:stride + 1]
+                        prior = line
+                        done += 1
+                        yield convert(line)
+        finally:
+            file.close()
+
+        if done < h:
+            raise ValueError('The PNG file has missing rows!')
+        # The image data should end right after the last row.
+        if not decompressor.eof:
+            raise ValueError('The PNG file is damaged: the image data ends early!')
+        if buffer or decompressor.unused_data:
+            raise ValueError('The PNG file is damaged: there is data after the last row!')
+
+    return w, h, rows()
+
+
+def read_png(path):
+    """Load a PNG file as a document. Transparent pixels become empty painting pixels.
+
+    Args:
+        path (str): File name.
+
+    Raises:
+        ValueError: If the file is not a PNG file, or isn't supported.
+
+    Returns:
+        PPixelDocument: The document.
+    """
+    w, h, rows = read_png_rows(path)
+    doc = PPixelDocument(w, h)
+    for y, row in enumerate(rows):
+        doc.put_row(y, 0, row)
+    return doc
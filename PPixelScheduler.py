@@ -0,0 +1,127 @@
+import time
+
+# Tools only report which rectangles are dirty, the scheduler collects them and
+# redraws once per frame. Overlapping or touching rectangles are merged, so the
+# cost of a frame depends on the changed area, not on how many events happened.
+
+
+class RenderScheduler():
+    """
+    Collects dirty rectangles and flushes them at most once per frame,
+    using after_idle/after of a tkinter widget.
+    """
+    def __init__(self, widget, render, frame_ms=16, max_regions=32, stats=None):
+        """Create a scheduler.
+
+        Args:
+            widget (tkinter widget): Used for after_idle, after and after_cancel.
+            render (function): Called as render(x0, y0, x1, y1) for each merged rectangle.
+            frame_ms (int, optional): Frame budget in milliseconds. Flushes are at least this far apart.
+            max_regions (int, optional): If there are more rectangles than this, they are merged into one.
+            stats (EventStats, optional): If given, every flush is timed as 'render'.
+        """
+        self.widget = widget
+        self.render = render
+        self.frame_ms = frame_ms
+        self.max_regions = max_regions
+        self.stats = stats
+
+        # Dirty rectangles as [x0, y0, x1, y1] lists, x1 and y1 are exclusive.
+        self.regions = []
+        self.after_id = None
+        self.last_flush = 0.0
+
+    def set_frame_budget(self, frame_ms):
+        """Change the frame budget.
+
+        Args:
+            frame_ms (int): Milliseconds between two flushes.
+        """
+        self.frame_ms = frame_ms
+
+    def invalidate(self, x0, y0, x1, y1):
+        """Mark a rectangle as dirty, and make sure that a flush is scheduled.
+
+        Args:
+            x0 (int): left
+            y0 (int): top
+            x1 (int): right, exclusive
+            y1 (int): bottom, exclusive
+        """
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        # Merging with every rectangle that overlaps or touches the new one.
+        # A merged rectangle can touch others, so repeating until nothing changes.
+        new = [x0, y0, x1, y1]
+        merged = True
+        while merged:
+            merged = False
+            for region in self.regions:
+                if (region[0] <= new[2] and new[0] <= region[2] and
+                        region[1] <= new[3] and new[1] <= region[3]):
+                    new = [min(region[0], new[0]), min(region[1], new[1]),
+                           max(region[2], new[2]), max(region[3], new[3])]
+                    self.regions.remove(region)
+                    merged = True
+                    break
+        self.regions.append(new)
+
+        if len(self.regions) > self.max_regions:
+            self.regions = [self.bounds()]
+
+        self.schedule()
+
+    def bounds(self):
+        """Return the rectangle that covers all of the dirty rectangles.
+
+        Returns:
+            list: x0, y0, x1, y1 respectively, or None if nothing is dirty.
+        """
+        if not self.regions:
+            return None
+        return [min(r[0] for r in self.regions), min(r[1] for r in self.regions),
+                max(r[2] for r in self.regions), max(r[3] for r in self.regions)]
+
+    def schedule(self):
+        """Schedule a flush, if there isn't one already.
+        If the last flush was less than a frame ago, waits for the rest of the frame.
+        """
+        if self.after_id is not None:
+            return
+
+        wait = self.frame_ms - (time.perf_counter() - self.last_flush)*1000
+        if wait <= 0:
+            self.after_id = self.widget.after_idle(self.flush)
+        else:
+            self.after_id = self.widget.after(int(wait) + 1, self.flush)
+
+    def flush(self):
+        """Redraw all of the dirty rectangles now."""
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+
+        start = time.perf_counter()
+        regions, self.regions = self.regions, []
+        for region in regions:
+            self.render(*region)
+
+        self.last_flush = time.perf_counter()
+        if self.stats is not None and regions:
+            self.stats.record('render', self.last_flush - start)
+
+    def clear(self):
+        """Forget the dirty rectangles without redrawing them."""
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.regions = []
+
+    def pending(self):
+        """Return the number of dirty rectangles waiting for the next flush.
+
+        Returns:
+            int: Number of rectangles.
+        """
+        return len(self.regions)
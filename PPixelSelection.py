@@ -0,0 +1,67 @@
+from array import array
+
+# Rectangular regions of painting pixels, for the selection and the clipboard.
+# A region is an array of packed colors, row by row, like PPixelDocument.get_region
+# returns, together with its width and height. Flipping and rotating only permute
+# rows and columns with slices, so they don't look at the painting pixels one by one.
+
+
+def normalize_rect(x0, y0, x1, y1):
+    """Order the corners of a rectangle, which has the painting pixels of both corners.
+
+    Args:
+        x0 (int): corner
+        y0 (int): corner
+        x1 (int): opposite corner
+        y1 (int): opposite corner
+
+    Returns:
+        tuple: x0, y0, x1, y1 respectively, x1 and y1 are exclusive.
+    """
+    return min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1
+
+
+def flip_region(region, w, h, horizontal=True):
+    """Mirror a region.
+
+    Args:
+        region (array): Packed colors, row by row.
+        w (int): width of the region
+        h (int): height of the region
+        horizontal (bool, optional): True for left-right, False for top-bottom.
+
+    Returns:
+        array: The mirrored region, with the same size.
+    """
+    flipped = array(region.typecode)
+    if horizontal:
+        for y in range(h):
+            flipped.extend(region[y*w:(y + 1)*w][::-1])
+    else:
+        for y in range(h - 1, -1, -1):
+            flipped.extend(region[y*w:(y + 1)*w])
+    return flipped
+
+
+def rotate_region(region, w, h, clockwise=True):
+    """Rotate a region by 90 degrees. Every row of the result is a column of
+    the region, taken with a single slice.
+
+    Args:
+        region (array): Packed colors, row by row.
+        w (int): width of the region
+        h (int): height of the region
+        clockwise (bool, optional): Direction of the rotation.
+
+    Returns:
+        tuple: The rotated region, its width and its height.
+    """
+    rotated = array(region.typecode)
+    for x in range(w):
+        if clockwise:
+            # Column x from the bottom to the top.
+            rotated.extend(region[(h - 1)*w + x::-w])
+        else:
+            # Column w-1-x from the top to the bottom.
+            rotated.extend(region[w - 1 - x::w])
+    return rotated, h, w
@@ -0,0 +1,137 @@
+import json
+import time
+from collections import deque
+
+# Timings of the event handlers while the editor is running. Handlers are wrapped
+# with EventStats.timed, which only adds two perf_counter calls to an event, so the
+# timings are always collected and can be shown or exported whenever needed.
+
+
+def percentile(values, p):
+    """Return a percentile, using the nearest rank.
+
+    Args:
+        values (list): Numbers.
+        p (float): Between 0 and 100.
+
+    Returns:
+        float: The percentile, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[rank]
+
+
+class EventStats():
+    """
+    Rolling event timings. The last window timings of every handler are kept,
+    so the percentiles follow what the editor is doing now.
+    """
+    def __init__(self, window=256):
+        """Create empty statistics.
+
+        Args:
+            window (int, optional): Number of timings that are kept for each handler.
+        """
+        self.window = window
+
+        # Seconds of the latest events by handler name, and how many events there were.
+        self.times = {}
+        self.counts = {}
+
+        # The latest event of any handler.
+        self.last_name = None
+        self.last = 0.0
+
+    def record(self, name, seconds):
+        """Add a timing.
+
+        Args:
+            name (str): Name of the handler.
+            seconds (float): How long the event took.
+        """
+        if name not in self.times:
+            self.times[name] = deque(maxlen=self.window)
+            self.counts[name] = 0
+        self.times[name].append(seconds)
+        self.counts[name] += 1
+        self.last_name, self.last = name, seconds
+
+    def timed(self, name, handler):
+        """Wrap a handler, so that every call of it is timed.
+
+        Args:
+            name (str): Name of the handler in the statistics.
+            handler (function): Event handler.
+
+        Returns:
+            function: The wrapped handler, returns what the handler returns.
+        """
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return wrapper
+
+    def latencies(self, name=None):
+        """Return the kept timings.
+
+        Args:
+            name (str, optional): Name of a handler, every handler if not given.
+
+        Returns:
+            list: Seconds.
+        """
+        if name is not None:
+            return list(self.times.get(name, ()))
+        return [seconds for times in self.times.values() for seconds in times]
+
+    def summary(self):
+        """Summarize the timings, in milliseconds.
+
+        Returns:
+            dict: Last event, rolling p50 and p99 of every event and of each handler.
+        """
+        every = self.latencies()
+        handlers = {}
+        for name, times in self.times.items():
+            handlers[name] = {
+                'events': self.counts[name],
+                'p50_ms': percentile(times, 50)*1000,
+                'p99_ms': percentile(times, 99)*1000,
+                'max_ms': max(times)*1000,
+            }
+        return {
+            'last_event': self.last_name,
+            'last_ms': self.last*1000,
+            'p50_ms': percentile(every, 50)*1000,
+            'p99_ms': percentile(every, 99)*1000,
+            'handlers': handlers,
+        }
+
+    def clear(self):
+        """Forget every timing."""
+        self.times = {}
+        self.counts = {}
+        self.last_name = None
+        self.last = 0.0
+
+    def export(self, path, extra=None):
+        """Write the summary and the kept timings to a JSON file.
+
+        Args:
+            path (str): File name.
+            extra (dict, optional): More counters to write, like the document size.
+        """
+        data = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'summary': self.summary(),
+            'counters': extra or {},
+            'latencies_ms': {name: [seconds*1000 for seconds in times] for name, times in self.times.items()},
+        }
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=2)
@@ -0,0 +1,83 @@
+# A stroke is everything that is painted between pressing and releasing the mouse button.
+# Consecutive mouse samples are joined with lines, so fast strokes don't leave gaps,
+# and painting pixels that are already written in the stroke are skipped.
+
+
+def bresenham(x0, y0, x1, y1):
+    """Painting pixels of a line, using Bresenham's line algorithm.
+
+    Args:
+        x0 (int): start
+        y0 (int): start
+        x1 (int): end
+        y1 (int): end
+
+    Returns:
+        list: (x, y) tuples, from start to end, both included.
+    """
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx + dy
+
+    cells = []
+    while True:
+        cells.append((x0, y0))
+        if x0 == x1 and y0 == y1:
+            return cells
+        e2 = 2*err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+
+
+class Stroke():
+    """
+    Keeps the state of a stroke: the color, the last sample and the painting
+    pixels that are already written.
+    """
+    def __init__(self, w, h, color, margin=0):
+        """Start a stroke.
+
+        Args:
+            w (int): width of the document
+            h (int): height of the document
+            color (int): Packed color of the stroke.
+            margin (int, optional): Painting pixels this far outside of the document are
+            still returned, for brushes that reach into the document from outside.
+        """
+        self.w, self.h = w, h
+        self.margin = margin
+        self.color = color
+        self.last = None
+        self.visited = set()
+
+    def add(self, x, y):
+        """Add a sample to the stroke.
+
+        Args:
+            x (int): painting pixel coordinate, may be outside of the document
+            y (int): painting pixel coordinate, may be outside of the document
+
+        Returns:
+            list: New painting pixels to write, the ones inside the document
+            (and the margin) which weren't written in this stroke yet.
+        """
+        if self.last is None:
+            line = [(x, y)]
+        else:
+            line = bresenham(self.last[0], self.last[1], x, y)
+        self.last = (x, y)
+
+        w, h, m, visited = self.w, self.h, self.margin, self.visited
+        cells = []
+        for cell in line:
+            if cell in visited:
+                continue
+            if -m <= cell[0] < w + m and -m <= cell[1] < h + m:
+                visited.add(cell)
+                cells.append(cell)
+        return cells
@@ -0,0 +1,107 @@
+from math import atan2, cos, floor, pi, sin
+
+# Symmetric painting. A symmetry maps a painting pixel to its images: the mirrored
+# ones, or the rotated ones around the center of the document. Every image is an affine
+# map, x' = a*x + b*y + c and y' = d*x + e*y + f, which is split into a table for the
+# columns and a table for the rows, so an image of a painting pixel is two lookups and
+# an addition for each coordinate. The tables depend only on the size of the document.
+
+MODES = ('horizontal', 'vertical', 'both', 'radial')
+
+
+class Symmetry():
+    """
+    The images of the painting pixels for a symmetry mode and a document size.
+    The first image is always the painting pixel itself.
+    """
+    def __init__(self, w, h, mode, folds=4):
+        """Precompute the tables.
+
+        Args:
+            w (int): width of the document
+            h (int): height of the document
+            mode (str): One of MODES. 'horizontal' mirrors left and right, 'vertical'
+            mirrors up and down, 'both' does both, and 'radial' rotates around the center.
+            folds (int, optional): Amount of images for 'radial', at least 2.
+
+        Raises:
+            ValueError: If the mode is unknown, or there are less than 2 folds.
+        """
+        if mode not in MODES:
+            raise ValueError(f'Unknown symmetry: {mode}')
+        if mode == 'radial' and folds < 2:
+            raise ValueError('Radial symmetry needs at least 2 folds!')
+
+        self.w, self.h = w, h
+        self.mode = mode
+        self.folds = folds if mode == 'radial' else {'both': 4}.get(mode, 2)
+
+        # The axes go through the center of the document, between painting pixels
+        # if the size is even, so x and w - 1 - x are images of each other.
+        self.cx, self.cy = (w - 1) / 2, (h - 1) / 2
+        cx, cy = self.cx, self.cy
+        if mode == 'horizontal':
+            self.maps = [(-1, 0, w - 1, 0, 1, 0)]
+        elif mode == 'vertical':
+            self.maps = [(1, 0, 0, 0, -1, h - 1)]
+        elif mode == 'both':
+            self.maps = [(-1, 0, w - 1, 0, 1, 0), (1, 0, 0, 0, -1, h - 1), (-1, 0, w - 1, 0, -1, h - 1)]
+        else:
+            self.maps = []
+            for k in range(1, folds):
+                c, s = cos(2*pi*k / folds), sin(2*pi*k / folds)
+                self.maps.append((c, -s, cx - c*cx + s*cy, s, c, cy - s*cx - c*cy))
+
+        # The column and row tables of every image. Half is added, so that flooring rounds.
+        self.tables = [([a*x + c + 0.5 for x in range(w)], [b*y for y in range(h)],
+                        [d*x + f + 0.5 for x in range(w)], [e*y for y in range(h)])
+                       for a, b, c, d, e, f in self.maps]
+
+    def images(self, x, y):
+        """Return the images of a painting pixel, which might be outside of the document.
+
+        Args:
+            x (int): painting pixel coordinate, may be outside of the document
+            y (int): painting pixel coordinate, may be outside of the document
+
+        Returns:
+            list: (x, y) tuples, the painting pixel first.
+        """
+        if 0 <= x < self.w and 0 <= y < self.h:
+            return [(x, y)] + [(floor(xx[x] + xy[y]), floor(yx[x] + yy[y])) for xx, xy, yx, yy in self.tables]
+        return [(x, y)] + [(floor(a*x + b*y + c + 0.5), floor(d*x + e*y + f + 0.5))
+                           for a, b, c, d, e, f in self.maps]
+
+    def sector(self, x, y):
+        """Return the part of the document that a point is in. Every image is in its own
+        part, so the changes of a symmetric write can be drawn part by part.
+
+        Args:
+            x (float): coordinate
+            y (float): coordinate
+
+        Returns:
+            int: Between 0 and folds - 1.
+        """
+        if self.mode == 'horizontal':
+            return int(x > self.cx)
+        if self.mode == 'vertical':
+            return int(y > self.cy)
+        if self.mode == 'both':
+            return int(x > self.cx) + 2*int(y > self.cy)
+        return int((atan2(y - self.cy, x - self.cx) % (2*pi)) * self.folds / (2*pi)) % self.folds
+
+    def split(self, spans):
+        """Split spans by the part of the document that they are in.
+
+        Args:
+            spans (list): (y, x_start, x_end) tuples.
+
+        Returns:
+            list: Lists of spans, without the empty ones.
+        """
+        parts = [[] for _ in range(self.folds)]
+        for span in spans:
+            y, x0, x1 = span
+            parts[self.sector((x0 + x1 - 1) / 2, y)].append(span)
+        return [part for part in parts if part]
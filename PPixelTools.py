@@ -0,0 +1,469 @@
+from math import ceil, floor, sqrt
+from PPixelColor import EMPTY, hex_to_rgba, rgba_to_hex
+from PPixelFill import scanline_fill
+from PPixelSelection import normalize_rect
+from PPixelStroke import Stroke, bresenham
+
+# The tools of the canvas. A tool is an object with press, drag and release hooks,
+# which get painting pixel coordinates and return the writes to do, as a list of
+# (spans, color) tuples. The canvas does the writes in bulk and keeps the history,
+# so a tool doesn't touch the document, except for reading it. The select tool
+# is the exception, it uses the selection methods of the canvas.
+#
+# Tools are found by name in TOOLS. A new tool is added with register.
+#
+# Spans are (y, x_start, x_end) tuples, x_end is exclusive, like scanline_fill returns.
+#
+# The painter, the eraser and the fill tool follow the symmetry of the canvas, if it has
+# one. They do the same for every image of the painting pixel under the mouse, and
+# return everything together, so a symmetric stroke is still a single write.
+
+
+def merge_spans(spans):
+    """Join overlapping or touching spans, so that every painting pixel is written once.
+
+    Args:
+        spans (iterable): (y, x_start, x_end) tuples.
+
+    Returns:
+        list: (y, x_start, x_end) tuples, sorted and not overlapping.
+    """
+    merged = []
+    for y, x0, x1 in sorted(spans):
+        if merged and merged[-1][0] == y and x0 <= merged[-1][2]:
+            if x1 > merged[-1][2]:
+                merged[-1] = (y, merged[-1][1], x1)
+        else:
+            merged.append((y, x0, x1))
+    return merged
+
+
+def clip_spans(spans, w, h):
+    """Clip spans to the document.
+
+    Args:
+        spans (iterable): (y, x_start, x_end) tuples.
+        w (int): width of the document
+        h (int): height of the document
+
+    Returns:
+        list: (y, x_start, x_end) tuples, without the empty ones.
+    """
+    clipped = []
+    for y, x0, x1 in spans:
+        x0, x1 = max(x0, 0), min(x1, w)
+        if 0 <= y < h and x0 < x1:
+            clipped.append((y, x0, x1))
+    return clipped
+
+
+class Brush():
+    """
+    The shape that the painter and the eraser stamp. The mask is precomputed
+    as horizontal spans relative to the center, so a stamp is a few row writes
+    instead of a write for every painting pixel.
+    """
+    SHAPES = ('square', 'circle', 'custom')
+
+    def __init__(self, size=1, shape='square', mask=None):
+        """Create a brush.
+
+        Args:
+            size (int, optional): width and height, in painting pixels.
+            shape (str, optional): 'square', 'circle' or 'custom'.
+            mask (list, optional): Rows of the custom shape, each row is a string or a
+            sequence, where '#' or truthy items are painted. Only for 'custom'.
+
+        Raises:
+            ValueError: If the shape is unknown, or the size is below 1.
+        """
+        if shape not in self.SHAPES:
+            raise ValueError(f'Unknown brush shape: {shape}')
+        if shape == 'custom':
+            if not mask:
+                raise ValueError('A custom brush needs a mask!')
+            rows = [[item == '#' if isinstance(item, str) else bool(item) for item in row] for row in mask]
+            size = max(len(rows), max(len(row) for row in rows))
+        else:
+            if size < 1:
+                raise ValueError('The brush size should be at least 1!')
+            c = (size - 1) / 2
+            r = (size / 2)**2
+            rows = [[shape == 'square' or (i - c)**2 + (j - c)**2 <= r for i in range(size)]
+                    for j in range(size)]
+
+        self.size, self.shape = size, shape
+
+        # (dy, dx_start, dx_end) tuples, relative to the painting pixel under the mouse.
+        center = (size - 1) // 2
+        self.spans = []
+        for dy, row in enumerate(rows):
+            start = None
+            for dx, painted in enumerate(list(row) + [False]):
+                if painted and start is None:
+                    start = dx
+                elif not painted and start is not None:
+                    self.spans.append((dy - center, start - center, dx - center))
+                    start = None
+
+        # How far the stamp reaches from its center, for strokes that start outside.
+        self.reach = size
+
+    def stamp(self, x, y, w, h):
+        """Return the spans of a stamp, clipped to the document.
+
+        Args:
+            x (int): center
+            y (int): center
+            w (int): width of the document
+            h (int): height of the document
+
+        Returns:
+            list: (y, x_start, x_end) tuples.
+        """
+        spans = []
+        for dy, dx0, dx1 in self.spans:
+            sy, sx0, sx1 = y + dy, max(x + dx0, 0), min(x + dx1, w)
+            if 0 <= sy < h and sx0 < sx1:
+                spans.append((sy, sx0, sx1))
+        return spans
+
+
+class Tool():
+    """
+    Base of the tools. Every hook gets the canvas and painting pixel coordinates,
+    and returns a list of (spans, color) writes, or None if there is nothing to write.
+    Press only comes inside the document, drag might be outside of it.
+    """
+    # Name in TOOLS, and the text of the tool indicator.
+    name = ''
+    label = ''
+
+    # If False, drag is not called.
+    drags = False
+
+    def press(self, canvas, x, y):
+        """Called when the button is pressed."""
+        return None
+
+    def drag(self, canvas, x, y):
+        """Called for each motion sample while the button is pressed."""
+        return None
+
+    def release(self, canvas):
+        """Called when the button is released."""
+        return None
+
+
+class PaintTool(Tool):
+    """
+    Stamps the brush of the canvas along the mouse, with the painting color.
+    Samples are joined with lines, so fast strokes don't leave gaps. With a
+    symmetry, every image of the mouse has its own stroke.
+    """
+    name = 'paint'
+    label = 'paint tool'
+    drags = True
+
+    def __init__(self):
+        self.strokes = None
+
+    def color(self, canvas):
+        """Returns the packed color that the tool writes."""
+        return hex_to_rgba(canvas.color_hex)
+
+    def press(self, canvas, x, y):
+        images = canvas.symmetry.folds if canvas.symmetry is not None else 1
+        self.strokes = [Stroke(canvas.w, canvas.h, self.color(canvas), margin=canvas.brush.reach)
+                        for _ in range(images)]
+        return self.drag(canvas, x, y)
+
+    def drag(self, canvas, x, y):
+        if self.strokes is None:
+            return self.press(canvas, x, y)
+
+        brush, w, h = canvas.brush, canvas.w, canvas.h
+        images = canvas.symmetry.images(x, y) if len(self.strokes) > 1 else ((x, y),)
+        spans = []
+        for stroke, (ix, iy) in zip(self.strokes, images):
+            for cx, cy in stroke.add(ix, iy):
+                spans.extend(brush.stamp(cx, cy, w, h))
+        if not spans:
+            return None
+        return [(merge_spans(spans), self.strokes[0].color)]
+
+    def release(self, canvas):
+        self.strokes = None
+        return None
+
+
+class EraseTool(PaintTool):
+    """
+    Like the painter, but empties.
+    """
+    name = 'erase'
+    label = 'eraser'
+
+    def color(self, canvas):
+        return EMPTY
+
+
+class PickerTool(Tool):
+    """
+    Takes the color of a painted painting pixel as the painting color, from the
+    current layer or from the composite, like the canvas option says.
+    """
+    name = 'picker'
+    label = 'color picker'
+
+    def press(self, canvas, x, y):
+        color = canvas.sample_document(canvas.picker_sample).get(x, y)
+        if color != EMPTY:
+            canvas.color_hex = rgba_to_hex(color)
+            # Event is for informing the program for updating the indicator of paint tool.
+            canvas.event_generate('<<PickedColorChangeIndicator>>')
+        return None
+
+
+class FillTool(Tool):
+    """
+    Fills the area under the mouse with the painting color, using the options
+    of the canvas. Without a tolerance, palette indexes are compared instead of colors.
+    The area is found on the current layer or on the composite, and written to the current layer.
+    With a symmetry, the areas under the images of the mouse are filled too.
+    """
+    name = 'fill'
+    label = 'fill tool'
+
+    def press(self, canvas, x, y):
+        doc = canvas.sample_document(canvas.fill_sample)
+        sample = doc.get if canvas.fill_tolerance else doc.get_index
+        images = canvas.symmetry.images(x, y) if canvas.symmetry is not None else ((x, y),)
+
+        spans = []
+        for ix, iy in images:
+            # An image that is in an area that is filled already is skipped.
+            if not doc.inside(ix, iy) or any(sy == iy and sx0 <= ix < sx1 for sy, sx0, sx1 in spans):
+                continue
+            spans.extend(scanline_fill(doc.w, doc.h, ix, iy, sample,
+                                       connectivity=canvas.fill_connectivity, tolerance=canvas.fill_tolerance))
+        if len(images) > 1:
+            spans = merge_spans(spans)
+        return [(spans, hex_to_rgba(canvas.color_hex))]
+
+
+def rect_spans(x0, y0, x1, y1, filled=False):
+    """Spans of a rectangle, between two corners.
+
+    Args:
+        x0 (int): corner, included
+        y0 (int): corner, included
+        x1 (int): opposite corner, included
+        y1 (int): opposite corner, included
+        filled (bool, optional): If False, only the outline.
+
+    Returns:
+        list: (y, x_start, x_end) tuples.
+    """
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+    spans = []
+    for y in range(y0, y1 + 1):
+        if filled or y in (y0, y1) or x1 - x0 < 2:
+            spans.append((y, x0, x1 + 1))
+        else:
+            spans.extend(((y, x0, x0 + 1), (y, x1, x1 + 1)))
+    return spans
+
+
+def ellipse_spans(x0, y0, x1, y1, filled=False):
+    """Spans of an ellipse that fits in the rectangle between two corners.
+
+    Args:
+        x0 (int): corner, included
+        y0 (int): corner, included
+        x1 (int): opposite corner, included
+        y1 (int): opposite corner, included
+        filled (bool, optional): If False, only the outline.
+
+    Returns:
+        list: (y, x_start, x_end) tuples.
+    """
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+    cx, cy = (x0 + x1 + 1) / 2, (y0 + y1 + 1) / 2
+    rx, ry = (x1 - x0 + 1) / 2, (y1 - y0 + 1) / 2
+
+    # The filled row for every y, as inclusive x_start, x_end, taking painting pixel centers.
+    rows = {}
+    for y in range(y0, y1 + 1):
+        t = (y + 0.5 - cy) / ry
+        half = rx*sqrt(max(1 - t*t, 0))
+        a, b = ceil(cx - half - 0.5), floor(cx + half - 0.5)
+        if a > b:
+            a = b = int(cx)
+        rows[y] = (a, b)
+
+    if filled:
+        return [(y, a, b + 1) for y, (a, b) in rows.items()]
+
+    # A painting pixel is on the outline if a neighbour is outside. Inside are
+    # the ones that are also in the rows above and below, and not at an end.
+    spans = []
+    for y, (a, b) in rows.items():
+        above, below = rows.get(y - 1), rows.get(y + 1)
+        if above is None or below is None:
+            spans.append((y, a, b + 1))
+            continue
+        inner0, inner1 = max(a + 1, above[0], below[0]), min(b - 1, above[1], below[1])
+        if inner0 > inner1:
+            spans.append((y, a, b + 1))
+        else:
+            spans.extend(((y, a, inner0), (y, inner1 + 1, b + 1)))
+    return spans
+
+
+class ShapeTool(Tool):
+    """
+    Base of the shape tools. While dragging, the shape between the pressed painting
+    pixel and the mouse is shown as a preview on the canvas, and the document isn't
+    touched. The shape is written as one change when the button is released.
+    """
+    drags = True
+
+    def __init__(self):
+        self.start = self.end = None
+
+    def spans(self, canvas, x0, y0, x1, y1):
+        """Return the spans of the shape between two corners, not clipped."""
+        return []
+
+    def current(self, canvas):
+        """Returns the clipped spans of the shape now."""
+        return clip_spans(self.spans(canvas, *self.start, *self.end), canvas.w, canvas.h)
+
+    def press(self, canvas, x, y):
+        self.start = self.end = (x, y)
+        canvas.show_preview(self.current(canvas), hex_to_rgba(canvas.color_hex))
+        return None
+
+    def drag(self, canvas, x, y):
+        if self.start is None:
+            return self.press(canvas, x, y)
+        if (x, y) != self.end:
+            self.end = (x, y)
+            canvas.show_preview(self.current(canvas), hex_to_rgba(canvas.color_hex))
+        return None
+
+    def release(self, canvas):
+        canvas.clear_preview()
+        if self.start is None:
+            return None
+        spans = merge_spans(self.current(canvas))
+        self.start = self.end = None
+        return [(spans, hex_to_rgba(canvas.color_hex))]
+
+
+class LineTool(ShapeTool):
+    """
+    A line, stamped with the brush of the canvas.
+    """
+    name = 'line'
+    label = 'line'
+
+    def spans(self, canvas, x0, y0, x1, y1):
+        spans = []
+        for x, y in bresenham(x0, y0, x1, y1):
+            spans.extend(canvas.brush.stamp(x, y, canvas.w, canvas.h))
+        return merge_spans(spans)
+
+
+class RectTool(ShapeTool):
+    """
+    A rectangle, outlined or filled.
+    """
+    def __init__(self, filled=False):
+        super().__init__()
+        self.filled = filled
+        self.name = 'filled rect' if filled else 'rect'
+        self.label = 'filled rect.' if filled else 'rectangle'
+
+    def spans(self, canvas, x0, y0, x1, y1):
+        return rect_spans(x0, y0, x1, y1, self.filled)
+
+
+class EllipseTool(ShapeTool):
+    """
+    An ellipse that fits in the dragged rectangle, outlined or filled.
+    """
+    def __init__(self, filled=False):
+        super().__init__()
+        self.filled = filled
+        self.name = 'filled ellipse' if filled else 'ellipse'
+        self.label = 'filled ellipse' if filled else 'ellipse'
+
+    def spans(self, canvas, x0, y0, x1, y1):
+        return ellipse_spans(x0, y0, x1, y1, self.filled)
+
+
+class SelectTool(Tool):
+    """
+    Dragging outside of the selection selects a rectangle. Dragging inside of it
+    moves the selected painting pixels. They are lifted out of the document on
+    press, only an image item is moved while dragging, and they are written back
+    with a single blit on release. The selection itself lives in the canvas.
+    """
+    name = 'select'
+    label = 'select'
+    drags = True
+
+    def __init__(self):
+        self.start = None
+        self.grab = None
+
+    def press(self, canvas, x, y):
+        selection = canvas.selection
+        if selection is not None and selection[0] <= x < selection[2] and selection[1] <= y < selection[3]:
+            # The offset of the mouse from the top left of the selection.
+            self.grab = (x - selection[0], y - selection[1])
+            canvas.lift_selection()
+        else:
+            self.start = (x, y)
+            canvas.set_selection(normalize_rect(x, y, x, y))
+        return None
+
+    def drag(self, canvas, x, y):
+        if self.grab is not None:
+            canvas.move_floating(x - self.grab[0], y - self.grab[1])
+        elif self.start is not None:
+            canvas.set_selection(normalize_rect(*self.start, x, y))
+        return None
+
+    def release(self, canvas):
+        if self.grab is not None:
+            canvas.drop_floating()
+        self.start = self.grab = None
+        return None
+
+
+# Tools by name. The old tool modes 0-3 are the first four.
+TOOLS = {}
+MODES = ('paint', 'erase', 'picker', 'fill')
+
+
+def register(tool):
+    """Add a tool to TOOLS, replacing a tool with the same name.
+
+    Args:
+        tool (Tool): The tool.
+
+    Returns:
+        Tool: The same tool.
+    """
+    TOOLS[tool.name] = tool
+    return tool
+
+
+for tool in (PaintTool(), EraseTool(), PickerTool(), FillTool(), LineTool(),
+             RectTool(), RectTool(filled=True), EllipseTool(), EllipseTool(filled=True), SelectTool()):
+    register(tool)
@@ -1,14 +1,29 @@
 
 from hashlib import new
+import os
 from tkinter import *
 from tkinter import ttk
 from tkinter import colorchooser
+from tkinter import filedialog
+from tkinter import messagebox
+from PPixelAutosave import RECOVERY_PATH, Autosave, read_recovery
 from PPixelCanvas import PPixelPaintingCanvas
+from PPixelColor import hex_to_rgba
+from PPixelDocument import ANCHORS
+from PPixelExport import write_scaled_png, write_sprite_sheet
+from PPixelImport import ImportJob
+from PPixelPNG import read_png, read_png_header, write_png
 # Importing modules.
 
 # pixel -> pixel as we know
 # ppixel -> PIEpixel or PAINTING pixel
 
+# Biggest width and height of a canvas, in painting pixels.
+MAX_CANVAS_SIZE = 4096
+
+# Biggest size of a painting pixel in an exported file, in pixels.
+MAX_EXPORT_SCALE = 32
+
 class SizeDlg():
     """
     A class for generating new window/size dialogs.
@@ -70,7 +85,7 @@ class SizeDlg():
         hentry.grid(column=1, row=1, sticky=(W, E), pady=4)
 
         # Warning text.
-        warn_text = 'Warning: Width and height\nshould be between 1-256'
+        warn_text = f'Warning: Width and height\nshould be between 1-{MAX_CANVAS_SIZE}'
         warn_label = ttk.Label(frame, text=warn_text, font=('TkDefaultFont', 10), foreground='#5e5e5e', anchor='center', justify='center', )
         warn_label.grid(column=0, row=2, columnspan=2, sticky=(W, E))
         
@@ -110,6 +125,384 @@ class SizeDlg():
         return self.w.get(), self.h.get()
    
 
+class ResizeDlg():
+    """
+    A dialog for resizing or cropping the canvas, keeping the painting pixels.
+    """
+    def __init__(self, subwindow, cv_size, crop=False):
+        """Generate the dialog window.
+
+        Args:
+            subwindow (tkinter root window): A tkinter window.
+            cv_size (tuple): Current width and height.
+            crop (bool, optional): If True, asks for the left and top of the kept part,
+            otherwise asks for an anchor.
+        """
+        root = Toplevel(subwindow)
+        root.title('Crop' if crop else 'Resize Canvas')
+
+        def exitdlg():
+            root.grab_release()
+            root.destroy()
+
+        abs_pointerx = root.winfo_pointerx() - root.winfo_vrootx()
+        abs_pointery = root.winfo_pointery() - root.winfo_vrooty()
+        root.geometry('+%d+%d' % (abs_pointerx, abs_pointery))
+
+        root.focus()
+        root.resizable(False, False)
+        root.protocol('WM_DELETE_WINDOW', exitdlg)
+        root.transient(subwindow)
+        root.wait_visibility()
+        root.grab_set()
+
+        frame = ttk.Frame(root)
+        frame.grid(column=0, row=0, sticky=(N, S, W, E), padx=5, pady=5)
+
+        def entry_check(newval):
+            return newval=='' or newval.isnumeric()
+        entry_check_wrapper = (root.register(entry_check), '%P')
+
+        # The entries, left and top are only for cropping.
+        cvw, cvh = cv_size
+        self.w, self.h = StringVar(value=cvw), StringVar(value=cvh)
+        self.left, self.top = StringVar(value=0), StringVar(value=0)
+        entries = [('Width: ', self.w), ('Height:', self.h)]
+        if crop:
+            entries = [('Left:  ', self.left), ('Top:   ', self.top)] + entries
+
+        for row, (text, variable) in enumerate(entries):
+            ttk.Label(frame, text=text).grid(column=0, row=row, sticky=W)
+            ttk.Entry(frame, width=5, textvariable=variable, validate='key',
+                      validatecommand=entry_check_wrapper).grid(column=1, row=row, sticky=(W, E), pady=4)
+
+        # The anchor, as a 3x3 grid of buttons. The old content stays at the chosen side.
+        self.anchor = StringVar(value='nw')
+        if not crop:
+            anchorframe = ttk.Frame(frame)
+            anchorframe.grid(column=0, row=len(entries), columnspan=2, pady=4)
+            for i, anchor in enumerate(ANCHORS):
+                ttk.Radiobutton(anchorframe, variable=self.anchor, value=anchor).grid(column=i % 3, row=i // 3)
+
+        self.accepted = False
+
+        def setstate():
+            self.accepted = True
+            exitdlg()
+
+        row = len(entries) + 1
+        ttk.Button(frame, text='Ok', command=setstate).grid(column=0, row=row, sticky=(N, S), padx=3, pady=3)
+        ttk.Button(frame, text='Cancel', command=exitdlg).grid(column=1, row=row, sticky=(N, S), padx=3, pady=3)
+
+        root.wait_window()
+
+    def getstate(self):
+        """Returns True if the canvas will be resized, and False otherwise."""
+        return self.accepted
+
+    def getvalues(self):
+        """Return the entered values, empty entries are 0.
+
+        Returns:
+            tuple: left, top, width, height and the anchor.
+        """
+        values = [int(variable.get() or 0) for variable in (self.left, self.top, self.w, self.h)]
+        return (*values, self.anchor.get())
+
+
+class ReplaceDlg():
+    """
+    A dialog for replacing a color with another one. The canvas shows a preview
+    while the colors are being chosen.
+    """
+    def __init__(self, subwindow, old, new, has_selection, preview):
+        """Generate the dialog window.
+
+        Args:
+            subwindow (tkinter root window): A tkinter window.
+            old (str): Hex of the color to replace, at the start.
+            new (str): Hex of the color to replace with, at the start.
+            has_selection (bool): If True, the replacing can be limited to the selection.
+            preview (function): Called as preview(old, new, selection_only) after every change.
+        """
+        root = Toplevel(subwindow)
+        root.title('Replace Color')
+
+        def exitdlg():
+            root.grab_release()
+            root.destroy()
+
+        abs_pointerx = root.winfo_pointerx() - root.winfo_vrootx()
+        abs_pointery = root.winfo_pointery() - root.winfo_vrooty()
+        root.geometry('+%d+%d' % (abs_pointerx, abs_pointery))
+
+        root.focus()
+        root.resizable(False, False)
+        root.protocol('WM_DELETE_WINDOW', exitdlg)
+        root.transient(subwindow)
+        root.wait_visibility()
+        root.grab_set()
+
+        frame = ttk.Frame(root)
+        frame.grid(column=0, row=0, sticky=(N, S, W, E), padx=5, pady=5)
+
+        self.old, self.new = StringVar(value=old), StringVar(value=new)
+        self.selection_only = BooleanVar(value=has_selection)
+
+        def changed():
+            preview(self.old.get(), self.new.get(), self.selection_only.get())
+
+        # A swatch and a button for each color.
+        for row, (text, variable) in enumerate((('Replace:', self.old), ('With:   ', self.new))):
+            ttk.Label(frame, text=text).grid(column=0, row=row, sticky=W)
+            swatch = Label(frame, width=4, background=variable.get(), relief='sunken')
+            swatch.grid(column=1, row=row, sticky=(W, E), padx=3, pady=4)
+
+            def choose(variable=variable, swatch=swatch):
+                color = colorchooser.askcolor(title='Choose Color', parent=root, initialcolor=variable.get())[1]
+                if color is not None:
+                    variable.set(color)
+                    swatch['background'] = color
+                    changed()
+            ttk.Button(frame, text='Choose...', command=choose).grid(column=2, row=row, padx=3)
+
+        ttk.Checkbutton(frame, text='Only in the selection', variable=self.selection_only, command=changed,
+                        state='normal' if has_selection else 'disabled').grid(column=0, row=2, columnspan=3, sticky=W)
+
+        self.accepted = False
+
+        def setstate():
+            self.accepted = True
+            exitdlg()
+
+        ttk.Button(frame, text='Ok', command=setstate).grid(column=0, row=3, sticky=(N, S), padx=3, pady=3)
+        ttk.Button(frame, text='Cancel', command=exitdlg).grid(column=2, row=3, sticky=(N, S), padx=3, pady=3)
+
+        changed()
+        root.wait_window()
+
+    def getstate(self):
+        """Returns True if the color will be replaced, and False otherwise."""
+        return self.accepted
+
+    def getvalues(self):
+        """Return the chosen values.
+
+        Returns:
+            tuple: Hex of the old color, hex of the new color, and True if only the
+            selection is changed.
+        """
+        return self.old.get(), self.new.get(), self.selection_only.get()
+
+
+class ImportDlg():
+    """
+    A dialog for importing a PNG file, asking for the size in painting pixels and
+    the amount of colors.
+    """
+    def __init__(self, subwindow, cv_size):
+        """Generate the dialog window.
+
+        Args:
+            subwindow (tkinter root window): A tkinter window.
+            cv_size (tuple): Width and height at the start.
+        """
+        root = Toplevel(subwindow)
+        root.title('Import')
+
+        def exitdlg():
+            root.grab_release()
+            root.destroy()
+
+        abs_pointerx = root.winfo_pointerx() - root.winfo_vrootx()
+        abs_pointery = root.winfo_pointery() - root.winfo_vrooty()
+        root.geometry('+%d+%d' % (abs_pointerx, abs_pointery))
+
+        root.focus()
+        root.resizable(False, False)
+        root.protocol('WM_DELETE_WINDOW', exitdlg)
+        root.transient(subwindow)
+        root.wait_visibility()
+        root.grab_set()
+
+        frame = ttk.Frame(root)
+        frame.grid(column=0, row=0, sticky=(N, S, W, E), padx=5, pady=5)
+
+        def entry_check(newval):
+            return newval=='' or newval.isnumeric()
+        entry_check_wrapper = (root.register(entry_check), '%P')
+
+        cvw, cvh = cv_size
+        self.w, self.h, self.colors = StringVar(value=cvw), StringVar(value=cvh), StringVar(value=16)
+        entries = [('Width: ', self.w), ('Height:', self.h), ('Colors:', self.colors)]
+        for row, (text, variable) in enumerate(entries):
+            ttk.Label(frame, text=text).grid(column=0, row=row, sticky=W)
+            ttk.Entry(frame, width=5, textvariable=variable, validate='key',
+                      validatecommand=entry_check_wrapper).grid(column=1, row=row, sticky=(W, E), pady=4)
+
+        # Median cut is fast, k-means starts from it and finds closer colors.
+        self.method = StringVar(value='median')
+        ttk.Radiobutton(frame, text='Median Cut', variable=self.method, value='median').grid(column=0, row=3, columnspan=2, sticky=W)
+        ttk.Radiobutton(frame, text='K-Means', variable=self.method, value='kmeans').grid(column=0, row=4, columnspan=2, sticky=W)
+
+        self.accepted = False
+
+        def setstate():
+            self.accepted = True
+            exitdlg()
+
+        ttk.Button(frame, text='Ok', command=setstate).grid(column=0, row=5, sticky=(N, S), padx=3, pady=3)
+        ttk.Button(frame, text='Cancel', command=exitdlg).grid(column=1, row=5, sticky=(N, S), padx=3, pady=3)
+
+        root.wait_window()
+
+    def getstate(self):
+        """Returns True if the file will be imported, and False otherwise."""
+        return self.accepted
+
+    def getvalues(self):
+        """Return the entered values, empty entries are 0.
+
+        Returns:
+            tuple: width, height, amount of colors and the method.
+        """
+        values = [int(variable.get() or 0) for variable in (self.w, self.h, self.colors)]
+        return (*values, self.method.get())
+
+
+class ProgressDlg():
+    """
+    A window that shows the progress of a long work, with a cancel button. It doesn't
+    block, the work is checked by the editor while the window is open.
+    """
+    def __init__(self, subwindow, title, cancel):
+        """Generate the window.
+
+        Args:
+            subwindow (tkinter root window): A tkinter window.
+            title (str): Title of the window.
+            cancel (function): Called when the cancel button is pressed, or the window is closed.
+        """
+        self.root = root = Toplevel(subwindow)
+        root.title(title)
+
+        abs_pointerx = root.winfo_pointerx() - root.winfo_vrootx()
+        abs_pointery = root.winfo_pointery() - root.winfo_vrooty()
+        root.geometry('+%d+%d' % (abs_pointerx, abs_pointery))
+
+        root.resizable(False, False)
+        root.protocol('WM_DELETE_WINDOW', cancel)
+        root.transient(subwindow)
+        root.wait_visibility()
+        root.grab_set()
+
+        frame = ttk.Frame(root)
+        frame.grid(column=0, row=0, sticky=(N, S, W, E), padx=5, pady=5)
+
+        self.value = DoubleVar(value=0)
+        ttk.Progressbar(frame, length=200, maximum=1, variable=self.value).grid(column=0, row=0, padx=3, pady=4)
+        ttk.Button(frame, text='Cancel', command=cancel).grid(column=0, row=1, padx=3, pady=3)
+
+    def set(self, value):
+        """Show the progress.
+
+        Args:
+            value (float): Between 0 and 1.
+        """
+        self.value.set(value)
+
+    def close(self):
+        """Close the window."""
+        self.root.grab_release()
+        self.root.destroy()
+
+
+class ExportDlg():
+    """
+    A dialog for exporting the canvas bigger, asking for the size of a painting pixel
+    in the file, and the space between the frames of a sprite sheet.
+    """
+    def __init__(self, subwindow, cv_size, scale, sheet=False):
+        """Generate the dialog window.
+
+        Args:
+            subwindow (tkinter root window): A tkinter window.
+            cv_size (tuple): Width and height of the canvas, in painting pixels.
+            scale (int): Size of a painting pixel at the start.
+            sheet (bool, optional): If True, asks for the padding of a sprite sheet too.
+        """
+        root = Toplevel(subwindow)
+        root.title('Export Sprite Sheet' if sheet else 'Export Scaled')
+
+        def exitdlg():
+            root.grab_release()
+            root.destroy()
+
+        abs_pointerx = root.winfo_pointerx() - root.winfo_vrootx()
+        abs_pointery = root.winfo_pointery() - root.winfo_vrooty()
+        root.geometry('+%d+%d' % (abs_pointerx, abs_pointery))
+
+        root.focus()
+        root.resizable(False, False)
+        root.protocol('WM_DELETE_WINDOW', exitdlg)
+        root.transient(subwindow)
+        root.wait_visibility()
+        root.grab_set()
+
+        frame = ttk.Frame(root)
+        frame.grid(column=0, row=0, sticky=(N, S, W, E), padx=5, pady=5)
+
+        def entry_check(newval):
+            return newval=='' or newval.isnumeric()
+        entry_check_wrapper = (root.register(entry_check), '%P')
+
+        self.scale, self.padding = StringVar(value=scale), StringVar(value=1)
+        entries = [('Scale:  ', self.scale)]
+        if sheet:
+            entries.append(('Padding:', self.padding))
+        for row, (text, variable) in enumerate(entries):
+            ttk.Label(frame, text=text).grid(column=0, row=row, sticky=W)
+            ttk.Entry(frame, width=5, textvariable=variable, validate='key',
+                      validatecommand=entry_check_wrapper).grid(column=1, row=row, sticky=(W, E), pady=4)
+
+        # The size of a frame in the file.
+        cvw, cvh = cv_size
+        size = StringVar()
+
+        def update_size(*args):
+            scale = min(max(int(self.scale.get() or 1), 1), MAX_EXPORT_SCALE)
+            size.set(f'{cvw*scale}x{cvh*scale} pixels')
+        self.scale.trace_add('write', update_size)
+        update_size()
+        ttk.Label(frame, textvariable=size, font=('TkDefaultFont', 10), foreground='#5e5e5e',
+                  anchor='center').grid(column=0, row=len(entries), columnspan=2, sticky=(W, E))
+
+        self.accepted = False
+
+        def setstate():
+            self.accepted = True
+            exitdlg()
+
+        row = len(entries) + 1
+        ttk.Button(frame, text='Ok', command=setstate).grid(column=0, row=row, sticky=(N, S), padx=3, pady=3)
+        ttk.Button(frame, text='Cancel', command=exitdlg).grid(column=1, row=row, sticky=(N, S), padx=3, pady=3)
+
+        root.wait_window()
+
+    def getstate(self):
+        """Returns True if the canvas will be exported, and False otherwise."""
+        return self.accepted
+
+    def getvalues(self):
+        """Return the entered values, the scale is between 1-MAX_EXPORT_SCALE.
+
+        Returns:
+            tuple: Scale and padding.
+        """
+        scale = min(max(int(self.scale.get() or 1), 1), MAX_EXPORT_SCALE)
+        return scale, int(self.padding.get() or 0)
+
+
 class PiePixelEditor():
     """
     Main editor class. Pixel editor.
@@ -139,7 +532,198 @@ class PiePixelEditor():
         # Creating the menubar.
         menubar = Menu(root)
         root['menu'] = menubar
-        menubar.add_command(label='New', command=self.newcanvas)
+
+        # The file menu. Files are saved as PNG, palette indexed if the mode is
+        # 'palette', RGBA if it's 'rgba', and palette if possible when it's 'auto'.
+        self.filename = None
+        self.save_mode = StringVar(value='auto')
+
+        filemenu = Menu(menubar)
+        menubar.add_cascade(label='File', menu=filemenu)
+        filemenu.add_command(label='New', command=self.newcanvas, accelerator='Ctrl+N')
+        filemenu.add_command(label='Open...', command=self.openfile, accelerator='Ctrl+O')
+        filemenu.add_command(label='Import...', command=self.importfile)
+        filemenu.add_command(label='Save', command=self.savefile, accelerator='Ctrl+S')
+        filemenu.add_command(label='Save As...', command=self.savefile_as)
+        filemenu.add_command(label='Export Scaled...', command=self.exportfile)
+        filemenu.add_command(label='Export Sprite Sheet...', command=lambda: self.exportfile(sheet=True))
+
+        modemenu = Menu(filemenu)
+        filemenu.add_cascade(label='PNG Mode', menu=modemenu)
+        modemenu.add_radiobutton(label='Auto', variable=self.save_mode, value='auto')
+        modemenu.add_radiobutton(label='Palette', variable=self.save_mode, value='palette')
+        modemenu.add_radiobutton(label='RGBA', variable=self.save_mode, value='rgba')
+
+        # The work is saved to the recovery file in the background, this often.
+        self.autosave_interval = IntVar(value=30)
+        autosavemenu = Menu(filemenu)
+        filemenu.add_cascade(label='Autosave', menu=autosavemenu)
+        for label, seconds in (('Off', 0), ('Every 10 Seconds', 10), ('Every 30 Seconds', 30),
+                               ('Every Minute', 60), ('Every 5 Minutes', 300)):
+            autosavemenu.add_radiobutton(label=label, variable=self.autosave_interval, value=seconds,
+                                         command=lambda: self.autosave.set_interval(self.autosave_interval.get()))
+
+        root.bind('<Control-n>', lambda event: self.newcanvas())
+        root.bind('<Control-o>', lambda event: self.openfile())
+        root.bind('<Control-s>', lambda event: self.savefile())
+
+        # The edit menu, with undo and redo.
+        editmenu = Menu(menubar)
+        menubar.add_cascade(label='Edit', menu=editmenu)
+        editmenu.add_command(label='Undo', command=lambda: self.canvas.undo(), accelerator='Ctrl+Z')
+        editmenu.add_command(label='Redo', command=lambda: self.canvas.redo(), accelerator='Ctrl+Y')
+        root.bind('<Control-z>', lambda event: self.canvas.undo())
+        root.bind('<Control-y>', lambda event: self.canvas.redo())
+        root.bind('<Control-Z>', lambda event: self.canvas.redo())
+
+        # Selection and clipboard. The selection is made with the select tool.
+        editmenu.add_separator()
+        editmenu.add_command(label='Select', command=lambda: self.settool('select'))
+        editmenu.add_command(label='Select All', command=lambda: self.canvas.select_all(), accelerator='Ctrl+A')
+        editmenu.add_command(label='Deselect', command=lambda: self.canvas.deselect(), accelerator='Ctrl+D')
+        editmenu.add_separator()
+        editmenu.add_command(label='Cut', command=lambda: self.canvas.cut(), accelerator='Ctrl+X')
+        editmenu.add_command(label='Copy', command=lambda: self.canvas.copy(), accelerator='Ctrl+C')
+        editmenu.add_command(label='Paste', command=lambda: self.canvas.paste(), accelerator='Ctrl+V')
+        editmenu.add_command(label='Delete', command=lambda: self.canvas.delete_selected(), accelerator='Del')
+        editmenu.add_separator()
+        editmenu.add_command(label='Flip Horizontal', command=lambda: self.canvas.flip_selected(True))
+        editmenu.add_command(label='Flip Vertical', command=lambda: self.canvas.flip_selected(False))
+        editmenu.add_command(label='Rotate Clockwise', command=lambda: self.canvas.rotate_selected(True))
+        editmenu.add_command(label='Rotate Counterclockwise', command=lambda: self.canvas.rotate_selected(False))
+        editmenu.add_separator()
+        editmenu.add_command(label='Replace Color...', command=self.replacecolor, accelerator='Ctrl+R')
+        root.bind('<Control-a>', lambda event: self.canvas.select_all())
+        root.bind('<Control-d>', lambda event: self.canvas.deselect())
+        root.bind('<Control-x>', lambda event: self.canvas.cut())
+        root.bind('<Control-c>', lambda event: self.canvas.copy())
+        root.bind('<Control-v>', lambda event: self.canvas.paste())
+        root.bind('<Delete>', lambda event: self.canvas.delete_selected())
+        root.bind('<Control-r>', lambda event: self.replacecolor())
+
+        # The shapes menu. The shape tools have no buttons, they are chosen from here.
+        shapemenu = Menu(menubar)
+        menubar.add_cascade(label='Shapes', menu=shapemenu)
+        for label, name in (('Line', 'line'), ('Rectangle', 'rect'), ('Filled Rectangle', 'filled rect'),
+                            ('Ellipse', 'ellipse'), ('Filled Ellipse', 'filled ellipse')):
+            shapemenu.add_command(label=label, command=lambda name=name: self.settool(name))
+
+        # The brush menu, for the painter, the eraser and the line, and the symmetry.
+        self.brush_size = IntVar(value=1)
+        self.brush_shape = StringVar(value='square')
+
+        brushmenu = Menu(menubar)
+        menubar.add_cascade(label='Brush', menu=brushmenu)
+        for size in (1, 2, 3, 4, 6, 8, 12, 16, 24, 32):
+            brushmenu.add_radiobutton(label=f'{size} px', variable=self.brush_size, value=size,
+                                      command=lambda: self.canvas.set_brush(self.brush_size.get()))
+        brushmenu.add_separator()
+        brushmenu.add_radiobutton(label='Square', variable=self.brush_shape, value='square',
+                                  command=lambda: self.canvas.set_brush(shape='square'))
+        brushmenu.add_radiobutton(label='Circle', variable=self.brush_shape, value='circle',
+                                  command=lambda: self.canvas.set_brush(shape='circle'))
+
+        # Symmetry, for the painter, the eraser and the fill tool.
+        self.symmetry = StringVar(value='off')
+        symmetrymenu = Menu(brushmenu)
+        brushmenu.add_cascade(label='Symmetry', menu=symmetrymenu)
+        for label, value, mode, folds in (('Off', 'off', None, 4), ('Horizontal', 'horizontal', 'horizontal', 2),
+                                          ('Vertical', 'vertical', 'vertical', 2), ('Both', 'both', 'both', 4),
+                                          ('Radial 3', 'radial3', 'radial', 3), ('Radial 4', 'radial4', 'radial', 4),
+                                          ('Radial 6', 'radial6', 'radial', 6), ('Radial 8', 'radial8', 'radial', 8)):
+            symmetrymenu.add_radiobutton(label=label, variable=self.symmetry, value=value,
+                                         command=lambda mode=mode, folds=folds: self.canvas.set_symmetry(mode, folds))
+
+        # The image menu. Resizing and cropping keep the painting pixels.
+        imagemenu = Menu(menubar)
+        menubar.add_cascade(label='Image', menu=imagemenu)
+        imagemenu.add_command(label='Resize Canvas...', command=self.resizecanvas)
+        imagemenu.add_command(label='Crop...', command=lambda: self.resizecanvas(crop=True))
+
+        # The layers menu. The layer list is filled when the menu is opened. The color picker
+        # and the fill tool can look at the current layer or at every visible layer.
+        self.layer_index = IntVar(value=0)
+        self.layer_visible = BooleanVar(value=True)
+        self.layer_opacity = IntVar(value=255)
+        self.picker_sample = StringVar(value='layer')
+        self.fill_sample = StringVar(value='layer')
+
+        layermenu = Menu(menubar, postcommand=self.update_layermenu)
+        menubar.add_cascade(label='Layers', menu=layermenu)
+        layermenu.add_command(label='New Layer', command=lambda: self.canvas.add_layer(), accelerator='Ctrl+L')
+        layermenu.add_command(label='Delete Layer', command=lambda: self.canvas.remove_layer())
+        layermenu.add_command(label='Move Up', command=lambda: self.canvas.move_layer(1))
+        layermenu.add_command(label='Move Down', command=lambda: self.canvas.move_layer(-1))
+        layermenu.add_checkbutton(label='Visible', variable=self.layer_visible,
+                                  command=lambda: self.canvas.set_layer_visible(self.layer_visible.get()))
+
+        opacitymenu = Menu(layermenu)
+        layermenu.add_cascade(label='Opacity', menu=opacitymenu)
+        for percent in (100, 75, 50, 25):
+            opacitymenu.add_radiobutton(label=f'{percent}%', variable=self.layer_opacity, value=percent*255 // 100,
+                                        command=lambda: self.canvas.set_layer_opacity(self.layer_opacity.get()))
+
+        self.layerlist = Menu(layermenu)
+        layermenu.add_cascade(label='Current Layer', menu=self.layerlist)
+
+        layermenu.add_separator()
+        for label, variable, option in (('Pick From', self.picker_sample, 'picker_sample'),
+                                        ('Fill From', self.fill_sample, 'fill_sample')):
+            samplemenu = Menu(layermenu)
+            layermenu.add_cascade(label=label, menu=samplemenu)
+            for value, text in (('layer', 'Current Layer'), ('composite', 'All Layers')):
+                samplemenu.add_radiobutton(label=text, variable=variable, value=value,
+                                           command=lambda variable=variable, option=option:
+                                           setattr(self.canvas, option, variable.get()))
+        root.bind('<Control-l>', lambda event: self.canvas.add_layer())
+
+        # The frames menu, for animations. The first entry shows the current frame.
+        self.onion_skin = BooleanVar(value=False)
+        self.playing = BooleanVar(value=False)
+        self.fps = IntVar(value=12)
+
+        self.framemenu = Menu(menubar, postcommand=self.update_framemenu)
+        menubar.add_cascade(label='Frames', menu=self.framemenu)
+        self.framemenu.add_command(label='Frame 1 of 1', state='disabled')
+        self.framemenu.add_separator()
+        self.framemenu.add_command(label='New Frame', command=lambda: self.canvas.add_frame(), accelerator='Ctrl+M')
+        self.framemenu.add_command(label='New Empty Frame', command=lambda: self.canvas.add_frame(copy=False))
+        self.framemenu.add_command(label='Delete Frame', command=lambda: self.canvas.remove_frame())
+        self.framemenu.add_command(label='Previous Frame', command=lambda: self.canvas.step_frame(-1), accelerator=',')
+        self.framemenu.add_command(label='Next Frame', command=lambda: self.canvas.step_frame(1), accelerator='.')
+        self.framemenu.add_separator()
+        self.framemenu.add_checkbutton(label='Onion Skin', variable=self.onion_skin,
+                                       command=lambda: self.canvas.set_onion_skin(self.onion_skin.get()))
+        self.framemenu.add_checkbutton(label='Play', variable=self.playing, command=self.toggle_play,
+                                       accelerator='Enter')
+
+        fpsmenu = Menu(self.framemenu)
+        self.framemenu.add_cascade(label='Speed', menu=fpsmenu)
+        for fps in (4, 6, 8, 12, 15, 24, 30):
+            fpsmenu.add_radiobutton(label=f'{fps} fps', variable=self.fps, value=fps,
+                                    command=lambda: setattr(self.canvas.timeline, 'fps', self.fps.get()))
+        root.bind('<Control-m>', lambda event: self.canvas.add_frame())
+        root.bind('<comma>', lambda event: self.canvas.step_frame(-1))
+        root.bind('<period>', lambda event: self.canvas.step_frame(1))
+        root.bind('<Return>', lambda event: (self.playing.set(not self.playing.get()), self.toggle_play()))
+
+        # The view menu. The grid shows the edges of the painting pixels. The performance
+        # counters are shown in the bottom frame, and can be saved to a file, for finding
+        # out why a document is slow.
+        self.show_stats = BooleanVar(value=False)
+        self.show_grid = BooleanVar(value=False)
+
+        viewmenu = Menu(menubar)
+        menubar.add_cascade(label='View', menu=viewmenu)
+        viewmenu.add_checkbutton(label='Grid', variable=self.show_grid, accelerator='Ctrl+G',
+                                 command=lambda: self.canvas.set_grid(self.show_grid.get()))
+        viewmenu.add_checkbutton(label='Performance', variable=self.show_stats, command=self.toggle_stats)
+        viewmenu.add_command(label='Export Performance...', command=self.export_stats)
+
+        def toggle_grid(event=0):
+            self.show_grid.set(not self.show_grid.get())
+            self.canvas.set_grid(self.show_grid.get())
+        root.bind('<Control-g>', toggle_grid)
 
         # Size values for the canvas. It will be 50x50 by painting pixels. And 
         # Each painting pixel be 20 real pixels wide and high.
@@ -151,7 +735,11 @@ class PiePixelEditor():
         v_scroll = ttk.Scrollbar(root, orient=VERTICAL)        
         self.canvas = PPixelPaintingCanvas(root, yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set, background='white')
         self.canvas.refresh_canvas_data(wpp, hpp, pp_size)
-        self.canvas['scrollregion'] = (0, 0, wpp*pp_size, hpp*pp_size)
+
+        # Autosave is started by recover, after the old recovery file is handled.
+        # Closing the window writes a last snapshot.
+        self.autosave = Autosave(self.canvas, interval=self.autosave_interval.get())
+        root.protocol('WM_DELETE_WINDOW', self.quit)
         self.canvas['width'] = 1000
         self.canvas['height'] = 1000
         h_scroll['command'] = self.canvas.xview
@@ -174,10 +762,7 @@ class PiePixelEditor():
         tool_label.grid(column=0, row=0, sticky=(W, E), padx=2)
 
         def tool_changed(event=0):
-            mode_dict = {0: 'paint tool', 1: 'eraser', 2: 'color picker', 3: 'fill tool'}
-
-            tool_code = self.canvas.get_mode()
-            toolname.set(mode_dict[tool_code])
+            toolname.set(self.canvas.get_mode().label)
 
         self.canvas.bind('<<ToolChanged>>', tool_changed)
 
@@ -207,6 +792,29 @@ class PiePixelEditor():
         zoom_label = ttk.Label(bottomframe, textvariable=zoom_percent, width=6, background='#dbdbdb', anchor='center')
         zoom_label.grid(column=4, row=0, sticky=W, padx=2)
 
+        def zoom_changed(event=0):
+            zoom_percent.set(self.canvas.get_zoom_percent())
+
+        self.canvas.bind('<<ZoomChanged>>', zoom_changed)
+
+        # Performance counters, hidden unless turned on from the view menu.
+        # They are refreshed a few times a second, not after every event.
+        self.stats_text = StringVar()
+        self.stats_after = None
+        self.stats_separator = ttk.Separator(bottomframe, orient=VERTICAL)
+        self.stats_label = ttk.Label(bottomframe, textvariable=self.stats_text, background='#dbdbdb', anchor='w')
+
+        # Zooming with the mouse wheel. Windows and macOS use MouseWheel, X11 uses buttons 4 and 5.
+        def wheel_zoom(event):
+            if event.num == 5 or event.delta < 0:
+                self.canvas.zoom_out(event)
+            else:
+                self.canvas.zoom_in(event)
+
+        self.canvas.bind('<MouseWheel>', wheel_zoom)
+        self.canvas.bind('<Button-4>', wheel_zoom)
+        self.canvas.bind('<Button-5>', wheel_zoom)
+
         # This part is for interface, the part that is above the canvas, where you select tools.
         # Each tool is actually a frame, where each frame consist of more frames and labels in them.
         # The tools are the painter, eraser, color selector, color picker, filler, zoom out, zoom in.
@@ -317,6 +925,95 @@ class PiePixelEditor():
         
         self.root.geometry('800x600+%d+%d' % (x, y))
     
+    def update_layermenu(self):
+        """
+        Refreshing the layers menu for the current layer, before it's shown.
+        """
+        stack = self.canvas.stack
+        layer = stack.current_layer()
+        self.layer_index.set(stack.current)
+        self.layer_visible.set(layer.visible)
+        self.layer_opacity.set(layer.opacity)
+
+        # The top layer is the first one in the list.
+        self.layerlist.delete(0, END)
+        for index in range(len(stack.layers) - 1, -1, -1):
+            self.layerlist.add_radiobutton(label=stack.layers[index].name, variable=self.layer_index, value=index,
+                                           command=lambda index=index: self.canvas.set_layer(index))
+
+    def update_framemenu(self):
+        """
+        Refreshing the frames menu for the current frame, before it's shown.
+        """
+        timeline = self.canvas.timeline
+        self.framemenu.entryconfigure(0, label=f'Frame {timeline.current + 1} of {len(timeline.frames)}')
+        self.fps.set(timeline.fps)
+        self.playing.set(self.canvas.playing is not None)
+
+    def toggle_play(self):
+        """
+        Playing or stopping the animation, like the play checkbutton says.
+        """
+        if self.playing.get():
+            self.canvas.play(self.fps.get())
+        else:
+            self.canvas.stop()
+
+    def toggle_stats(self):
+        """
+        Showing or hiding the performance counters in the bottom frame.
+        """
+        if self.show_stats.get():
+            self.stats_separator.grid(column=5, row=0, sticky=(N, S, W))
+            self.stats_label.grid(column=6, row=0, sticky=(W, E), padx=2)
+            self.update_stats()
+        else:
+            if self.stats_after is not None:
+                self.root.after_cancel(self.stats_after)
+                self.stats_after = None
+            self.stats_separator.grid_remove()
+            self.stats_label.grid_remove()
+
+    def update_stats(self):
+        """
+        Refreshing the performance counters, and scheduling the next refresh.
+        """
+        summary = self.canvas.stats.summary()
+        counters = self.canvas.get_counters()
+        self.stats_text.set(f'last {summary["last_ms"]:.1f} ms  '
+                            f'p50 {summary["p50_ms"]:.1f} ms  p99 {summary["p99_ms"]:.1f} ms  '
+                            f'pending {counters["pending_regions"]}  items {counters["items"]}  '
+                            f'doc {counters["doc_bytes"] / 1024:.0f} KB')
+        self.stats_after = self.root.after(250, self.update_stats)
+
+    def export_stats(self):
+        """
+        Raising the save dialog, and saving the performance counters as a JSON file.
+        """
+        filename = filedialog.asksaveasfilename(parent=self.root, title='Export Performance', defaultextension='.json',
+                                                filetypes=[('JSON files', '*.json')])
+        if not filename:
+            return
+
+        try:
+            self.canvas.export_stats(filename)
+        except OSError as error:
+            messagebox.showerror('Export Performance', f'Could not save the file:\n{error}', parent=self.root)
+
+    def settool(self, name):
+        """Activate a tool that has no button, like the shape tools.
+
+        Args:
+            name (str): Name of the tool in PPixelTools.TOOLS.
+        """
+        ttk.Style().configure('PaintFRM.TFrame', relief='raised')
+        ttk.Style().configure('EraserFRM.TFrame', relief='raised')
+        ttk.Style().configure('CSelect.TFrame', relief='raised')
+        ttk.Style().configure('cpFRM.TFrame', relief='raised')
+        ttk.Style().configure('fillFRM.TFrame', relief='raised')
+
+        self.canvas.change_mode(name)
+
     def fill_area(self, event):
         """Set to color fill mode.
         
@@ -421,26 +1118,225 @@ class PiePixelEditor():
         # Editing the canvas.
         if state:
             
-            # Being sure that width and height are integers between 1-256.
+            # Being sure that width and height are integers between 1-MAX_CANVAS_SIZE.
             wpp, hpp = new.getsize()
 
             if wpp:
                 wpp = int(wpp)
-                if wpp > 256:
-                    wpp = 256
+                if wpp > MAX_CANVAS_SIZE:
+                    wpp = MAX_CANVAS_SIZE
 
             if hpp:
                 hpp = int(hpp)
-                if hpp > 256:
-                    hpp = 256
+                if hpp > MAX_CANVAS_SIZE:
+                    hpp = MAX_CANVAS_SIZE
 
             # The width and height are inputed as painting pixels.
             # So converting them to screen pixels, first.
-            size_pp = self.canvas.get_pp_size()
+            # A new canvas starts at 100% zoom.
+            size_pp = self.canvas.base_pp_size
             w, h = wpp*size_pp, hpp*size_pp
 
             self.canvas.refresh_canvas_data(wpp, hpp, size_pp)
-            self.canvas['scrollregion'] = (0, 0, w, h)
-            self.canvas['width'] = w
-            self.canvas['height'] = h
+            self.canvas.event_generate('<<ZoomChanged>>')
+            # The canvas widget is not bigger than the screen, only the visible part is drawn.
+            self.canvas['width'] = min(w, self.root.winfo_screenwidth())
+            self.canvas['height'] = min(h, self.root.winfo_screenheight())
+
+            self.filename = None
+            self.root.title('PPP')
+
+    def resizecanvas(self, crop=False):
+        """
+        Raising the resize or crop dialog, and changing the size of the canvas,
+        keeping the painting pixels.
+        """
+        dialog = ResizeDlg(self.root, (self.canvas.w, self.canvas.h), crop)
+        if not dialog.getstate():
+            return
+
+        left, top, wpp, hpp, anchor = dialog.getvalues()
+        wpp, hpp = min(max(wpp, 1), MAX_CANVAS_SIZE), min(max(hpp, 1), MAX_CANVAS_SIZE)
+
+        if crop:
+            self.canvas.resize_document(wpp, hpp, ox=-left, oy=-top)
+        else:
+            self.canvas.resize_document(wpp, hpp, anchor)
+
+        # The canvas widget is not bigger than the screen, only the visible part is drawn.
+        size_pp = self.canvas.pp_pixel_size / self.canvas.subsample
+        self.canvas['width'] = min(int(wpp*size_pp), self.root.winfo_screenwidth())
+        self.canvas['height'] = min(int(hpp*size_pp), self.root.winfo_screenheight())
+
+    def replacecolor(self):
+        """
+        Raising the replace color dialog, and replacing the color on the current layer.
+        The painting color is replaced at the start.
+        """
+        canvas = self.canvas
+        canvas.end_stroke()
+        dialog = ReplaceDlg(self.root, canvas.color_hex, canvas.color_hex, canvas.selection is not None,
+                            lambda old, new, selection_only:
+                            canvas.preview_replace(hex_to_rgba(old), hex_to_rgba(new), selection_only))
+        canvas.clear_replace_preview()
+        if not dialog.getstate():
+            return
+
+        old, new, selection_only = dialog.getvalues()
+        canvas.replace_color(hex_to_rgba(old), hex_to_rgba(new), selection_only)
+
+    def recover(self, path=RECOVERY_PATH):
+        """
+        Offering to restore the work from the recovery file, if there is one, like after a
+        crash. Then starting the autosave, which writes to the same file.
+        """
+        if os.path.exists(path):
+            if messagebox.askyesno('Recover', 'The editor was closed without saving.\n'
+                                   'Do you want to restore the unsaved work?', parent=self.root):
+                try:
+                    timeline = read_recovery(path)
+                except (OSError, ValueError) as error:
+                    messagebox.showerror('Recover', f'Could not restore the work:\n{error}', parent=self.root)
+                else:
+                    self.canvas.set_timeline(timeline, self.canvas.base_pp_size)
+                    self.canvas.event_generate('<<ZoomChanged>>')
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self.autosave.start()
+
+    def quit(self):
+        """
+        Writing the last snapshot to the recovery file, and closing the editor.
+        """
+        self.canvas.end_stroke()
+        self.autosave.stop()
+        self.root.destroy()
+
+    def openfile(self):
+        """
+        Raising the open dialog, and loading the chosen PNG file to the canvas.
+        """
+        filename = filedialog.askopenfilename(parent=self.root, title='Open', filetypes=[('PNG images', '*.png')])
+        if not filename:
+            return
+
+        try:
+            # The size is checked from the header, before the whole image is read.
+            with open(filename, 'rb') as file:
+                w, h = read_png_header(file)[:2]
+            if w > MAX_CANVAS_SIZE or h > MAX_CANVAS_SIZE:
+                messagebox.showerror('Open', f'Width and height should be between 1-{MAX_CANVAS_SIZE}', parent=self.root)
+                return
+            doc = read_png(filename)
+        except (OSError, ValueError) as error:
+            messagebox.showerror('Open', f'Could not open the file:\n{error}', parent=self.root)
+            return
+
+        self.canvas.set_document(doc, self.canvas.base_pp_size)
+        self.canvas.event_generate('<<ZoomChanged>>')
+        self.filename = filename
+        self.root.title(f'PPP - {filename}')
+
+    def importfile(self):
+        """
+        Raising the open dialog and the import dialog, and loading the chosen PNG file to
+        the canvas, shrunk to the entered size with the entered amount of colors. The
+        work runs in other processes, the editor checks it until it's finished.
+        """
+        filename = filedialog.askopenfilename(parent=self.root, title='Import', filetypes=[('PNG images', '*.png')])
+        if not filename:
+            return
+
+        dialog = ImportDlg(self.root, (self.canvas.w, self.canvas.h))
+        if not dialog.getstate():
+            return
+        wpp, hpp, colors, method = dialog.getvalues()
+        wpp, hpp = min(max(wpp, 1), MAX_CANVAS_SIZE), min(max(hpp, 1), MAX_CANVAS_SIZE)
+
+        job = ImportJob(filename, wpp, hpp, min(max(colors, 1), 256), method)
+        job.start()
+        progress = ProgressDlg(self.root, 'Import', job.cancel)
+
+        def check():
+            if not job.poll():
+                progress.set(job.progress)
+                self.root.after(50, check)
+                return
+
+            progress.close()
+            if job.error is not None:
+                messagebox.showerror('Import', f'Could not import the file:\n{job.error}', parent=self.root)
+            elif job.document is not None:
+                self.canvas.set_document(job.document, self.canvas.base_pp_size)
+                self.canvas.event_generate('<<ZoomChanged>>')
+                self.filename = None
+                self.root.title('PPP')
+        check()
+
+    def savefile(self):
+        """
+        Saving the canvas to its file, or raising the save dialog if it has none.
+        """
+        if self.filename is None:
+            self.savefile_as()
+            return
+
+        try:
+            write_png(self.filename, self.canvas.stack.flattened(), self.save_mode.get())
+        except (OSError, ValueError) as error:
+            messagebox.showerror('Save', f'Could not save the file:\n{error}', parent=self.root)
+            return
+
+        # The work is saved, it doesn't have to be recovered. A PNG file has only the
+        # composite of a frame, so frames and layers are still recovered.
+        if len(self.canvas.timeline.frames) == 1 and len(self.canvas.stack.layers) == 1:
+            self.autosave.clear()
+
+    def savefile_as(self):
+        """
+        Raising the save dialog, and saving the canvas as a PNG file.
+        """
+        filename = filedialog.asksaveasfilename(parent=self.root, title='Save As', defaultextension='.png',
+                                                filetypes=[('PNG images', '*.png')])
+        if not filename:
+            return
+
+        self.filename = filename
+        self.root.title(f'PPP - {filename}')
+        self.savefile()
+
+    def exportfile(self, sheet=False):
+        """
+        Raising the export dialog and the save dialog, and saving the canvas as a PNG
+        file with bigger painting pixels. A sprite sheet has every frame, and a JSON
+        atlas of their places is saved next to it.
+        """
+        canvas = self.canvas
+        canvas.end_stroke()
+
+        # The scale starts as the painting pixel size on the screen.
+        scale = min(max(round(canvas.realw / canvas.w), 1), MAX_EXPORT_SCALE) if canvas.w else 1
+        dialog = ExportDlg(self.root, (canvas.w, canvas.h), scale, sheet)
+        if not dialog.getstate():
+            return
+        scale, padding = dialog.getvalues()
+
+        title = 'Export Sprite Sheet' if sheet else 'Export Scaled'
+        filename = filedialog.asksaveasfilename(parent=self.root, title=title, defaultextension='.png',
+                                                filetypes=[('PNG images', '*.png')])
+        if not filename:
+            return
 
+        try:
+            if sheet:
+                frames = canvas.timeline.frames
+                write_sprite_sheet(filename, [frame.flattened() for frame in frames],
+                                   [f'frame {i + 1}' for i in range(len(frames))], scale, padding,
+                                   self.save_mode.get(), meta={'fps': canvas.timeline.fps})
+            else:
+                write_scaled_png(filename, canvas.stack.flattened(), scale, self.save_mode.get())
+        except (OSError, ValueError) as error:
+            messagebox.showerror(title, f'Could not export the file:\n{error}', parent=self.root)
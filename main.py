@@ -1,12 +1,22 @@
 
-from tkinter import *
-from tkinter import ttk
-from PiePixelEditor import PiePixelEditor
+import sys
 # Importing the necessary modules
 
 if __name__ == '__main__':
-    
+
+    # 'main.py batch ...' runs operations on files without a display.
+    # tkinter is not imported in that case.
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from PPixelBatch import main
+        sys.exit(main(sys.argv[2:]))
+
+    from tkinter import *
+    from tkinter import ttk
+    from PiePixelEditor import PiePixelEditor
+
     root = Tk()
-    PiePixelEditor(root)
+    editor = PiePixelEditor(root)
+    # Offering to restore the work that wasn't saved, and starting the autosave.
+    editor.recover()
     root.mainloop()
     # Main loop.